@@ -4,6 +4,8 @@ import os
 
 import streamlit as st
 
+from scripts.account_sync import flush_account
+from scripts.cookie_manager import begin_cookie_run
 from scripts.log_util import app_logger
 from scripts.st_mainpanel import render_mainpanel
 from scripts.st_sidepanel import render_sidepanel
@@ -19,6 +21,12 @@ os.makedirs(st.session_state["DATA_DIR"], exist_ok=True)
 # Configure page
 st.set_page_config(page_title="M1 Pie DCA Allocator", layout="wide")
 
+# Cookies go through one CookieManager per run
+begin_cookie_run()
+
 # Render sidebar and main content
 render_sidepanel()
 render_mainpanel()
+
+# Persist account changes made during this run, at most once
+flush_account()
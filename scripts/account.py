@@ -3,9 +3,9 @@ account.py: Portfolio Management for User Accounts
 
 This module manages user accounts comprised of multiple named investment portfolios.
 It provides essential CRUD operations to facilitate the creation, retrieval, updating,
-and deletion of portfolios within an account. The module is designed to support both
-cookie-based and JSON file storage solutions, ensuring flexibility in how account
-data is persisted. Logging is integrated to track and debug portfolio operations
+and deletion of portfolios within an account. Accounts are plain dicts, so any
+storage backend in `account_store` (SQLite, browser cookie or in-memory) can
+persist them. Logging is integrated to track and debug portfolio operations
 efficiently.
 
 Functions:
@@ -14,11 +14,21 @@ Functions:
 - add_or_replace_portfolio: Adds a new portfolio or updates an existing one.
 - get_portfolio: Retrieves details of a specified portfolio.
 - delete_portfolio: Removes a portfolio from the account.
+- portfolio_index: Display name, total and slice count of every portfolio.
+
+Stores may load `portfolios` as a `LazyPortfolios` mapping, which keeps each
+portfolio encoded, together with its summary, until it is first accessed.
 
 Usage of this module assumes integration with a logging utility and a storage layer
 for account persistence.
 """
 
+import copy
+import hashlib
+import json
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional
+
 from scripts.log_util import app_logger
 
 logger = app_logger(__name__)
@@ -29,7 +39,7 @@ ACCOUNT_TEMPLATE = {"type": "account", "portfolios": {}}
 
 def create_empty_account() -> dict:
     """Return a new empty account structure."""
-    return ACCOUNT_TEMPLATE.copy()
+    return copy.deepcopy(ACCOUNT_TEMPLATE)
 
 
 def list_portfolios(account: dict) -> list[str]:
@@ -58,3 +68,175 @@ def delete_portfolio(account: dict, name: str) -> dict:
     del portfolios[name]
     logger.info(f"Portfolio '{name}' deleted.")
     return account
+
+
+def portfolio_summary(name: str, portfolio: dict) -> dict:
+    """
+    Lightweight description of a portfolio, kept next to its encoded body.
+
+    :param name: Portfolio key in the account.
+    :param portfolio: Portfolio dictionary.
+    :return: Dict with `name` (display name), `value` (total) and `slices`
+        (number of non-root nodes).
+    """
+    slices = 0
+    stack = [portfolio]
+    while stack:
+        children = stack.pop().get("children")
+        if isinstance(children, dict):
+            slices += len(children)
+            stack.extend(c for c in children.values() if isinstance(c, dict))
+    return {
+        "name": portfolio.get("name", name),
+        "value": portfolio.get("value"),
+        "slices": slices,
+    }
+
+
+def portfolio_index(account: dict) -> Dict[str, dict]:
+    """
+    Summaries of all portfolios in an account, without decoding lazily
+    loaded ones.
+
+    :param account: Account dictionary.
+    :return: Portfolio name to `portfolio_summary`, in account order.
+    """
+    portfolios = account.get("portfolios", {})
+    if isinstance(portfolios, LazyPortfolios):
+        index = {}
+        # A copy of the names: summarizing may drop an unreadable portfolio.
+        for name in list(portfolios):
+            try:
+                index[name] = portfolios.summary(name)
+            except KeyError:
+                continue
+        return index
+    return {
+        name: portfolio_summary(name, portfolio)
+        for name, portfolio in portfolios.items()
+        if isinstance(portfolio, dict)
+    }
+
+
+class LazyPortfolios(MutableMapping):
+    """
+    An account's portfolios, each decoded on first access.
+
+    Stored portfolios are added with `add_encoded` as an encoded body plus
+    its summary, so listing names or totals never decodes anything. Reading
+    a portfolio decodes it once and keeps the result; one that fails to
+    decode is dropped and reads as missing. `source` names the encoding of
+    the bodies, so the store that produced them can write untouched
+    portfolios back without re-encoding them.
+    """
+
+    def __init__(self, source: str, decode: Callable[[str, Any], Optional[dict]]):
+        """
+        :param source: Name of the store encoding the bodies.
+        :param decode: Turns (name, body) into a portfolio dict, or None if
+            the body is unreadable.
+        """
+        self.source = source
+        self._decode = decode
+        # Portfolio name to decoded dict, or None while still encoded.
+        self._portfolios: Dict[str, Optional[dict]] = {}
+        self._encoded: Dict[str, tuple] = {}
+        # Body and content digests of decoded portfolios, so one that is
+        # unchanged since decoding still hashes as its body.
+        self._origins: Dict[str, tuple] = {}
+
+    def add_encoded(self, name: str, body: Any, summary: Optional[dict]) -> None:
+        """
+        Add a stored portfolio without decoding it.
+
+        :param name: Portfolio name.
+        :param body: Encoded portfolio, as understood by `decode`.
+        :param summary: Its `portfolio_summary`, or None if unknown.
+        """
+        self._portfolios[name] = None
+        self._encoded[name] = (body, summary)
+        self._origins.pop(name, None)
+
+    def __getitem__(self, name: str) -> dict:
+        portfolio = self._portfolios[name]
+        if portfolio is None:
+            body, _ = self._encoded.pop(name)
+            portfolio = self._decode(name, body)
+            if portfolio is None:
+                del self._portfolios[name]
+                raise KeyError(name)
+            self._portfolios[name] = portfolio
+            self._origins[name] = (_body_digest(body), _content_digest(portfolio))
+        return portfolio
+
+    def __setitem__(self, name: str, portfolio: dict) -> None:
+        self._encoded.pop(name, None)
+        self._portfolios[name] = portfolio
+
+    def __delitem__(self, name: str) -> None:
+        del self._portfolios[name]
+        self._encoded.pop(name, None)
+        self._origins.pop(name, None)
+
+    def __contains__(self, name: object) -> bool:
+        # Membership must not decode, unlike Mapping's default.
+        return name in self._portfolios
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._portfolios)
+
+    def __len__(self) -> int:
+        return len(self._portfolios)
+
+    def __repr__(self) -> str:
+        return f"LazyPortfolios({self.source!r}, {list(self._portfolios)!r})"
+
+    def is_decoded(self, name: str) -> bool:
+        """Whether a portfolio has been decoded (or was set directly)."""
+        return name in self._portfolios and name not in self._encoded
+
+    def encoded(self, name: str, source: str) -> Optional[Any]:
+        """
+        Stored body of a portfolio that has not been decoded yet.
+
+        :param name: Portfolio name.
+        :param source: Encoding the caller wants.
+        :return: The body if it is still encoded in `source`, else None.
+        """
+        if source != self.source or name not in self._encoded:
+            return None
+        return self._encoded[name][0]
+
+    def summary(self, name: str) -> dict:
+        """`portfolio_summary` of a portfolio, decoding it only if unknown."""
+        if name in self._encoded and self._encoded[name][1] is not None:
+            return self._encoded[name][1]
+        return portfolio_summary(name, self[name])
+
+    def hash_view(self) -> Dict[str, Any]:
+        """
+        Stand-in for hashing: encoded portfolios by a digest of their body,
+        so hashing decodes nothing. Decoded portfolios whose content has not
+        changed since decoding use the same digest, so reading a portfolio
+        leaves the hash as it was; changed or new ones are used as they are.
+        """
+        view = {}
+        for name, portfolio in self._portfolios.items():
+            if portfolio is None:
+                portfolio = "encoded:" + _body_digest(self._encoded[name][0])
+            elif name in self._origins:
+                body_digest, content_digest = self._origins[name]
+                if _content_digest(portfolio) == content_digest:
+                    portfolio = "encoded:" + body_digest
+            view[name] = portfolio
+        return view
+
+
+def _body_digest(body: Any) -> str:
+    raw = body.encode() if isinstance(body, str) else bytes(body)
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _content_digest(portfolio: dict) -> str:
+    raw = json.dumps(portfolio, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
@@ -0,0 +1,403 @@
+"""
+account_codec.py: Compact, versioned binary encoding for account data.
+
+An encoded account is a version byte, a flags byte (bit 0: the rest is
+raw-deflated) and three sections:
+
+- names: NUL-joined UTF-8 table of every slice, pie, portfolio and custom
+  type name, each stored once and referenced by index
+- texts: NUL-joined strings that do not fit the integer columns: the
+  account's own fields as JSON (empty for the standard marker), values
+  and weights that are not stored as integers, and JSON for any
+  unrecognised node fields
+- ints: LEB128 varints holding the portfolio count, then per node in
+  pre-order its name index, field flags and only the fields those flags
+  announce (type index, zig-zag value in cents, child count)
+
+Decoding gives the same dict the JSON cookie format did: numbers come back
+as floats. So values are stored as cents whenever that reproduces their
+float, and weights that equal the child's share of its pie, as written by
+`normalize_portfolio`, are recomputed on decode instead of stored.
+
+Varints are packed and unpacked with NumPy, and the payload is deflated
+with a preset dictionary of common tickers and pie names, which helps most
+on the small accounts a cookie holds.
+
+The gain is size: an encoded account is about a third of the deflated JSON.
+It is not a speed gain for small accounts. With a few slices per portfolio,
+decoding takes up to twice as long as loading deflated JSON, because the
+per-node work stays in Python. From about 45 slices per portfolio it is
+roughly 1.2-1.5x faster.
+"""
+
+import json
+import math
+import zlib
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from scripts.account import portfolio_index
+
+CODEC_VERSION = 1
+
+_COMPRESSED = 0x01
+_ACCOUNT_MARKER = {"type": "account"}
+_SEPARATOR = "\0"
+
+# Node field flags; bits 0-1 hold the type code.
+_TYPE_MASK = 0x03
+_TICKER, _PIE, _OTHER_TYPE, _NO_TYPE = 0, 1, 2, 3
+_CHILDREN = 1 << 2
+_VALUE_CENTS = 1 << 3
+_VALUE_TEXT = 1 << 4
+_WEIGHT_DERIVED = 1 << 5
+_WEIGHT_TEXT = 1 << 6
+_NAME_IS_KEY = 1 << 7
+_EXTRAS = 1 << 8
+
+_NUMBER_TYPES = {float, int, Decimal}
+_TYPE_CODES = {"ticker": _TICKER, "pie": _PIE}
+_KNOWN_FIELDS = {"type", "value", "weight", "children", "name"}
+
+# Preset deflate dictionary. Matches closer to the end are cheaper, so the
+# most common names come last. Editing it changes the encoding: bump
+# CODEC_VERSION when you do.
+_ZDICT = (
+    "BRK.B JPM UNH XOM JNJ PG HD COST ABBV MRK CVX KO PEP ADBE CRM NFLX AMD "
+    "INTC QCOM TXN AVGO ORCL CSCO DIS NKE MCD SBUX WMT TGT PYPL SQ SHOP MELI "
+    "PLTR SNOW NET DDOG CRWD ZS PANW UBER ABNB COIN HOOD SOFI ARKK QQQM SCHD "
+    "SCHB SCHX SCHA SCHF JEPI VIG VYM VXUS VEA VWO IEFA IEMG IJR IJH AGG BND "
+    "BNDX TLT GLD SLV IWM DIA VOO IVV SPY VTI QQQ V MA TSLA NVDA META GOOGL "
+    "GOOG AMZN MSFT AAPL Stocks Bonds ETFs Crypto Growth Dividend Index Tech "
+    "Income Core International Emerging Markets Real Estate Cash Portfolio"
+).encode()
+
+
+def encode_account(account: Dict[str, Any]) -> bytes:
+    """
+    Encode an account dict into the compact binary format.
+
+    :param account: Account with a `portfolios` mapping of name to root node.
+    :return: Encoded bytes, deflated when that makes them smaller.
+    :raises ValueError: If the account has a shape the codec cannot hold,
+        e.g. a portfolio that is not a dict or a name containing NUL.
+    """
+    portfolios = account.get("portfolios", {})
+    if not isinstance(portfolios, dict):
+        raise ValueError("Account portfolios must be a mapping")
+
+    extras = {k: v for k, v in account.items() if k != "portfolios"}
+    texts = ["" if extras == _ACCOUNT_MARKER else _dump_json(extras)]
+    names: Dict[str, int] = {}
+    ints = [len(portfolios)]
+
+    stack = [(name, node, None) for name, node in reversed(portfolios.items())]
+    while stack:
+        name, node, derived = stack.pop()
+        if not isinstance(name, str) or not isinstance(node, dict):
+            raise ValueError(f"Portfolio node {name!r} is not a named dict")
+        ints.append(names.setdefault(name, len(names)))
+
+        node_type = node.get("type")
+        flags = _TYPE_CODES.get(node_type, _OTHER_TYPE)
+        if "type" not in node:
+            flags = _NO_TYPE
+        elif flags == _OTHER_TYPE and not isinstance(node_type, str):
+            raise ValueError(f"Node {name!r} has a non-string type")
+
+        extras = {}
+        if "name" in node:
+            if node["name"] == name:
+                flags |= _NAME_IS_KEY
+            else:
+                extras["name"] = node["name"]
+
+        cents = None
+        if "value" in node:
+            value = node["value"]
+            cents = derived[0] if derived else _cents(value)
+            if cents is not None:
+                flags |= _VALUE_CENTS
+            elif _is_number(value):
+                flags |= _VALUE_TEXT
+                texts.append(repr(float(value)))
+            else:
+                extras["value"] = value
+
+        if "weight" in node:
+            weight = node["weight"]
+            if (
+                derived
+                and type(weight) in _NUMBER_TYPES
+                and float(weight) == derived[1]
+            ):
+                flags |= _WEIGHT_DERIVED
+            elif _is_number(weight):
+                flags |= _WEIGHT_TEXT
+                texts.append(repr(float(weight)))
+            else:
+                extras["weight"] = weight
+
+        children = node.get("children")
+        if isinstance(children, dict):
+            flags |= _CHILDREN
+        elif "children" in node:
+            extras["children"] = children
+
+        if not node.keys() <= _KNOWN_FIELDS:
+            extras.update((k, v) for k, v in node.items() if k not in _KNOWN_FIELDS)
+        if extras:
+            flags |= _EXTRAS
+            texts.append(_dump_json(extras))
+
+        ints.append(flags)
+        if flags & _TYPE_MASK == _OTHER_TYPE:
+            ints.append(names.setdefault(node_type, len(names)))
+        if flags & _VALUE_CENTS:
+            ints.append(cents * 2 if cents >= 0 else -cents * 2 - 1)
+        if flags & _CHILDREN:
+            ints.append(len(children))
+            weights = _derived_weights(children)
+            stack.extend(
+                (child_name, child, weights.get(child_name))
+                for child_name, child in reversed(children.items())
+            )
+
+    name_block = _join(names)
+    text_block = _join(texts)
+    payload = bytearray()
+    _append_varint(payload, len(name_block))
+    payload += name_block
+    _append_varint(payload, len(text_block))
+    payload += text_block
+    payload += _pack_varints(ints)
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=_ZDICT)
+    deflated = compressor.compress(payload) + compressor.flush()
+    if len(deflated) < len(payload):
+        return bytes([CODEC_VERSION, _COMPRESSED]) + deflated
+    return bytes([CODEC_VERSION, 0]) + bytes(payload)
+
+
+def decode_account(data: bytes) -> Dict[str, Any]:
+    """
+    Decode bytes produced by `encode_account`.
+
+    :param data: Encoded account.
+    :return: Account dict, with numbers as floats.
+    :raises ValueError: On an unknown version or malformed data.
+    """
+    if len(data) < 2 or data[0] != CODEC_VERSION:
+        raise ValueError(f"Unsupported account codec version: {data[:1].hex()}")
+    payload = bytes(data[2:])
+    if data[1] & _COMPRESSED:
+        try:
+            decompressor = zlib.decompressobj(-15, zdict=_ZDICT)
+            payload = decompressor.decompress(payload) + decompressor.flush()
+        except zlib.error as e:
+            raise ValueError(f"Corrupt account payload: {e}") from e
+
+    try:
+        length, pos = _read_varint(payload, 0)
+        names = payload[pos : pos + length].decode().split(_SEPARATOR)
+        length, pos = _read_varint(payload, pos + length)
+        texts = iter(payload[pos : pos + length].decode().split(_SEPARATOR))
+        ints = iter(_unpack_varints(payload[pos + length :]))
+
+        extras = next(texts)
+        account = json.loads(extras) if extras else dict(_ACCOUNT_MARKER)
+        account["portfolios"] = _decode_nodes(ints, names, texts)
+    except (IndexError, StopIteration, UnicodeDecodeError) as e:
+        raise ValueError("Truncated or corrupt account payload") from e
+
+    if next(ints, None) is not None:
+        raise ValueError("Trailing data after account payload")
+    return account
+
+
+def codec_stats(account: Dict[str, Any], data: bytes) -> Dict[str, Any]:
+    """
+    Size report for an encoded account.
+
+    :param account: The account that was encoded.
+    :param data: Its encoded form (bytes or cookie text).
+    :return: Dict with `bytes`, `slices` (non-root nodes over all
+        portfolios) and `bytes_per_slice` (None without slices).
+    """
+    slices = sum(s["slices"] for s in portfolio_index(account).values())
+    return {
+        "bytes": len(data),
+        "slices": slices,
+        "bytes_per_slice": len(data) / slices if slices else None,
+    }
+
+
+def _decode_nodes(ints, names: List[str], texts) -> Dict[str, Any]:
+    """Rebuild the portfolio dicts from the int and text streams."""
+    portfolios = {}
+    pies = []
+    # Each frame: [children dict, nodes left to read, child cents, derived].
+    stack = [[portfolios, next(ints), None, None]]
+    while stack:
+        frame = stack[-1]
+        if not frame[1]:
+            stack.pop()
+            continue
+        frame[1] -= 1
+
+        name = names[next(ints)]
+        flags = next(ints)
+        node = {}
+        type_code = flags & _TYPE_MASK
+        if type_code == _TICKER:
+            node["type"] = "ticker"
+        elif type_code == _PIE:
+            node["type"] = "pie"
+        elif type_code == _OTHER_TYPE:
+            node["type"] = names[next(ints)]
+        if flags & _NAME_IS_KEY:
+            node["name"] = name
+
+        cents = 0
+        if flags & _VALUE_CENTS:
+            raw = next(ints)
+            cents = -(raw + 1) // 2 if raw & 1 else raw // 2
+            node["value"] = cents / 100
+        elif flags & _VALUE_TEXT:
+            node["value"] = float(next(texts))
+        if flags & _WEIGHT_TEXT:
+            node["weight"] = float(next(texts))
+        if flags & _EXTRAS:
+            node.update(json.loads(next(texts)))
+
+        frame[0][name] = node
+        if frame[2] is not None:
+            frame[2][name] = cents
+            if flags & _WEIGHT_DERIVED:
+                frame[3].append(name)
+
+        if flags & _CHILDREN:
+            children = node["children"] = {}
+            child = [children, next(ints), {}, []]
+            pies.append(child)
+            stack.append(child)
+
+    for children, _, cents, derived in pies:
+        if derived:
+            total = sum(cents.values())
+            for name in derived:
+                children[name]["weight"] = cents[name] / total if total > 0 else 0.0
+    return portfolios
+
+
+def _cents(value: Any) -> Optional[int]:
+    """
+    Integer cents whose `cents / 100` equals `float(value)`, or None when
+    the value is not a number or not a whole number of cents.
+    """
+    if not _is_number(value):
+        return None
+    number = float(value)
+    cents = round(number * 100)
+    return cents if cents / 100 == number else None
+
+
+def _is_number(value: Any) -> bool:
+    """True for finite Decimal, float and int values (not bool)."""
+    try:
+        return type(value) in _NUMBER_TYPES and math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+def _derived_weights(children: Dict[str, Any]) -> Dict[str, tuple]:
+    """
+    Map each child to (cents, weight `_normalize_pie_level` would write);
+    empty unless every child has a whole-cent value.
+    """
+    cents = {}
+    for name, child in children.items():
+        value = _cents(child.get("value", 0)) if isinstance(child, dict) else None
+        if value is None:
+            return {}
+        cents[name] = value
+    total = sum(cents.values())
+    return {
+        name: (value, value / total if total > 0 else 0.0)
+        for name, value in cents.items()
+    }
+
+
+def _join(strings) -> bytes:
+    for text in strings:
+        if _SEPARATOR in text:
+            raise ValueError(f"Name contains a NUL character: {text!r}")
+    return _SEPARATOR.join(strings).encode()
+
+
+def _dump_json(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), default=_decimal_to_float)
+
+
+def _decimal_to_float(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def _append_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple:
+    """Return (value, position after it)."""
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _pack_varints(values: List[int]) -> bytes:
+    """LEB128-encode non-negative integers below 2**64 in one NumPy pass."""
+    try:
+        array = np.asarray(values, dtype=np.uint64)
+    except OverflowError as e:
+        raise ValueError("Integer too large for the account codec") from e
+    sizes = np.ones(len(array), dtype=np.int64)
+    rest = array >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+
+    starts = np.cumsum(sizes) - sizes
+    position = np.arange(sizes.sum()) - np.repeat(starts, sizes)
+    groups = np.repeat(array, sizes) >> (7 * position).astype(np.uint64)
+    out = (groups & np.uint64(0x7F)).astype(np.uint8)
+    out[position < np.repeat(sizes - 1, sizes)] |= 0x80
+    return out.tobytes()
+
+
+def _unpack_varints(data: bytes) -> List[int]:
+    """Decode a buffer of concatenated LEB128 varints."""
+    if not data:
+        return []
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    if not len(ends) or ends[-1] != len(raw) - 1:
+        raise ValueError("Truncated varint in account payload")
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    sizes = ends - starts + 1
+    if sizes.max() > 10:
+        raise ValueError("Varint too long in account payload")
+    position = np.arange(len(raw)) - np.repeat(starts, sizes)
+    parts = (raw & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.add.reduceat(parts, starts).tolist()
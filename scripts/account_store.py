@@ -0,0 +1,452 @@
+"""
+account_store.py: Pluggable storage for user accounts.
+
+`AccountStore` is the interface the app persists accounts through:
+
+- `SQLiteAccountStore` keeps accounts server-side under `DATA_DIR`, one row
+  per portfolio (binary `account_codec` encoding), in WAL mode behind a
+  small connection pool shared by all Streamlit sessions. Saves rewrite
+  only the portfolios whose bytes changed, and a single portfolio can be
+  read without decoding the rest. Loaded accounts hold `LazyPortfolios`:
+  only each row's summary is parsed up front.
+- `CookieAccountStore` keeps the whole account in browser cookies
+  (`cookie_account`), the original behaviour.
+- `MemoryAccountStore` keeps accounts in process memory, for tests and
+  throwaway demos.
+
+With a server-side store the browser only holds an opaque account id in
+the `ACCOUNT_ID_COOKIE` cookie. The backend is chosen by `storage.backend`
+in `st.secrets` and defaults to SQLite; accounts still held in the old
+account cookie are migrated into the store on first load. Nothing is
+loaded until the browser has reported its cookies, so an existing account
+id is never replaced by a new one.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+
+import streamlit as st
+
+from scripts.account import LazyPortfolios, create_empty_account, portfolio_index
+from scripts.account_codec import decode_account, encode_account
+from scripts.cookie_account import (
+    clear_account_cookies,
+    load_account_from_cookie,
+    save_account_to_cookie,
+)
+from scripts.cookie_manager import cookies_ready, get_cookie, set_cookie
+from scripts.log_util import app_logger
+
+logger = app_logger(__name__)
+
+STORE_BACKENDS = ("sqlite", "cookie", "memory")
+DEFAULT_BACKEND = "sqlite"
+ACCOUNT_ID_COOKIE = "m1pie_account_id"
+ACCOUNT_ID_KEY = "account_id"
+POOL_SIZE = 4
+
+_ACCOUNT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id TEXT PRIMARY KEY,
+    meta TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS portfolios (
+    account_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    digest TEXT NOT NULL,
+    summary TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (account_id, name)
+);
+"""
+
+
+class AccountStore:
+    """Base class; subclasses implement `load` and `save`."""
+
+    name = "base"
+
+    def load(self, account_id: str) -> dict:
+        """
+        Load a whole account.
+
+        :param account_id: Opaque account id.
+        :return: Account dict, or a new empty account if none is stored.
+        """
+        raise NotImplementedError
+
+    def save(self, account_id: str, account: dict) -> bool:
+        """
+        Persist a whole account, replacing what was stored.
+
+        :param account_id: Opaque account id.
+        :param account: Account dict.
+        :return: True if the account was stored.
+        """
+        raise NotImplementedError
+
+    def list_portfolios(self, account_id: str) -> List[str]:
+        """Names of an account's portfolios, in order."""
+        return list(self.load(account_id).get("portfolios", {}))
+
+    def load_portfolio(self, account_id: str, name: str) -> Optional[dict]:
+        """One portfolio of an account, or None if it does not exist."""
+        return self.load(account_id).get("portfolios", {}).get(name)
+
+
+class CookieAccountStore(AccountStore):
+    """The whole account in browser cookies; the account id is ignored."""
+
+    name = "cookie"
+
+    def load(self, account_id: str) -> dict:
+        return load_account_from_cookie()
+
+    def save(self, account_id: str, account: dict) -> bool:
+        return save_account_to_cookie(account)
+
+
+class MemoryAccountStore(AccountStore):
+    """Accounts in process memory; lost on restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._accounts: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def load(self, account_id: str) -> dict:
+        with self._lock:
+            account = self._accounts.get(account_id)
+            return copy.deepcopy(account) if account else create_empty_account()
+
+    def save(self, account_id: str, account: dict) -> bool:
+        with self._lock:
+            self._accounts[account_id] = copy.deepcopy(account)
+        return True
+
+
+class ConnectionPool:
+    """
+    At most `size` SQLite connections, reused across threads. Each
+    connection is handed to one thread at a time, so sharing it with
+    `check_same_thread=False` is safe. A connection returned inside a
+    transaction, e.g. after a failed query, is rolled back first.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection, blocking while all are in use."""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            finally:
+                self._release(conn)
+        finally:
+            self._slots.release()
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the idle pool, or close it if unusable."""
+        if conn.in_transaction:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error as e:
+                logger.warning(f"Closing connection that failed to roll back: {e}")
+                conn.close()
+                return
+        self._idle.put(conn)
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SQLiteAccountStore(AccountStore):
+    """Server-side accounts in SQLite, one row per portfolio."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, pool_size: int = POOL_SIZE):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(portfolios)")}
+            if "summary" not in columns:
+                conn.execute("ALTER TABLE portfolios ADD COLUMN summary TEXT")
+
+    def load(self, account_id: str) -> dict:
+        with self.pool.connection() as conn:
+            # One read transaction, so meta and rows come from one snapshot.
+            conn.execute("BEGIN")
+            meta = conn.execute(
+                "SELECT meta FROM accounts WHERE account_id = ?", (account_id,)
+            ).fetchone()
+            rows = conn.execute(
+                "SELECT name, body, summary FROM portfolios WHERE account_id = ? "
+                "ORDER BY position",
+                (account_id,),
+            ).fetchall()
+            conn.execute("COMMIT")
+        if meta is None:
+            return create_empty_account()
+
+        account = json.loads(meta[0])
+        portfolios = LazyPortfolios(
+            self.name, lambda name, body: _decode_row(account_id, name, body)
+        )
+        for name, body, summary in rows:
+            portfolios.add_encoded(name, body, json.loads(summary) if summary else None)
+        account["portfolios"] = portfolios
+        return account
+
+    def list_portfolios(self, account_id: str) -> List[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT name FROM portfolios WHERE account_id = ? ORDER BY position",
+                (account_id,),
+            ).fetchall()
+        return [name for (name,) in rows]
+
+    def load_portfolio(self, account_id: str, name: str) -> Optional[dict]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT body FROM portfolios WHERE account_id = ? AND name = ?",
+                (account_id, name),
+            ).fetchone()
+        return _decode_row(account_id, name, row[0]) if row else None
+
+    def save(self, account_id: str, account: dict) -> bool:
+        meta = {k: v for k, v in account.items() if k != "portfolios"}
+        portfolios = account.get("portfolios", {})
+        summaries = portfolio_index(account)
+        rows = []
+        for name in list(portfolios):
+            body = None
+            if isinstance(portfolios, LazyPortfolios):
+                body = portfolios.encoded(name, self.name)
+            if body is None:
+                portfolio = portfolios.get(name)
+                if portfolio is None:
+                    continue  # Unreadable lazily loaded row; dropped.
+                body = encode_portfolio(name, portfolio)
+            digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+            summary = json.dumps(summaries.get(name), default=_json_fallback)
+            rows.append((name, len(rows), body, digest, summary))
+
+        now = time.time()
+        with self.pool.connection() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                # Rows without a summary predate it and are rewritten once.
+                stored = {
+                    name: (position, digest, has_summary)
+                    for name, position, digest, has_summary in conn.execute(
+                        "SELECT name, position, digest, summary IS NOT NULL "
+                        "FROM portfolios WHERE account_id = ?",
+                        (account_id,),
+                    )
+                }
+                conn.execute(
+                    "INSERT OR REPLACE INTO accounts (account_id, meta, updated) "
+                    "VALUES (?, ?, ?)",
+                    (account_id, json.dumps(meta, default=_json_fallback), now),
+                )
+                changed = [
+                    row for row in rows if stored.get(row[0]) != (row[1], row[3], True)
+                ]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO portfolios "
+                    "(account_id, name, position, body, digest, summary, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(account_id, *row, now) for row in changed],
+                )
+                removed = stored.keys() - {row[0] for row in rows}
+                conn.executemany(
+                    "DELETE FROM portfolios WHERE account_id = ? AND name = ?",
+                    [(account_id, name) for name in removed],
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.error(f"Failed to save account to {self.path}: {e}")
+                return False
+
+        logger.info(
+            f"Account saved: {len(changed)}/{len(rows)} portfolios written, "
+            f"{len(removed)} removed."
+        )
+        return True
+
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.pool.close()
+
+
+def encode_portfolio(name: str, portfolio: dict) -> bytes:
+    """
+    Encode one portfolio for storage: the binary codec, or JSON (which
+    always starts with '{') when the codec cannot represent it.
+    """
+    account = {"type": "account", "portfolios": {name: portfolio}}
+    try:
+        return encode_account(account)
+    except ValueError:
+        return json.dumps(portfolio, default=_json_fallback).encode()
+
+
+def decode_portfolio(name: str, body: bytes) -> dict:
+    """Inverse of `encode_portfolio`."""
+    if body[:1] == b"{":
+        return json.loads(body)
+    return decode_account(body)["portfolios"][name]
+
+
+def _decode_row(account_id: str, name: str, body: bytes) -> Optional[dict]:
+    try:
+        return decode_portfolio(name, body)
+    except Exception as e:
+        logger.warning(f"Skipping unreadable portfolio '{name}' of {account_id}: {e}")
+        return None
+
+
+def configured_backend() -> str:
+    """Backend named by `storage.backend` in st.secrets, else the default."""
+    try:
+        backend = st.secrets.get("storage", {}).get("backend", DEFAULT_BACKEND)
+    except FileNotFoundError:
+        backend = DEFAULT_BACKEND
+    if backend not in STORE_BACKENDS:
+        logger.warning(f"Unknown storage backend '{backend}'; using SQLite.")
+        backend = DEFAULT_BACKEND
+    return backend
+
+
+def get_account_store() -> AccountStore:
+    """Return the shared account store for the configured backend."""
+    return _open_account_store(
+        configured_backend(), st.session_state.get("DATA_DIR", "data")
+    )
+
+
+@lru_cache(maxsize=None)
+def _open_account_store(backend: str, data_dir: str) -> AccountStore:
+    if backend == "cookie":
+        return CookieAccountStore()
+    if backend == "memory":
+        return MemoryAccountStore()
+    return SQLiteAccountStore(os.path.join(data_dir, "accounts.sqlite3"))
+
+
+def get_account_id() -> Optional[str]:
+    """
+    Return this browser's account id, creating it and its cookie on the
+    first visit.
+
+    :return: Account id, or None while the browser has not yet reported its
+        cookies; an id made then could replace the one the browser holds.
+    """
+    account_id = st.session_state.get(ACCOUNT_ID_KEY)
+    if account_id:
+        return account_id
+    if not cookies_ready():
+        return None
+
+    account_id = get_cookie(ACCOUNT_ID_COOKIE)
+    if not account_id or not _ACCOUNT_ID.match(account_id):
+        account_id = uuid.uuid4().hex
+        set_cookie(ACCOUNT_ID_COOKIE, account_id)
+        logger.info("Created new account id.")
+    st.session_state[ACCOUNT_ID_KEY] = account_id
+    return account_id
+
+
+def load_session_account() -> Optional[dict]:
+    """
+    Load this session's account from the configured store, migrating an
+    account still held in the legacy account cookie on first use. The
+    legacy cookies are deleted once the store holds the account, so an
+    account emptied later is not migrated again.
+
+    :return: Account dictionary, or None while the browser has not yet
+        reported its cookies.
+    """
+    if not cookies_ready():
+        return None
+    store = get_account_store()
+    if isinstance(store, CookieAccountStore):
+        return store.load("")
+
+    account_id = get_account_id()
+    account = store.load(account_id)
+    if not account.get("portfolios"):
+        legacy = load_account_from_cookie()
+        if legacy.get("portfolios") and store.save(account_id, legacy):
+            clear_account_cookies()
+            logger.info(f"Migrated cookie account into the {store.name} store.")
+            return legacy
+    return account
+
+
+def save_session_account(account: dict) -> bool:
+    """
+    Persist this session's account to the configured store.
+
+    :param account: Account dictionary.
+    :return: True if the account was stored; False also while the account
+        id is not yet known.
+    """
+    store = get_account_store()
+    if isinstance(store, CookieAccountStore):
+        return store.save("", account)
+    account_id = get_account_id()
+    if account_id is None:
+        return False
+    return store.save(account_id, account)
+
+
+def _json_fallback(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
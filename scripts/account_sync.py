@@ -0,0 +1,114 @@
+"""
+account_sync.py: Coalesced account persistence, at most one write per rerun.
+
+Code that changes `st.session_state["account"]` calls `mark_account_dirty`
+instead of saving directly. `flush_account` runs once at the end of each
+script run (and via `rerun` before any `st.rerun`, which would otherwise
+skip the end of the script); it serializes the account only when it was
+marked dirty and writes only when its content hash differs from what was
+last loaded or saved. An account whose save fails stays dirty. Per-session
+counters show how many writes were performed and how many were skipped.
+"""
+
+import hashlib
+import json
+
+import streamlit as st
+
+from scripts.account import LazyPortfolios
+from scripts.account_store import save_session_account
+from scripts.log_util import app_logger
+
+logger = app_logger(__name__)
+
+DIRTY_KEY = "account_dirty"
+HASH_KEY = "account_hash"
+STATS_KEY = "account_write_stats"
+
+
+def mark_account_dirty() -> None:
+    """Record that the session account changed and should be persisted."""
+    st.session_state[DIRTY_KEY] = True
+    _stats()["marked"] += 1
+
+
+def account_hash(account: dict) -> str:
+    """
+    Content hash of an account, independent of how it will be encoded.
+
+    :param account: Account dictionary.
+    :return: Hex BLAKE2b digest of its canonical JSON.
+    """
+    raw = json.dumps(
+        account, sort_keys=True, separators=(",", ":"), default=_hash_fallback
+    )
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def remember_persisted(account: dict) -> None:
+    """
+    Record an account as matching what is stored, e.g. right after loading,
+    so an unchanged account is never written back.
+    """
+    st.session_state[HASH_KEY] = account_hash(account)
+
+
+def flush_account() -> bool:
+    """
+    Persist the session account if it was marked dirty and its content
+    changed since the last load or save.
+
+    :return: True if a write was performed.
+    """
+    if not st.session_state.get(DIRTY_KEY):
+        return False
+    account = st.session_state.get("account")
+    if account is None:
+        st.session_state.pop(DIRTY_KEY)
+        return False
+
+    stats = _stats()
+    digest = account_hash(account)
+    if digest == st.session_state.get(HASH_KEY):
+        st.session_state.pop(DIRTY_KEY)
+        stats["skipped"] += 1
+        logger.debug("Account unchanged since last save; write skipped.")
+        return False
+
+    # The account stays dirty until a save succeeds, so a failed write is
+    # retried by the next flush.
+    if not save_session_account(account):
+        return False
+    st.session_state.pop(DIRTY_KEY)
+    st.session_state[HASH_KEY] = digest
+    stats["writes"] += 1
+    return True
+
+
+def rerun() -> None:
+    """Flush pending account changes, then rerun the script."""
+    flush_account()
+    st.rerun()
+
+
+def account_write_stats() -> dict:
+    """
+    Per-session persistence counters.
+
+    :return: Dict with `marked` (dirty marks), `writes` (saves performed)
+        and `skipped` (flushes whose content had not changed).
+    """
+    return dict(_stats())
+
+
+def _hash_fallback(obj):
+    # Lazily loaded portfolios hash by their stored bytes until decoded.
+    if isinstance(obj, LazyPortfolios):
+        return obj.hash_view()
+    return str(obj)
+
+
+def _stats() -> dict:
+    return st.session_state.setdefault(
+        STATS_KEY, {"marked": 0, "writes": 0, "skipped": 0}
+    )
@@ -0,0 +1,129 @@
+"""
+allocation_cache.py: Bounded LRU cache for DCA allocation results.
+
+Results are keyed by a canonical content hash of the portfolio plus the
+allocation function and its parameters, so repeated what-ifs and toggling
+between scenarios return instantly. The cache is shared by all sessions in
+the process and guarded by a lock; callers always receive their own copy
+of a cached result. Its hit/miss counters are process-wide too.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from decimal import Decimal
+from typing import Any, Callable, Dict
+
+from scripts.log_util import app_logger
+
+logger = app_logger(__name__)
+
+
+def portfolio_hash(portfolio: Dict[str, Any]) -> str:
+    """
+    Return a SHA-256 hash of a portfolio's canonical JSON form. Key order
+    does not matter, and equal numbers hash the same whether they are int,
+    float or Decimal (150, 150.0 and Decimal("150.00") match).
+
+    :param portfolio: Portfolio root node.
+    :return: Hex digest.
+    """
+    canonical = json.dumps(
+        _canonical_numbers(portfolio),
+        sort_keys=True,
+        separators=(",", ":"),
+        default=_canonical_value,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _canonical_numbers(obj):
+    """
+    Replace every number with "#" + its normalized Decimal string. Strings
+    that start with "#" get a second one, so they never look like numbers.
+    """
+    if isinstance(obj, dict):
+        return {k: _canonical_numbers(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical_numbers(v) for v in obj]
+    if isinstance(obj, (int, float, Decimal)) and not isinstance(obj, bool):
+        return "#" + str(Decimal(str(obj)).normalize())
+    if isinstance(obj, str) and obj.startswith("#"):
+        return "#" + obj
+    return obj
+
+
+def _canonical_value(obj):
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+class AllocationCache:
+    """
+    Thread-safe least-recently-used cache of allocation results with
+    process-wide hit/miss counters.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(
+        self, func: Callable[..., Dict[str, Any]], pie_data: Dict[str, Any], **params
+    ) -> Dict[str, Any]:
+        """
+        Return `func(pie_data=pie_data, **params)`, computing it only on a miss.
+
+        :param func: Allocation function, e.g. `recalculate_pie_allocation`.
+        :param pie_data: Portfolio passed to `func`; not modified.
+        :param params: Keyword parameters passed to `func`.
+        :return: A private copy of the allocation result.
+        """
+        key = (
+            func.__name__,
+            portfolio_hash(pie_data),
+            tuple(sorted((k, str(v)) for k, v in params.items())),
+        )
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            else:
+                self.misses += 1
+        if result is not None:
+            logger.debug(f"Allocation cache hit for {func.__name__}")
+            return deepcopy(result)
+
+        # Computed outside the lock so other sessions are not blocked.
+        result = func(pie_data=pie_data, **params)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return deepcopy(result)
+
+    def stats(self) -> Dict[str, int]:
+        """Return process-wide hit, miss and size counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+ALLOCATION_CACHE = AllocationCache()
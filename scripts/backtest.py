@@ -0,0 +1,233 @@
+"""
+backtest.py: Historical DCA backtests over local daily price files.
+
+Price files hold one row per trading day and one column per ticker (CSV or
+Parquet, dates in the first column or index). On first use each file is
+converted in chunks to a `.npy` price matrix that is memory-mapped on every
+later run, so long histories for many tickers never become Python objects.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from scripts.dca_allocator import target_leaf_factors
+from scripts.log_util import app_logger
+from scripts.portfolio import PortfolioTree
+
+logger = app_logger(__name__)
+
+CHUNK_ROWS = 4096
+
+
+def load_price_matrix(
+    source: str, cache_dir: Optional[str] = None
+) -> tuple[np.ndarray, list[str], np.ndarray]:
+    """
+    Load a daily price file as a memory-mapped matrix, building the cache
+    on first use. Missing prices are forward-filled.
+
+    :param source: Path to a .csv or .parquet price file.
+    :param cache_dir: Where to keep converted matrices; defaults to the
+        source file's directory.
+    :return: (dates, tickers, prices) with prices shaped (days, tickers).
+    """
+    base = _cache_base(source, cache_dir)
+    if not os.path.exists(f"{base}.json"):
+        _build_price_cache(source, base)
+
+    with open(f"{base}.json") as f:
+        tickers = json.load(f)["tickers"]
+    dates = np.load(f"{base}.dates.npy", mmap_mode="r")
+    prices = np.load(f"{base}.prices.npy", mmap_mode="r")
+    return dates, tickers, prices
+
+
+def _cache_base(source: str, cache_dir: Optional[str]) -> str:
+    """Return the cache path prefix, keyed on the source's path, size and mtime."""
+    stat = os.stat(source)
+    key = f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    cache_dir = cache_dir or os.path.dirname(os.path.abspath(source))
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(cache_dir, f"{stem}-{digest}")
+
+
+def _build_price_cache(source: str, base: str) -> None:
+    """Convert a price file chunk by chunk into .npy files under `base`."""
+    logger.info(f"Building price cache for {source}")
+    rows, tickers = _price_file_shape(source)
+    dates = np.lib.format.open_memmap(
+        f"{base}.dates.npy", mode="w+", dtype="datetime64[D]", shape=(rows,)
+    )
+    prices = np.lib.format.open_memmap(
+        f"{base}.prices.npy", mode="w+", dtype=np.float64, shape=(rows, len(tickers))
+    )
+
+    start, carry = 0, None
+    for chunk in _iter_price_chunks(source):
+        chunk = chunk[tickers].astype(np.float64)
+        if carry is not None:
+            chunk.iloc[0] = chunk.iloc[0].fillna(carry)
+        chunk = chunk.ffill()
+        carry = chunk.iloc[-1]
+
+        end = start + len(chunk)
+        dates[start:end] = pd.to_datetime(chunk.index).values.astype("datetime64[D]")
+        prices[start:end] = chunk.to_numpy()
+        start = end
+
+    dates.flush()
+    prices.flush()
+    with open(f"{base}.json", "w") as f:
+        json.dump({"source": os.path.abspath(source), "tickers": tickers}, f)
+
+
+def _price_file_shape(source: str) -> tuple[int, list[str]]:
+    """
+    Return the row count and ticker columns of a price file. Both come from
+    the reader that later fills the cache, so quoting, a BOM or blank lines
+    never make the matrix disagree with the parsed rows.
+    """
+    if source.endswith(".parquet"):
+        parquet = _parquet_file(source)
+        schema = parquet.schema_arrow
+        index = (schema.pandas_metadata or {}).get("index_columns", [])
+        index = [c for c in index if isinstance(c, str)]
+        columns = [c for c in schema.names if c not in index]
+        return parquet.metadata.num_rows, columns if index else columns[1:]
+
+    header = pd.read_csv(source, index_col=0, nrows=0)
+    chunks = pd.read_csv(source, usecols=[0], chunksize=CHUNK_ROWS)
+    return sum(len(chunk) for chunk in chunks), list(header.columns)
+
+
+def _parquet_file(source: str):
+    """Open a Parquet file with pyarrow, which only Parquet sources need."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            f"Reading {source} needs pyarrow; install it or use a .csv file"
+        ) from e
+    return pq.ParquetFile(source)
+
+
+def _iter_price_chunks(source: str) -> Iterator[pd.DataFrame]:
+    """Yield date-indexed DataFrame chunks from a CSV or Parquet file."""
+    if source.endswith(".parquet"):
+        for batch in _parquet_file(source).iter_batches(batch_size=CHUNK_ROWS):
+            frame = batch.to_pandas()
+            if not isinstance(frame.index, pd.DatetimeIndex):
+                frame = frame.set_index(frame.columns[0])
+            yield frame
+    else:
+        yield from pd.read_csv(source, index_col=0, chunksize=CHUNK_ROWS)
+
+
+def backtest_dca(
+    portfolio: Dict[str, Any],
+    source: str,
+    deposit: float,
+    frequency: str = "M",
+    cache_dir: Optional[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Backtest recurring deposits into a portfolio over historical prices.
+
+    The run starts on the first day every ticker has a price (files are
+    forward-filled, so only leading gaps remain). Current values are bought
+    on that day; each period's deposit is split by `target_leaf_factors` on
+    that period's first trading day. The
+    run is a vectorized loop over chunks of days: share counts accumulate
+    with a cumulative sum and every node's value comes from one matrix
+    product per chunk.
+
+    :param portfolio: Portfolio root node. Tickers are matched to price
+        columns by `id`, falling back to the slice name.
+    :param source: Path to a .csv or .parquet price file.
+    :param deposit: Cash deposited each period.
+    :param frequency: NumPy datetime unit for deposits: 'M', 'W' or 'D'.
+    :param cache_dir: Where to keep converted price matrices.
+    :return: Dict with `values` (daily value per node path) and `weights`
+        (daily weight of each non-root node within its parent).
+    :raises ValueError: If a ticker has no price history, or no day has a
+        price for every ticker.
+    """
+    dates, tickers, prices = load_price_matrix(source, cache_dir)
+    tree = PortfolioTree.from_dict(portfolio).rollup().compute_weights()
+    terminal = np.flatnonzero(~tree.has_children())
+    factors = target_leaf_factors(tree)[terminal]
+
+    keys = [tree.attrs[i].get("id", tree.names[i]) for i in terminal]
+    missing = sorted(set(keys) - set(tickers))
+    if missing:
+        raise ValueError(f"No price history for: {', '.join(missing)}")
+    columns = np.array([tickers.index(key) for key in keys])
+
+    first = _first_complete_row(prices, columns)
+    if first is None:
+        raise ValueError("No day has a price for every ticker")
+    if first:
+        logger.info(f"Skipping {first} days before every ticker has a price")
+        dates, prices = dates[first:], prices[first:]
+
+    periods = dates.astype(f"datetime64[{frequency}]")
+    deposit_days = np.concatenate([[True], periods[1:] != periods[:-1]])
+    amounts = factors * deposit
+    membership = _ancestor_matrix(tree, terminal)
+
+    logger.info(f"Backtesting {len(terminal)} tickers over {len(dates)} days")
+    node_values = np.empty((len(dates), len(tree)))
+    shares = tree.dollar_values()[terminal] / prices[0, columns]
+    for start in range(0, len(dates), CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, len(dates))
+        chunk = np.asarray(prices[start:end])[:, columns]
+        buys = np.where(deposit_days[start:end, None], amounts / chunk, 0.0)
+        held = shares + np.cumsum(buys, axis=0)
+        shares = held[-1]
+        node_values[start:end] = (held * chunk) @ membership
+
+    index = pd.DatetimeIndex(np.asarray(dates), name="date")
+    paths = tree.paths()
+    parent_values = node_values[:, tree.parent[1:]]
+    weights = np.divide(
+        node_values[:, 1:],
+        parent_values,
+        out=np.zeros_like(parent_values),
+        where=parent_values > 0,
+    )
+    return {
+        "values": pd.DataFrame(node_values, index=index, columns=paths),
+        "weights": pd.DataFrame(weights, index=index, columns=paths[1:]),
+    }
+
+
+def _first_complete_row(prices: np.ndarray, columns: np.ndarray) -> Optional[int]:
+    """Index of the first day with a price in every column, scanned in chunks."""
+    for start in range(0, len(prices), CHUNK_ROWS):
+        chunk = np.asarray(prices[start : start + CHUNK_ROWS])[:, columns]
+        complete = np.flatnonzero(np.isfinite(chunk).all(axis=1))
+        if len(complete):
+            return start + int(complete[0])
+    return None
+
+
+def _ancestor_matrix(tree: PortfolioTree, terminal: np.ndarray) -> np.ndarray:
+    """
+    Build a (terminal, nodes) 0/1 matrix marking each terminal node and all
+    of its ancestors, so terminal values @ matrix gives every node's value.
+    """
+    matrix = np.zeros((len(terminal), len(tree)))
+    rows = np.arange(len(terminal))
+    nodes = terminal.copy()
+    while len(nodes):
+        matrix[rows, nodes] = 1.0
+        keep = nodes > 0
+        rows, nodes = rows[keep], tree.parent[nodes[keep]]
+    return matrix
@@ -2,52 +2,106 @@
 cookie_account.py: Cookie-based persistence for account data.
 
 Handles compression and privacy-respecting storage via real browser cookies.
+Accounts are written with the compact binary codec in `account_codec`,
+marked by `CODEC_PREFIX`; cookies in the older JSON + zlib + base64 format
+still load, and accounts the codec cannot represent are saved in it.
+
+The account is sharded across cookies: each portfolio is encoded on its own
+and split into `SHARD_BYTES` chunks named `<COOKIE_KEY>.<shard>.<chunk>`.
+The `COOKIE_KEY` cookie holds a manifest listing each portfolio's shard
+number, chunk count, CRC-32 and `portfolio_summary`. Saves only rewrite
+cookies whose value changed since the last load or save, and a shard that
+fails its checksum drops just that portfolio instead of the whole account.
+Sharded accounts load as `LazyPortfolios`: a shard is only decompressed
+when its portfolio is first read, and untouched shards are written back
+as they were read.
 """
 
 import base64
 import json
 import zlib
 from decimal import Decimal
+from typing import Dict, Optional
 
 import streamlit as st
 
-from scripts.account import create_empty_account
-from scripts.cookie_manager import get_cookie, set_cookie
+from scripts.account import LazyPortfolios, create_empty_account, portfolio_index
+from scripts.account_codec import codec_stats, decode_account, encode_account
+from scripts.cookie_manager import (
+    delete_cookie,
+    get_all_cookies,
+    get_cookie,
+    set_cookie,
+)
 from scripts.log_util import app_logger
 
 logger = app_logger(__name__)
 
 COOKIE_KEY = "m1pie_account"
 COOKIE_LIMIT_BYTES = 4096
+# Not in the base64 alphabet, so binary cookies never look like legacy ones.
+CODEC_PREFIX = "b."
+MANIFEST_PREFIX = "m."
+MANIFEST_VERSION = 1
+# Chunk size leaves room for the cookie name and attributes within 4KB.
+SHARD_BYTES = 3800
+# Browsers keep roughly 50 cookies per domain; stay well below that.
+MAX_SHARD_COOKIES = 40
+# Session key for the cookie values last read or written, used for diffing.
+WRITTEN_COOKIES_KEY = "account_cookies"
+# `LazyPortfolios.source` of portfolios loaded from shards.
+SHARD_SOURCE = "cookie"
 
 
-def save_account_to_cookie(account: dict) -> None:
+def save_account_to_cookie(account: dict) -> bool:
     """
-    Compress and store account data in a browser cookie.
+    Compress and store account data in browser cookies, rewriting only the
+    shards that changed.
 
     :param account: Account dictionary to persist.
+    :return: True if the account was stored.
     """
     try:
-        raw_json = json.dumps(account, separators=(",", ":"), default=_json_fallback)
-        compressed = zlib.compress(raw_json.encode())
-        encoded = base64.b64encode(compressed).decode()
+        previous = st.session_state.get(WRITTEN_COOKIES_KEY, {})
+        cookies = encode_account_cookies(account, previous.get(COOKIE_KEY))
 
-        if len(encoded) > COOKIE_LIMIT_BYTES:
-            logger.warning("Cookie size exceeds 4KB, not saving.")
+        shard_count = len(cookies) - 1
+        if shard_count > MAX_SHARD_COOKIES or len(cookies[COOKIE_KEY]) > SHARD_BYTES:
+            logger.warning(f"Account needs {shard_count} cookies, not saving.")
             st.warning("Account not saved: cookie size limit exceeded.")
-            return
+            return False
+
+        changed = [key for key, value in cookies.items() if previous.get(key) != value]
+        # Shards first, manifest last, so the manifest never names missing data.
+        changed.sort(key=lambda key: key == COOKIE_KEY)
+        for key in changed:
+            set_cookie(key, cookies[key])
+        for key in previous.keys() - cookies.keys():
+            delete_cookie(key)
+        st.session_state[WRITTEN_COOKIES_KEY] = cookies
 
-        set_cookie(COOKIE_KEY, encoded)
-        logger.info("Account saved to cookie.")
+        stats = codec_stats(account, "".join(cookies.values()))
+        written = sum(len(cookies[key]) for key in changed)
+        per_slice = (
+            f", {stats['bytes_per_slice']:.1f} bytes/slice"
+            if stats["bytes_per_slice"] is not None
+            else ""
+        )
+        logger.info(
+            f"Account saved to cookies: wrote {len(changed)}/{len(cookies)} "
+            f"({written}/{stats['bytes']} bytes{per_slice})."
+        )
+        return True
 
     except Exception as e:
         logger.error(f"Failed to save account to cookie: {e}")
         st.error("Failed to save account. See logs for details.")
+        return False
 
 
 def load_account_from_cookie() -> dict:
     """
-    Load and decompress account data from a browser cookie.
+    Load and decompress account data from browser cookies.
 
     :return: Account dictionary or a new empty account if missing/invalid.
     """
@@ -56,9 +110,11 @@ def load_account_from_cookie() -> dict:
         if not encoded:
             return create_empty_account()
 
-        compressed = base64.b64decode(encoded)
-        raw_json = zlib.decompress(compressed).decode()
-        data = json.loads(raw_json)
+        if encoded.startswith(MANIFEST_PREFIX):
+            data, cookies = _load_shards(encoded)
+        else:
+            data, cookies = decode_account_cookie(encoded), {COOKIE_KEY: encoded}
+        st.session_state[WRITTEN_COOKIES_KEY] = cookies
 
         logger.info("Account loaded from cookie.")
         return data
@@ -68,6 +124,169 @@ def load_account_from_cookie() -> dict:
         return create_empty_account()
 
 
+def clear_account_cookies() -> None:
+    """Delete the account cookie and all of its shards, e.g. after migration."""
+    names = {COOKIE_KEY, *st.session_state.get(WRITTEN_COOKIES_KEY, {})}
+    names.update(key for key in get_all_cookies() if key.startswith(f"{COOKIE_KEY}."))
+    for key in sorted(names):
+        delete_cookie(key)
+    st.session_state.pop(WRITTEN_COOKIES_KEY, None)
+    logger.info(f"Deleted {len(names)} account cookies.")
+
+
+def encode_account_cookies(
+    account: dict, previous_manifest: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Shard an account into cookie values.
+
+    :param account: Account dictionary.
+    :param previous_manifest: Manifest cookie from the last save, so each
+        portfolio keeps its shard number and unchanged shards keep their
+        cookie names.
+    :return: Cookie name to value, including the manifest under COOKIE_KEY.
+    """
+    known = _shard_numbers(previous_manifest)
+    portfolios = account.get("portfolios", {})
+    taken = {known[name] for name in portfolios if name in known}
+    free = (n for n in range(len(known) + len(portfolios) + 1) if n not in taken)
+    summaries = portfolio_index(account)
+
+    cookies, shards = {}, []
+    for name in list(portfolios):
+        text = None
+        if isinstance(portfolios, LazyPortfolios):
+            text = portfolios.encoded(name, SHARD_SOURCE)
+        if text is None:
+            portfolio = portfolios.get(name)
+            if portfolio is None:
+                continue  # Unreadable lazily loaded shard; dropped.
+            text = encode_account_cookie(
+                {"type": "account", "portfolios": {name: portfolio}}
+            )
+        number = known[name] if name in known else next(free)
+        chunks = [text[i : i + SHARD_BYTES] for i in range(0, len(text), SHARD_BYTES)]
+        for index, chunk in enumerate(chunks):
+            cookies[shard_cookie_key(number, index)] = chunk
+        shards.append(
+            [name, number, len(chunks), zlib.crc32(text.encode()), summaries.get(name)]
+        )
+
+    manifest = {
+        "v": MANIFEST_VERSION,
+        "account": {k: v for k, v in account.items() if k != "portfolios"},
+        "shards": shards,
+    }
+    raw = json.dumps(manifest, separators=(",", ":"), default=_json_fallback)
+    cookies[COOKIE_KEY] = MANIFEST_PREFIX + _b64encode(raw.encode())
+    return cookies
+
+
+def shard_cookie_key(number: int, index: int) -> str:
+    """Cookie name for chunk `index` of shard `number`."""
+    return f"{COOKIE_KEY}.{number}.{index}"
+
+
+def _load_shards(encoded: str) -> tuple[dict, Dict[str, str]]:
+    """
+    Reassemble a sharded account from its manifest. Shards are checked but
+    not decoded; each portfolio is decoded when first read.
+
+    :param encoded: Manifest cookie value.
+    :return: (account, cookie values read) for later diffing.
+    """
+    manifest = _read_manifest(encoded)
+    account = manifest["account"]
+    portfolios = LazyPortfolios(SHARD_SOURCE, _decode_shard)
+    account["portfolios"] = portfolios
+    cookies = {COOKIE_KEY: encoded}
+    jar = get_all_cookies()
+
+    for entry in manifest["shards"]:
+        name, number, count, checksum = entry[:4]
+        # Manifests written before summaries were added have four fields.
+        summary = entry[4] if len(entry) > 4 else None
+        keys = [shard_cookie_key(number, index) for index in range(count)]
+        chunks = [jar.get(key) for key in keys]
+        if any(chunk is None for chunk in chunks):
+            logger.warning(f"Portfolio '{name}' is missing cookie chunks; skipped.")
+            continue
+        text = "".join(chunks)
+        if zlib.crc32(text.encode()) != checksum:
+            logger.warning(f"Portfolio '{name}' failed its checksum; skipped.")
+            continue
+        portfolios.add_encoded(name, text, summary)
+        cookies.update(zip(keys, chunks))
+    return account, cookies
+
+
+def _decode_shard(name: str, text: str) -> Optional[dict]:
+    try:
+        return decode_account_cookie(text)["portfolios"][name]
+    except Exception as e:
+        logger.warning(f"Portfolio '{name}' could not be decoded ({e}); skipped.")
+        return None
+
+
+def _read_manifest(encoded: str) -> dict:
+    body = encoded[len(MANIFEST_PREFIX) :]
+    manifest = json.loads(_b64decode(body))
+    if manifest.get("v") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported cookie manifest version: {manifest.get('v')}")
+    return manifest
+
+
+def _shard_numbers(manifest: Optional[str]) -> Dict[str, int]:
+    """Portfolio name to shard number from a manifest cookie, if any."""
+    if not manifest or not manifest.startswith(MANIFEST_PREFIX):
+        return {}
+    try:
+        return {entry[0]: entry[1] for entry in _read_manifest(manifest)["shards"]}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cookie manifest: {e}")
+        return {}
+
+
+def encode_account_cookie(account: dict) -> str:
+    """
+    Encode an account as cookie text, preferring the binary codec.
+
+    :param account: Account dictionary.
+    :return: `CODEC_PREFIX` + unpadded URL-safe base64 of the binary
+        encoding, or legacy base64 JSON if the codec rejects the account.
+    """
+    try:
+        data = encode_account(account)
+    except ValueError as e:
+        logger.info(f"Binary codec unavailable for account ({e}); using JSON.")
+        raw_json = json.dumps(account, separators=(",", ":"), default=_json_fallback)
+        return base64.b64encode(zlib.compress(raw_json.encode())).decode()
+    return CODEC_PREFIX + _b64encode(data)
+
+
+def decode_account_cookie(encoded: str) -> dict:
+    """
+    Decode cookie text written by `encode_account_cookie` or by the legacy
+    JSON + zlib + base64 format.
+
+    :param encoded: Cookie value.
+    :return: Account dictionary.
+    :raises ValueError: If the value is corrupt (zlib.error for legacy ones).
+    """
+    if encoded.startswith(CODEC_PREFIX):
+        return decode_account(_b64decode(encoded[len(CODEC_PREFIX) :]))
+    compressed = base64.b64decode(encoded)
+    return json.loads(zlib.decompress(compressed).decode())
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
 def _json_fallback(obj):
     if isinstance(obj, Decimal):
         return float(obj)
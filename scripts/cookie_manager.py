@@ -2,27 +2,56 @@
 cookie_manager.py: Provide cookie read/write utilities using real browser cookies.
 
 Wraps extra-streamlit-components CookieManager for persistent, client-side storage.
+
+The CookieManager is a Streamlit component, so it may be created only once
+per script run: a second instance with the same key raises a duplicate key
+error. `begin_cookie_run` starts each run, and the first cookie access after
+it creates that run's manager, which every read, write and delete then goes
+through. The manager reports all browser cookies once, when created; reads
+are served from that snapshot, updated with the run's own writes.
 """
 
 from datetime import datetime, timedelta, timezone
 
 import extra_streamlit_components as stx
+import streamlit as st
 
 from scripts.log_util import app_logger
 
 logger = app_logger(__name__)
 
+MANAGER_KEY = "cookie_manager_main"
+# Session key of the current run's manager and its component key counters.
+COOKIE_RUN_KEY = "cookie_run"
+
+
+def begin_cookie_run() -> None:
+    """Start a script run; call once at the top of the script."""
+    st.session_state.pop(COOKIE_RUN_KEY, None)
+
 
 def get_cookie_manager():
-    """Return a CookieManager instance with a consistent key."""
-    return stx.CookieManager(key="cookie_manager_main")
+    """Return this run's CookieManager, creating it on first use."""
+    return _cookie_run()["manager"]
+
+
+def cookies_ready() -> bool:
+    """
+    True once the browser has reported its cookies. Until then the manager
+    returns an empty snapshot, so a missing cookie may not really be missing.
+    """
+    _cookie_run()
+    return st.session_state.get(MANAGER_KEY) is not None
+
+
+def get_all_cookies() -> dict:
+    """Return every browser cookie, as read once for this run."""
+    return _cookie_run()["manager"].cookies
 
 
 def get_cookie(key: str) -> str | None:
     """Retrieve a value from browser cookies."""
-    manager = get_cookie_manager()
-    cookies = manager.get_all()
-    value = cookies.get(key)
+    value = get_all_cookies().get(key)
     logger.debug(f"Read cookie [{key}]: {value}")
     return value
 
@@ -31,5 +60,37 @@ def set_cookie(key: str, value: str) -> None:
     """Set a value in browser cookies with a 30-day expiration."""
     manager = get_cookie_manager()
     expires_at = datetime.now(timezone.utc) + timedelta(days=30)
-    manager.set(cookie=key, val=value, expires_at=expires_at)
+    manager.set(
+        cookie=key, val=value, expires_at=expires_at, key=_component_key("set", key)
+    )
     logger.debug(f"Set cookie [{key}] = {value}")
+
+
+def delete_cookie(key: str) -> None:
+    """Remove a cookie from the browser, whether or not it was read this run."""
+    manager = get_cookie_manager()
+    try:
+        manager.delete(cookie=key, key=_component_key("delete", key))
+    except KeyError:
+        # The delete was sent; only the run's snapshot lacked the cookie.
+        pass
+    logger.debug(f"Deleted cookie [{key}]")
+
+
+def _cookie_run() -> dict:
+    run = st.session_state.get(COOKIE_RUN_KEY)
+    if run is None:
+        manager = stx.CookieManager(key=MANAGER_KEY)
+        # Copy so the run's writes never alter the component's own value.
+        manager.cookies = dict(manager.cookies or {})
+        run = {"manager": manager, "keys": {}}
+        st.session_state[COOKIE_RUN_KEY] = run
+    return run
+
+
+def _component_key(action: str, cookie: str) -> str:
+    """Component key unique within the run, even for repeated writes."""
+    keys = _cookie_run()["keys"]
+    name = f"{action}_{cookie}"
+    keys[name] = keys.get(name, 0) + 1
+    return name if keys[name] == 1 else f"{name}_{keys[name]}"
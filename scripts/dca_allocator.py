@@ -3,33 +3,156 @@
 Distributes new capital across a nested pie structure using weight ratios.
 """
 
+import heapq
 from decimal import Decimal
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Sequence
+
+import numpy as np
+import pandas as pd
 
 from scripts.log_util import app_logger
+from scripts.portfolio import PIE, VALUE_SCALE, PortfolioTree
 
 logger = app_logger(__name__)
 
+CENT_UNITS = VALUE_SCALE // 100
+
+# M1 pie rules for whole-percent target weights
+MAX_PIE_SLICES = 100
+MIN_SLICE_PERCENT = 1
+
 
 def allocate_dca(portfolio: Dict[str, Any], amount: Decimal) -> Dict[str, Decimal]:
     """
     Allocate new capital across the portfolio using current weight ratios.
 
+    Tickers are keyed by their `id`, falling back to the slice name. A ticker
+    held in several pies receives the sum of its allocations.
+
     :param portfolio: Portfolio root node.
     :param amount: Total capital to allocate as a Decimal.
     :return: Mapping from ticker ID to allocated capital.
     """
-    allocations = {}
+    keys, factors = ticker_factors(portfolio)
+    return {key: amount * Decimal(str(f)) for key, f in zip(keys, factors)}
+
+
+def ticker_factors(portfolio: Dict[str, Any]) -> tuple[list[str], np.ndarray]:
+    """
+    Compute each ticker's share of the whole portfolio in one tree pass.
+
+    :param portfolio: Portfolio root node.
+    :return: Ticker keys in first-seen order and their summed leaf factors.
+    """
+    tree = PortfolioTree.from_dict(portfolio).normalize()
+    factors = tree.leaf_factors()
+    leaves = tree.leaf_indices()
+
+    keys = [tree.attrs[i].get("id", tree.names[i]) for i in leaves]
+    columns = list(dict.fromkeys(keys))
+    position = {key: n for n, key in enumerate(columns)}
 
-    def recurse(node, factor=Decimal(1)):
-        if node["type"] == "ticker":
-            allocations[node.get("id", "UNNAMED")] = amount * factor
-            return
-        for k, v in node["children"].items():
-            recurse(v, factor * Decimal(v["weight"]))
+    totals = np.zeros(len(columns), dtype=np.float64)
+    np.add.at(totals, [position[key] for key in keys], factors[leaves])
+    return columns, totals
 
-    recurse(portfolio)
-    return allocations
+
+def allocate_dca_batch(
+    portfolio: Dict[str, Any], amounts: Sequence[float]
+) -> pd.DataFrame:
+    """
+    Allocate many deposit amounts at once using current weight ratios.
+
+    The leaf factor vector is computed once; each row is `amount * factors`.
+
+    :param portfolio: Portfolio root node.
+    :param amounts: Deposit amounts to evaluate.
+    :return: DataFrame of allocated capital, amounts by ticker.
+    """
+    keys, factors = ticker_factors(portfolio)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    return pd.DataFrame(
+        np.outer(amounts, factors),
+        index=pd.Index(amounts, name="amount"),
+        columns=keys,
+    )
+
+
+def sweep_pie_allocation(
+    pie_data: Dict[str, Any],
+    new_funds: Sequence[float],
+    percent_to_new: Sequence[float],
+    new_ticker_count: Sequence[int],
+) -> pd.DataFrame:
+    """
+    Evaluate `recalculate_pie_allocation` over a grid of scenarios in one
+    vectorized pass. Values are not rounded to cents.
+
+    :param pie_data: Root pie node
+    :param new_funds: New capital amounts to try
+    :param percent_to_new: Percentages of new capital going to new tickers
+    :param new_ticker_count: Numbers of new mock tickers to try
+    :return: DataFrame of capital allocated per child (existing children,
+        then the `mock_ticker_names`), indexed by (new_funds, percent_to_new,
+        new_ticker_count)
+    """
+    funds, percent, count = (
+        grid.ravel()
+        for grid in np.meshgrid(
+            np.asarray(new_funds, dtype=np.float64),
+            np.asarray(percent_to_new, dtype=np.float64),
+            np.asarray(new_ticker_count, dtype=np.int64),
+            indexing="ij",
+        )
+    )
+    children = pie_data["children"]
+    values = np.array([float(v["value"]) for v in children.values()])
+    total = float(pie_data["value"])
+    if total > 0:
+        shares = values / total
+    else:
+        logger.warning("Pie has no value; splitting existing funds equally.")
+        shares = _equal_shares(len(values))
+
+    to_existing = np.outer(funds * (100 - percent) / 100, shares)
+
+    max_new = int(count.max(initial=0))
+    to_new = funds * percent / 100
+    per_new = np.divide(to_new, count, out=np.zeros_like(to_new), where=count > 0)
+    slots = np.arange(1, max_new + 1) <= count[:, None]
+    to_mock = np.where(slots, per_new[:, None], 0.0)
+
+    index = pd.MultiIndex.from_arrays(
+        [funds, percent, count],
+        names=["new_funds", "percent_to_new", "new_ticker_count"],
+    )
+    columns = list(children) + mock_ticker_names(children, max_new)
+    return pd.DataFrame(np.hstack([to_existing, to_mock]), index=index, columns=columns)
+
+
+def mock_ticker_names(existing: Iterable[str], count: int) -> list[str]:
+    """
+    Names for new mock tickers: NEW_1, NEW_2, ... skipping any name already
+    used by a sibling, so an existing slice is never overwritten.
+
+    :param existing: Names of the pie's current children.
+    :param count: Number of names needed.
+    :return: `count` unique names.
+    """
+    taken = set(existing)
+    names = []
+    i = 1
+    while len(names) < count:
+        name = f"NEW_{i}"
+        if name not in taken:
+            names.append(name)
+        i += 1
+    return names
+
+
+def _equal_shares(count: int) -> np.ndarray:
+    """Equal shares summing to 1, or an empty array when there is no slot."""
+    return np.full(count, 1 / count) if count else np.zeros(0)
 
 
 def scale_existing_positions(
@@ -81,8 +204,7 @@ def add_mock_targets(
     per_ticker = new_fund_allocation / Decimal(new_ticker_count)
     children = pie_data["children"].copy()
 
-    for i in range(1, new_ticker_count + 1):
-        key = f"NEW_{i}"
+    for key in mock_ticker_names(children, new_ticker_count):
         children[key] = {
             "type": "ticker",
             "value": float(round(per_ticker, 2)),
@@ -128,26 +250,310 @@ def recalculate_pie_allocation(
 
 def compute_target_weights(pie_data: Dict[str, Any]) -> Dict[str, int]:
     """
-    Compute whole-number weight percentages for each child in a pie.
+    Compute whole-number weight percentages for each child in a pie,
+    following M1's rules (see `round_pie_weights`).
 
     :param pie_data: A pie node with children and values
-    :return: Mapping from child ID to integer weight (summing to 100)
+    :return: Mapping from child ID to integer weight (summing to 100), or
+        an empty dict when the pie has no children or no value
     """
     children = pie_data["children"]
-    total = sum(v["value"] for v in children.values())
-    raw_weights = {k: (v["value"] / total) * 100 for k, v in children.items()}
+    values = np.array([float(v["value"]) for v in children.values()])
+    if values.sum() <= 0:
+        logger.warning("Pie has no value; no target weights computed.")
+        return {}
+    weights, _, _ = round_pie_weights(values)
+    return {k: int(w) for k, w in zip(children, weights)}
+
+
+def round_pie_weights(values: np.ndarray) -> tuple[np.ndarray, list[str], float]:
+    """
+    Round one pie's child values to whole percents under M1's rules: the
+    weights sum to 100, every slice gets at least 1%, and a pie holds at
+    most 100 slices. Total absolute rounding error is minimized.
+
+    Weights start at max(floor(raw), 1). Leftover points go to the largest
+    shortfalls via argpartition; an overshoot caused by the 1% minimum is
+    taken back one point at a time from the largest weights via a heap.
+
+    :param values: Child values of one pie.
+    :return: (weights, binding constraint names, total error in points)
+    """
+    count = len(values)
+    if not count:
+        return np.zeros(0, dtype=np.int64), [], 0.0
+    if count > MAX_PIE_SLICES:
+        raise ValueError(f"Pie has {count} slices; M1 allows {MAX_PIE_SLICES}")
+
+    total = values.sum()
+    raw = values / total * 100 if total > 0 else np.full(count, 100 / count)
+    weights = np.maximum(np.floor(raw), MIN_SLICE_PERCENT).astype(np.int64)
+
+    binding = []
+    if (raw < MIN_SLICE_PERCENT).any():
+        binding.append("min_slice")
+    if count == MAX_PIE_SLICES:
+        binding.append("max_slices")
+
+    remainder = 100 - int(weights.sum())
+    if remainder > 0:
+        weights[np.argpartition(weights - raw, remainder - 1)[:remainder]] += 1
+    elif remainder < 0:
+        heap = [(-w, i) for i, w in enumerate(weights) if w > MIN_SLICE_PERCENT]
+        heapq.heapify(heap)
+        for _ in range(-remainder):
+            _, i = heapq.heappop(heap)
+            weights[i] -= 1
+            if weights[i] > MIN_SLICE_PERCENT:
+                heapq.heappush(heap, (-weights[i], i))
+
+    return weights, binding, float(np.abs(weights - raw).sum())
+
+
+def solve_target_weights(pie_data: Dict[str, Any]) -> Dict[str, dict]:
+    """
+    Solve whole-percent target weights for every pie in the tree at once.
+
+    :param pie_data: Root pie node
+    :return: Dict keyed by pie path with `weights` (child name to int),
+        `binding` (names of constraints that were active) and `error`
+        (total absolute rounding error in percentage points)
+    :raises ValueError: If a pie has more slices than M1 allows
+    """
+    tree = PortfolioTree.from_dict(pie_data).rollup()
+    weights, report = _solve_tree_weights(tree)
+    children, bounds = tree.child_index()
+    for pie, entry in report.items():
+        kids = children[bounds[pie] : bounds[pie + 1]]
+        entry["weights"] = {tree.names[k]: int(weights[k]) for k in kids}
 
-    floored = {k: int(w) for k, w in raw_weights.items()}
-    remainder = 100 - sum(floored.values())
+    paths = tree.paths()
+    return {paths[pie]: entry for pie, entry in report.items()}
 
-    # Sort keys by fractional remainder descending
-    sorted_keys = sorted(
-        raw_weights.keys(),
-        key=lambda k: raw_weights[k] - floored[k],
-        reverse=True,
+
+def _solve_tree_weights(tree: PortfolioTree) -> tuple[np.ndarray, Dict[int, dict]]:
+    """
+    Round every pie's children to whole percents.
+
+    :param tree: Tree with rolled-up values.
+    :return: Integer weight per node (root is 100) and a per-pie report of
+        binding constraints and rounding error, keyed by pie index.
+    """
+    children, bounds = tree.child_index()
+    weights = np.zeros(len(tree), dtype=np.int64)
+    weights[0] = 100
+    report = {}
+    for pie in np.flatnonzero(tree.has_children()):
+        kids = children[bounds[pie] : bounds[pie + 1]]
+        try:
+            pie_weights, binding, error = round_pie_weights(
+                tree.values[kids].astype(np.float64)
+            )
+        except ValueError as e:
+            raise ValueError(f"{tree.paths()[pie]}: {e}") from e
+        weights[kids] = pie_weights
+        report[pie] = {"binding": binding, "error": error}
+        if binding:
+            logger.debug(f"Pie {tree.names[pie]} binding constraints: {binding}")
+    return weights, report
+
+
+def recalculate_tree_allocation(
+    pie_data: Dict[str, Any],
+    new_funds: Decimal = Decimal("50.0"),
+    new_ticker_count: int = 2,
+    percent_to_new: Decimal = Decimal("80"),
+    mock_depth: int = 1,
+) -> Dict[str, Any]:
+    """
+    Recalculate every pie level after adding funds and new mock tickers.
+
+    Unlike `recalculate_pie_allocation`, capital for existing positions is
+    pushed down to every ticker, so nested pies grow too. Mock tickers are
+    added to each pie at depth `mock_depth - 1` (1 means the root), splitting
+    the new-ticker capital by those pies' values. Every pie's children get
+    a whole-percent `target_weight` (see `round_pie_weights`). Runs as one
+    pass over a PortfolioTree.
+
+    :param pie_data: Root pie node
+    :param new_funds: Total new capital
+    :param new_ticker_count: Number of new mock tickers per host pie
+    :param percent_to_new: Percentage to be allocated to new tickers
+    :param mock_depth: Depth at which mock tickers are added
+    :return: Updated pie structure with values rounded to cents
+    """
+    logger.info("Starting hierarchical DCA allocation")
+    tree = PortfolioTree.from_dict(pie_data).rollup()
+    funds_to_new = new_funds * percent_to_new / Decimal(100)
+    funds_to_existing = new_funds - funds_to_new
+
+    total = int(tree.values[0])
+    if total > 0:
+        scale = 1 + float(funds_to_existing) * VALUE_SCALE / total
+        leaves = ~tree.has_children()
+        tree.values[leaves] = _round_to_cents(tree.values[leaves] * scale)
+    else:
+        logger.warning("Portfolio is empty; existing positions not scaled.")
+
+    if new_ticker_count > 0:
+        _add_tree_mock_targets(tree, new_ticker_count, funds_to_new, mock_depth)
+    else:
+        logger.warning("No new tickers to add; skipping mock target generation.")
+
+    tree.rollup().compute_weights()
+    target_weights, _ = _solve_tree_weights(tree)
+    for i in range(1, len(tree)):
+        tree.attrs[i]["target_weight"] = int(target_weights[i])
+
+    logger.info("Hierarchical recalculation complete")
+    return tree.to_dict()
+
+
+def _round_to_cents(units: np.ndarray) -> np.ndarray:
+    """Round micro-dollar amounts to whole cents."""
+    return (np.rint(units / CENT_UNITS) * CENT_UNITS).astype(np.int64)
+
+
+def _add_tree_mock_targets(
+    tree: PortfolioTree, count: int, funds: Decimal, mock_depth: int
+) -> None:
+    """Append equal-value mock tickers to every pie at `mock_depth - 1`."""
+    hosts = np.array([], dtype=np.intp)
+    if 1 <= mock_depth <= len(tree.levels):
+        level = tree.levels[mock_depth - 1]
+        hosts = level[tree.kind[level] == PIE]
+    if not len(hosts):
+        raise ValueError(f"No pies at mock depth {mock_depth}")
+
+    host_values = tree.values[hosts].astype(np.float64)
+    if host_values.sum() > 0:
+        shares = host_values / host_values.sum()
+    else:
+        shares = np.full(len(hosts), 1 / len(hosts))
+    per_ticker = _round_to_cents(shares * float(funds) * VALUE_SCALE / count)
+
+    children, bounds = tree.child_index()
+    names = [
+        name
+        for host in hosts
+        for name in mock_ticker_names(
+            (tree.names[k] for k in children[bounds[host] : bounds[host + 1]]), count
+        )
+    ]
+    tree.add_children(
+        np.repeat(hosts, count), names, "ticker", np.repeat(per_ticker, count)
     )
 
-    for k in sorted_keys[:remainder]:
-        floored[k] += 1
 
-    return floored
+def water_fill(values: np.ndarray, targets: np.ndarray, amount: float) -> np.ndarray:
+    """
+    Spend cash on the most underweight slots first, without selling.
+
+    Raises the lowest value/target ratios to a common level `L`, so each
+    buy is `max(0, target * L - value)`. Sorting dominates: O(n log n).
+
+    :param values: Current value per slot.
+    :param targets: Target weight per slot, on any positive scale.
+    :param amount: Cash to spend.
+    :return: Buy amount per slot, summing to `amount`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    buys = np.zeros(len(values))
+    funded = np.flatnonzero(targets > 0)
+    if amount <= 0 or not len(funded):
+        return buys
+
+    ratio = values[funded] / targets[funded]
+    order = np.argsort(ratio, kind="stable")
+    fill_levels = (amount + np.cumsum(values[funded][order])) / np.cumsum(
+        targets[funded][order]
+    )
+    # Slots below the water line form a prefix of the sorted order
+    count = np.count_nonzero(fill_levels >= ratio[order])
+    chosen = funded[order[:count]]
+    buys[chosen] = targets[chosen] * fill_levels[count - 1] - values[chosen]
+    return np.maximum(buys, 0)
+
+
+def allocate_buy_only(
+    pie_data: Dict[str, Any], new_funds: Decimal = Decimal("50.0")
+) -> Dict[str, Any]:
+    """
+    Spend a deposit to reduce drift from target weights, without selling.
+
+    At every pie, from the root down, the pie's share of the deposit is
+    water-filled into its most underweight children; sub-pies then split
+    their share the same way. Targets come from `target_weight` when every
+    child of a pie has one, otherwise from current weights (which makes the
+    buys proportional). A pie whose targets are all zero splits its share
+    by value, or equally when it holds nothing, so the whole deposit is
+    always spent.
+
+    :param pie_data: Root pie node
+    :param new_funds: Cash to deposit
+    :return: Updated pie structure with bought value added at every level
+    """
+    logger.info(f"Starting buy-only allocation of {new_funds}")
+    tree = PortfolioTree.from_dict(pie_data).rollup().compute_weights()
+    children, bounds = tree.child_index()
+    values = tree.dollar_values()
+    targets = target_shares(tree)
+    has_children = tree.has_children()
+
+    buys = np.zeros(len(tree))
+    buys[0] = float(new_funds)
+    for pie in np.flatnonzero(has_children):
+        kids = children[bounds[pie] : bounds[pie + 1]]
+        if buys[pie] > 0:
+            buys[kids] = water_fill(
+                values[kids], _fill_targets(targets, values, kids), buys[pie]
+            )
+
+    terminal = ~has_children
+    tree.values[terminal] += np.rint(buys[terminal] * VALUE_SCALE).astype(np.int64)
+    tree.rollup().compute_weights()
+    logger.info("Buy-only allocation complete")
+    return tree.to_dict()
+
+
+def _fill_targets(
+    targets: np.ndarray, values: np.ndarray, kids: np.ndarray
+) -> np.ndarray:
+    """
+    Targets to water-fill one pie's children with. When none has a positive
+    target, fall back to current values, then to an equal split, so the
+    pie's whole share of the deposit is still spent.
+    """
+    for candidate in (targets[kids], values[kids]):
+        if (candidate > 0).any():
+            return candidate
+    return _equal_shares(len(kids))
+
+
+def target_shares(tree: PortfolioTree) -> np.ndarray:
+    """
+    Per-node target share of its parent: `target_weight / 100` when every
+    sibling has a `target_weight`, otherwise the current weight.
+
+    :param tree: Tree with computed weights.
+    :return: Target share per node (root is 1).
+    """
+    target = np.array(
+        [float(a.get("target_weight", np.nan)) for a in tree.attrs], dtype=np.float64
+    )
+    missing = np.isnan(target[1:])
+    incomplete = np.bincount(tree.parent[1:], weights=missing, minlength=len(tree))
+    use_target = np.concatenate([[False], incomplete[tree.parent[1:]] == 0])
+    return np.where(use_target, target / 100, tree.weights)
+
+
+def target_leaf_factors(tree: PortfolioTree) -> np.ndarray:
+    """
+    Each node's target share of the whole portfolio: the product of
+    `target_shares` down its path. Terminal entries split a deposit.
+
+    :param tree: Tree with computed weights; they are left unchanged.
+    :return: Target factor per node.
+    """
+    return tree.leaf_factors(target_shares(tree))
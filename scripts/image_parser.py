@@ -2,86 +2,517 @@
 image_parser.py: Extract hybrid pie structures from M1 screenshots using GPT-4o Vision.
 
 Parses screenshots via the OpenAI Vision API and returns structured JSON identifying
-tickers and sub-pies. Encodes uploaded files to base64 PNG format for transmission.
+tickers and sub-pies. Uploads are cropped, downscaled and re-encoded by
+`image_preprocess` before being sent as base64.
+Several screenshots can be parsed concurrently through an asyncio pipeline.
 """
 
+import asyncio
+import hashlib
 import json
+import os
 import re
 from base64 import b64encode
 from datetime import datetime
-from io import BytesIO
+from functools import lru_cache
+from typing import Callable, Optional
 
-import openai
 import streamlit as st
-from PIL import Image
 
 from scripts.account import add_or_replace_portfolio
-from scripts.cookie_account import save_account_to_cookie
+from scripts.account_sync import mark_account_dirty, rerun
+from scripts.image_preprocess import (
+    MAX_LONG_EDGE,
+    MAX_PAYLOAD_BYTES,
+    MAX_TILE_ASPECT,
+    TILE_ASPECT,
+    preprocess_image,
+    split_tiles,
+)
 from scripts.log_util import app_logger
-from scripts.portfolio import normalize_portfolio, update_children
-from scripts.utils import file_hash
+from scripts.openai_pool import (
+    SingleFlight,
+    call_with_retries,
+    call_with_retries_async,
+    get_breaker,
+    get_client,
+    new_async_client,
+)
+from scripts.parse_cache import ParseCache
+from scripts.parser_backends import (
+    POLICIES,
+    BackendRouter,
+    LocalOCRBackend,
+    OpenAIBackend,
+    ReplayBackend,
+)
+from scripts.perceptual_hash import dhash, region_changed, value_region
+from scripts.portfolio import (
+    flush_portfolio_changes,
+    save_current_portfolio,
+    update_children,
+)
+from scripts.slice_stream import SliceStreamParser
+from scripts.uploaded_image import UploadedImage
 
 logger = app_logger(__name__)
 
+VISION_MODEL = "gpt-4o"
+VISION_PROMPT = (
+    "Return raw JSON with structure: {name: {type: 'pie' | 'ticker', value: float}}. "
+    "A 'pie' represents a folder-like container of tickers, often marked with a pie icon. "
+    "If the name shows a pie icon (and not a company logo), use type: 'pie'. "
+    "Use 'ticker' for any individual tradable security with a logo. "
+    "Do not include markdown or extra explanation—JSON only."
+)
+# Cached parses are only reused while the prompt, model and preprocessing
+# settings are unchanged.
+_PREPROCESS_SETTINGS = (MAX_LONG_EDGE, MAX_PAYLOAD_BYTES, MAX_TILE_ASPECT, TILE_ASPECT)
+PARSER_VERSION = hashlib.sha256(
+    f"{VISION_MODEL}\n{VISION_PROMPT}\n{_PREPROCESS_SETTINGS}".encode()
+).hexdigest()[:16]
+PARSE_CONCURRENCY = 4
+# Allowed relative gap between stitched slices and the pie total.
+STITCH_TOLERANCE = 0.01
+# How a multi-file upload is imported, see `handle_multi_image_upload`.
+MULTI_UPLOAD_MODES = {
+    "stitch": "Stitch into one pie (scrolled screenshots)",
+    "merge": "Merge each screenshot",
+}
+MAX_RESPONSE_TOKENS = 500
+# A response cut off at MAX_RESPONSE_TOKENS (a long pie that was not tiled)
+# is requested once more with the larger cap before it is reported.
+RESPONSE_TOKEN_CAPS = (MAX_RESPONSE_TOKENS, 4 * MAX_RESPONSE_TOKENS)
+
+
+class TruncatedResponse(ValueError):
+    """Raised when a Vision response is cut off even at the largest token cap."""
+
+
+# Concurrent parses of the same image, from any session, share one call.
+VISION_FLIGHTS = SingleFlight()
+
+
+def extract_hybrid_slices_from_image(
+    file,
+    api_key: str,
+    on_slice: Optional[Callable[[str, dict], None]] = None,
+    client=None,
+    policy: Optional[str] = None,
+) -> dict:
+    """
+    Extract structured JSON slices from a screenshot with the parser
+    backends chosen by `policy` (see `parser_backends.POLICIES`).
+
+    :param file: UploadedImage or uploaded image file
+    :param api_key: OpenAI API key
+    :param on_slice: Called with (name, entry) for each slice as it is found
+    :param client: Optional OpenAI-compatible client, e.g. a local stub
+    :param policy: Routing policy; defaults to the session's choice, else
+        'cloud'
+    :return: Dict containing ticker/pie metadata
+    """
+    logger.info(f"[{datetime.now().isoformat()}] Parsing hybrid pie from uploaded file")
+    router = _session_router(_session_policy(policy))
+    result = router.parse(
+        UploadedImage.wrap(file), api_key=api_key, on_slice=on_slice, client=client
+    )
+    logger.info(f"Parsed with '{result['backend']}' backend")
+    return result["slices"]
 
-def extract_hybrid_slices_from_image(file, api_key: str) -> dict:
+
+def _session_policy(policy: Optional[str] = None) -> str:
+    """Return `policy`, else the session's parser choice, else 'cloud'."""
+    return policy or st.session_state.get("parser_policy", "cloud")
+
+
+def _session_router(policy: str) -> BackendRouter:
+    """Return the shared router for a policy under the app's DATA_DIR."""
+    return get_parser_router(policy, st.session_state.get("DATA_DIR", "data"))
+
+
+def _parse_version(policy: str) -> str:
+    """
+    Cache version of parses made under a routing policy. Backends differ in
+    accuracy, so a parse is only reused under the policy that produced it.
+    """
+    return f"{PARSER_VERSION}:{policy}"
+
+
+@lru_cache(maxsize=None)
+def get_parser_router(policy: str, data_dir: str = "data") -> BackendRouter:
+    """
+    Return the shared router for a policy, so metrics accumulate per process.
+
+    :param policy: Key of `parser_backends.POLICIES`.
+    :param data_dir: App data directory; recordings live in its `replays`
+        folder.
+    :return: BackendRouter over the policy's backends.
+    """
+    openai_backend = OpenAIBackend(_extract_with_openai, extract_hybrid_slices_async)
+    replays = os.path.join(data_dir, "replays")
+    backends = {
+        "openai": openai_backend,
+        "local": LocalOCRBackend(),
+        "replay": ReplayBackend(replays),
+        "record": ReplayBackend(replays, inner=openai_backend),
+    }
+    return BackendRouter([backends[name] for name in POLICIES[policy]])
+
+
+def _extract_with_openai(
+    upload: UploadedImage,
+    api_key: Optional[str] = None,
+    on_slice: Optional[Callable[[str, dict], None]] = None,
+    client=None,
+) -> dict:
     """
     Send image to OpenAI Vision API and extract structured JSON slices.
+    Tall screenshots are split into tiles that are parsed in parallel.
 
-    :param file: Uploaded image file
+    :param upload: Screenshot to parse
     :param api_key: OpenAI API key
+    :param on_slice: Called with (name, entry) for each slice as it streams
+        in; tall screenshots report their merged slices at the end
+    :param client: Optional OpenAI-compatible client, e.g. a local stub
     :return: Dict containing ticker/pie metadata
     """
-    logger.info(f"[{datetime.now().isoformat()}] Parsing hybrid pie from uploaded file")
-    b64_img = _encode_image_to_base64(file)
-    prompt = _build_vision_prompt(b64_img)
-    raw_response = _call_openai_vision(prompt, api_key)
+    if len(split_tiles(upload.image)) > 1:
+        slices = asyncio.run(
+            _with_async_client(
+                api_key, None, lambda c: extract_hybrid_slices_async(upload, c)
+            )
+        )
+        for name, entry in slices.items() if on_slice else ():
+            on_slice(name, entry)
+        return slices
+    b64_img, mime = _encode_image_to_base64(upload)
+    prompt = _build_vision_prompt(b64_img, mime)
+    raw_response = _call_openai_vision(prompt, api_key, on_slice, client)
     return _clean_and_parse_response(raw_response)
 
 
-def _encode_image_to_base64(file) -> str:
-    """Convert image file to base64-encoded PNG string."""
-    image = Image.open(file).convert("RGB")
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    return b64encode(buffer.getvalue()).decode("utf-8")
+def _encode_image_to_base64(file) -> tuple[str, str]:
+    """Preprocess an image file and return it base64-encoded with its mime type."""
+    processed = preprocess_image(file)
+    return b64encode(processed["data"]).decode("utf-8"), processed["mime"]
 
 
-def _build_vision_prompt(b64_img: str) -> list:
+def _build_vision_prompt(b64_img: str, mime: str = "image/png") -> list:
     """Construct a vision-compatible prompt for GPT-4o."""
     return [
         {
             "role": "user",
             "content": [
-                {
-                    "type": "text",
-                    "text": (
-                        "Return raw JSON with structure: {name: {type: 'pie' | 'ticker', value: float}}. "
-                        "A 'pie' represents a folder-like container of tickers, often marked with a pie icon. "
-                        "If the name shows a pie icon (and not a company logo), use type: 'pie'. "
-                        "Use 'ticker' for any individual tradable security with a logo. "
-                        "Do not include markdown or extra explanation—JSON only."
-                    ),
-                },
+                {"type": "text", "text": VISION_PROMPT},
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{b64_img}"},
+                    "image_url": {"url": f"data:{mime};base64,{b64_img}"},
                 },
             ],
         }
     ]
 
 
-def _call_openai_vision(messages: list, api_key: str) -> str:
-    """Make a call to OpenAI GPT-4o with image+prompt and return raw response."""
-    openai.api_key = api_key
-    resp = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=messages,
-        max_tokens=500,
+def _call_openai_vision(
+    messages: list,
+    api_key: str,
+    on_slice: Optional[Callable[[str, dict], None]] = None,
+    client=None,
+) -> str:
+    """
+    Make a call to OpenAI GPT-4o with image+prompt and return raw response.
+    With `on_slice`, the completion is streamed and each slice is reported
+    as soon as its JSON entry closes; a retried or truncated attempt's
+    slices are reported again by the next attempt.
+
+    :raises TruncatedResponse: If the response is cut off at every cap in
+        RESPONSE_TOKEN_CAPS.
+    """
+    client = client or get_client(api_key)
+    breaker = get_breaker(client.api_key)
+    for max_tokens in RESPONSE_TOKEN_CAPS:
+        if on_slice is None:
+            resp = call_with_retries(
+                lambda: client.chat.completions.create(
+                    model=VISION_MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                ),
+                breaker,
+            )
+            text, truncated = _response_text(resp)
+        else:
+            text, truncated = _stream_vision(
+                client, breaker, messages, max_tokens, on_slice
+            )
+        if not truncated:
+            return text
+        _warn_truncated(max_tokens)
+    raise _truncated_error()
+
+
+def _stream_vision(
+    client, breaker, messages: list, max_tokens: int, on_slice
+) -> tuple[str, bool]:
+    """
+    Stream one completion, reporting slices; return (text, truncated).
+
+    Reading the stream is part of the retried, breaker-guarded call: a
+    response that breaks off mid-stream counts as a failure and is requested
+    again from the start with a fresh parser, reporting its slices again.
+    """
+
+    def attempt():
+        parser = SliceStreamParser()
+        truncated = False
+        with client.chat.completions.create(
+            model=VISION_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+        ) as stream:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                truncated = truncated or choice.finish_reason == "length"
+                for name, entry in parser.feed(choice.delta.content or ""):
+                    on_slice(name, entry)
+        return parser.text.strip(), truncated
+
+    return call_with_retries(attempt, breaker)
+
+
+def _response_text(resp) -> tuple[str, bool]:
+    """Return a completion's stripped text and whether it was truncated."""
+    choice = resp.choices[0]
+    content = choice.message.content
+    return (content.strip() if content else ""), choice.finish_reason == "length"
+
+
+def _warn_truncated(max_tokens: int) -> None:
+    """Log a truncated response that will be retried with a larger cap."""
+    if max_tokens < RESPONSE_TOKEN_CAPS[-1]:
+        logger.warning(f"Vision response hit {max_tokens} tokens; retrying")
+
+
+def _truncated_error() -> TruncatedResponse:
+    """Error for a response truncated at every cap."""
+    return TruncatedResponse(
+        f"Vision response was cut off at {RESPONSE_TOKEN_CAPS[-1]} tokens"
+    )
+
+
+async def extract_hybrid_slices_async(file, client) -> dict:
+    """
+    Async variant of `extract_hybrid_slices_from_image`. Tiles of a tall
+    screenshot are requested concurrently and merged.
+
+    :param file: UploadedImage or uploaded image file
+    :param client: Async OpenAI-compatible client (e.g. `openai.AsyncOpenAI`)
+    :return: Dict containing ticker/pie metadata
+    """
+    upload = UploadedImage.wrap(file)
+    tiles = await asyncio.to_thread(split_tiles, upload.image)
+    if len(tiles) == 1:
+        tiles = [upload]
+    else:
+        logger.info(f"Parsing tall screenshot as {len(tiles)} tiles")
+
+    async def parse_tile(tile):
+        b64_img, mime = await asyncio.to_thread(_encode_image_to_base64, tile)
+        for max_tokens in RESPONSE_TOKEN_CAPS:
+            resp = await call_with_retries_async(
+                lambda: client.chat.completions.create(
+                    model=VISION_MODEL,
+                    messages=_build_vision_prompt(b64_img, mime),
+                    max_tokens=max_tokens,
+                ),
+                get_breaker(client.api_key),
+            )
+            text, truncated = _response_text(resp)
+            if not truncated:
+                return _clean_and_parse_response(text)
+            _warn_truncated(max_tokens)
+        raise _truncated_error()
+
+    results = await asyncio.gather(*(parse_tile(tile) for tile in tiles))
+    return stitch_slices(results)
+
+
+def stitch_slices(tile_results: list) -> dict:
+    """
+    Merge slices parsed from overlapping tiles or scrolled screenshots of
+    one pie, top to bottom.
+
+    Rows in an overlap appear in two parts. A slice name is unique within a
+    pie, so entries with the same name are one row; when their values
+    disagree the first part's is kept. A row cut at an edge may come
+    back with a truncated name, so an entry with the same value whose name
+    is a prefix of one in the previous part is treated as the same row and
+    the longer name wins. Rows of the same part are never merged, so
+    slices such as VT and VTI with equal values stay apart.
+
+    :param tile_results: Raw slice dicts, one per tile or screenshot in order.
+    :return: Merged slice dict.
+    """
+    merged = {}
+    previous = {}
+    for slices in tile_results:
+        current = {}
+        for name, entry in slices.items():
+            match = name if name in merged else _matching_slice(previous, name, entry)
+            if match is None:
+                merged[name] = current[name] = entry
+                continue
+            if _slice_value(merged[match]) != _slice_value(entry):
+                logger.warning(
+                    f"Overlapping parts disagree on '{match}': "
+                    f"{merged[match].get('value')} vs {entry.get('value')}"
+                )
+            if len(name.strip()) > len(match.strip()):
+                merged[name] = merged.pop(match)
+                match = name
+            current[match] = merged[match]
+        previous = current
+    return merged
+
+
+def check_stitched_total(
+    slices: dict, expected_total: float, tolerance: float = STITCH_TOLERANCE
+) -> Optional[float]:
+    """
+    Compare the sum of stitched slice values with the pie total shown in M1.
+
+    :param slices: Stitched slice dict.
+    :param expected_total: Pie total from the app.
+    :param tolerance: Allowed relative difference.
+    :return: Stitched sum minus the total when outside tolerance, else None.
+    """
+    total = sum(_slice_value(entry) or 0.0 for entry in slices.values())
+    difference = round(total - expected_total, 2)
+    if abs(difference) > abs(expected_total) * tolerance:
+        return difference
+    return None
+
+
+def _matching_slice(candidates: dict, name: str, entry: dict) -> Optional[str]:
+    """
+    Find the candidate slice that is the same row as `name`, if any,
+    preferring an exact name over a truncated one.
+    """
+    key = name.strip().casefold()
+    for existing in candidates:
+        if existing.strip().casefold() == key:
+            return existing
+    value = _slice_value(entry)
+    for existing, existing_entry in candidates.items():
+        other = existing.strip().casefold()
+        if (
+            value is not None
+            and _slice_value(existing_entry) == value
+            and (other.startswith(key) or key.startswith(other))
+        ):
+            return existing
+    return None
+
+
+def _slice_value(entry: dict) -> Optional[float]:
+    """Slice value rounded to cents, or None if it is not numeric."""
+    try:
+        return round(
+            float(str(entry.get("value")).replace("$", "").replace(",", "")), 2
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+async def parse_images_async(
+    files: dict,
+    client,
+    concurrency: int = PARSE_CONCURRENCY,
+    on_result: Optional[Callable[[str, dict], None]] = None,
+    policy: Optional[str] = None,
+) -> dict:
+    """
+    Parse several screenshots concurrently with at most `concurrency`
+    parses in flight, each through the backends chosen by `policy`.
+    `on_result` is called as each parse completes.
+
+    :param files: Mapping of key (e.g. image hash) to image file
+    :param client: Async OpenAI-compatible client
+    :param concurrency: Maximum simultaneous parses
+    :param on_result: Callback receiving (key, cleaned slices) on success
+    :param policy: Routing policy; defaults to the session's choice, else
+        'cloud'
+    :return: Mapping of key to cleaned slices, or the exception raised
+    """
+    policy = _session_policy(policy)
+    router = _session_router(policy)
+    version = _parse_version(policy)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def route(file):
+        result = await router.parse_async(UploadedImage.wrap(file), client=client)
+        return result["slices"]
+
+    async def parse_one(key, file):
+        async with semaphore:
+            try:
+                raw = await VISION_FLIGHTS.do_async((key, version), lambda: route(file))
+                return key, _validate_parsed(clean_parsed_slices(raw))
+            except Exception as e:
+                logger.error(f"Failed to parse image {key}: {e}")
+                return key, e
+
+    results = {}
+    tasks = [parse_one(key, file) for key, file in files.items()]
+    for next_done in asyncio.as_completed(tasks):
+        key, parsed = await next_done
+        results[key] = parsed
+        if on_result and not isinstance(parsed, Exception):
+            on_result(key, parsed)
+    return results
+
+
+def parse_images(
+    files: dict,
+    api_key: str,
+    concurrency: int = PARSE_CONCURRENCY,
+    on_result: Optional[Callable[[str, dict], None]] = None,
+    client=None,
+    policy: Optional[str] = None,
+) -> dict:
+    """
+    Blocking wrapper around `parse_images_async` for the Streamlit thread.
+
+    :param files: Mapping of key (e.g. image hash) to image file
+    :param api_key: OpenAI API key, used when no client is given
+    :param concurrency: Maximum simultaneous parses
+    :param on_result: Callback receiving (key, cleaned slices) on success
+    :param client: Optional async client, e.g. one pointed at a fake server
+    :param policy: Routing policy; defaults to the session's choice
+    :return: Mapping of key to cleaned slices, or the exception raised
+    """
+    return asyncio.run(
+        _with_async_client(
+            api_key,
+            client,
+            lambda c: parse_images_async(files, c, concurrency, on_result, policy),
+        )
     )
-    content = resp.choices[0].message.content
-    return content.strip() if content else ""
+
+
+async def _with_async_client(api_key: str, client, run):
+    """
+    Await `run(client)`. Without a client, a new one is created for the
+    call and closed afterwards so its connections are not leaked.
+    """
+    if client is not None:
+        return await run(client)
+    async with new_async_client(api_key) as owned:
+        return await run(owned)
 
 
 def _clean_and_parse_response(raw: str) -> dict:
@@ -98,86 +529,273 @@ def handle_image_upload(img_file, reparse, portfolio, api_key):
     """
     Handle full image upload lifecycle: hashing, parsing, updating, persisting.
 
-    :param img_file: Uploaded image file
+    :param img_file: UploadedImage or uploaded image file
     :param reparse: Force reprocessing of cached image
     :param portfolio: Current in-memory portfolio dict
     :param api_key: OpenAI API key
     """
-    current_hash = _get_image_hash(img_file)
+    upload = UploadedImage.wrap(img_file)
+    current_hash = upload.sha256
 
     if st.session_state.get("current_image_hash") != current_hash:
         st.session_state["image_processed"] = False
         st.session_state["current_image_hash"] = current_hash
 
-    _show_uploaded_image(img_file)
+    _show_uploaded_image(upload)
 
     if "parsed_images" not in st.session_state:
         st.session_state["parsed_images"] = {}
 
+    live = st.empty()
+    streamed = {}
+
+    def show_slice(name, entry):
+        # Keyed by name: a retried response reports its slices again.
+        streamed[name] = {"Name": name, **entry}
+        live.dataframe(
+            list(streamed.values()), use_container_width=True, hide_index=True
+        )
+
     try:
-        parsed = _parse_and_cache_image(img_file, current_hash, api_key, reparse)
+        parsed = _parse_and_cache_image(
+            upload, current_hash, api_key, reparse, on_slice=show_slice
+        )
+    except TruncatedResponse as e:
+        logger.error(f"Failed to parse image: {e}")
+        st.error(
+            "The screenshot lists more slices than could be read in one go, so "
+            "some were cut off and nothing was imported. Upload it as several "
+            "scrolled screenshots instead."
+        )
+        return
     except Exception as e:
         logger.error(f"Failed to parse image: {e}")
         st.error("Failed to extract portfolio structure from image.")
         return
+    finally:
+        live.empty()
 
     if parsed and not st.session_state.get("image_processed"):
-        updated = update_children(portfolio, parsed)
-        normalized = normalize_portfolio(updated)
+        updated = update_children(portfolio, parsed, persist=False)
+        normalized = flush_portfolio_changes(updated)
         st.session_state["portfolio"] = normalized
 
         name = st.session_state.get("portfolio_file", normalized["name"])
         st.session_state["account"] = add_or_replace_portfolio(
             st.session_state["account"], name, normalized
         )
-        save_account_to_cookie(st.session_state["account"])
+        mark_account_dirty()
 
         st.session_state["image_processed"] = True
         st.success(f"Added/updated {len(parsed)} slices.")
-        st.rerun()
+        rerun()
 
 
-def _get_image_hash(file) -> str:
-    """Hash the uploaded file using SHA-256."""
-    file.seek(0)
-    return file_hash(file)
+def handle_multi_image_upload(
+    img_files,
+    reparse,
+    portfolio,
+    api_key,
+    expected_total: Optional[float] = None,
+    mode: str = "stitch",
+):
+    """
+    Batch-import several screenshots, then normalize and persist the
+    portfolio once.
 
+    In "stitch" mode the screenshots are scrolled parts of one pie: their
+    slices are stitched in upload order and checked against the pie total,
+    and nothing is imported if any screenshot fails. In "merge" mode each
+    screenshot is merged into the portfolio as soon as its parse completes,
+    and screenshots that fail are skipped.
 
-def _show_uploaded_image(file):
+    :param img_files: Uploaded image files, top of the pie first
+    :param reparse: Force reprocessing of cached images
+    :param portfolio: Current in-memory portfolio dict
+    :param api_key: OpenAI API key
+    :param expected_total: Pie total shown in M1, if known; stitch mode only
+    :param mode: One of MULTI_UPLOAD_MODES
+    """
+    if mode not in MULTI_UPLOAD_MODES:
+        raise ValueError(f"Unknown multi-upload mode: {mode}")
+    uploads = [UploadedImage.wrap(f) for f in img_files]
+    files = {upload.sha256: upload for upload in uploads}
+    batch_key = (mode, *files)
+    if st.session_state.get("processed_batch") == batch_key and not reparse:
+        return
+
+    progress = st.progress(0.0, text=f"Parsing {len(files)} screenshots...")
+    policy = _session_policy()
+    version = _parse_version(policy)
+    parsed_images = st.session_state.setdefault("parsed_images", {})
+    pending, parts = {}, {}
+
+    def finish(current_hash, parsed):
+        if mode == "merge":
+            update_children(portfolio, parsed, persist=False)
+        parts[current_hash] = parsed
+        progress.progress(len(parts) / len(files), text=f"Parsed {len(parts)}")
+
+    def on_result(current_hash, parsed):
+        parsed_images[(current_hash, version)] = parsed
+        _store_parse(pending[current_hash], current_hash, parsed, version)
+        finish(current_hash, parsed)
+
+    for current_hash, upload in files.items():
+        cached = None if reparse else _cached_parse(upload, current_hash, version)
+        if cached is None:
+            pending[current_hash] = upload
+        else:
+            finish(current_hash, cached)
+
+    results = (
+        parse_images(pending, api_key, on_result=on_result, policy=policy)
+        if pending
+        else {}
+    )
+    failed = [h for h, result in results.items() if isinstance(result, Exception)]
+    if mode == "merge":
+        if failed:
+            st.error(f"Failed to parse {len(failed)} of {len(files)} screenshots.")
+        message = f"Merged {len(parts)} of {len(files)} screenshots."
+    else:
+        if failed:
+            st.error(
+                f"Failed to parse {len(failed)} of {len(files)} screenshots; "
+                "nothing was imported."
+            )
+            return
+        stitched = stitch_slices([parts[h] for h in files])
+        if expected_total:
+            difference = check_stitched_total(stitched, expected_total)
+            if difference is not None:
+                st.warning(
+                    f"Stitched slices differ from the pie total by "
+                    f"${difference:,.2f}; a screenshot may be missing or misread."
+                )
+        update_children(portfolio, stitched, persist=False)
+        message = f"Imported {len(stitched)} slices from {len(files)} screenshots."
+
+    st.session_state["portfolio"] = flush_portfolio_changes(portfolio)
+    save_current_portfolio()
+    st.session_state["processed_batch"] = batch_key
+    st.success(message)
+    rerun()
+
+
+def _show_uploaded_image(upload: UploadedImage):
     """Render the uploaded image to the Streamlit UI."""
-    image = Image.open(file)
-    st.image(image, caption="Uploaded Image", use_container_width=True)
+    st.image(upload.image, caption="Uploaded Image", use_container_width=True)
 
 
-def _parse_and_cache_image(file, current_hash, api_key, reparse=False) -> dict:
+def _parse_and_cache_image(
+    file, current_hash, api_key, reparse=False, on_slice=None
+) -> dict:
     """
-    Parse image using OpenAI if not cached. Store and validate result.
+    Parse image using OpenAI unless the session or on-disk cache has it, or
+    a near-identical screenshot with the same values was parsed before.
+    Store and validate result.
 
-    :param file: Image file
+    :param file: UploadedImage or image file
     :param current_hash: SHA-256 hash for caching
     :param api_key: OpenAI API key
     :param reparse: Whether to force re-parse
+    :param on_slice: Called with each slice as a fresh parse streams in
     :return: Parsed slice dict
     """
-    if reparse or current_hash not in st.session_state["parsed_images"]:
-        file.seek(0)
-        raw = extract_hybrid_slices_from_image(file, api_key)
-        parsed = clean_parsed_slices(raw)
-        if not isinstance(parsed, dict) or not all(
-            isinstance(v, dict) and "type" in v and "value" in v
-            for v in parsed.values()
-        ):
-            raise ValueError("Parsed structure is invalid")
-        st.session_state["parsed_images"][current_hash] = parsed
+    upload = UploadedImage.wrap(file)
+    policy = _session_policy()
+    version = _parse_version(policy)
+    parsed = None if reparse else _cached_parse(upload, current_hash, version)
+    if parsed is None:
+        raw = VISION_FLIGHTS.do(
+            (current_hash, version),
+            lambda: extract_hybrid_slices_from_image(
+                upload, api_key, on_slice, policy=policy
+            ),
+        )
+        parsed = _validate_parsed(clean_parsed_slices(raw))
+        st.session_state["parsed_images"][(current_hash, version)] = parsed
+        _store_parse(upload, current_hash, parsed, version)
         if reparse:
             st.session_state["image_processed"] = False
         logger.info(f"Parsed slices (new): {parsed}")
     else:
-        parsed = st.session_state["parsed_images"][current_hash]
         logger.info(f"Parsed slices (cached): {parsed}")
     return parsed
 
 
+def _cached_parse(
+    upload: UploadedImage, current_hash: str, version: str
+) -> Optional[dict]:
+    """
+    Look up a parse made with `version` (see `_parse_version`) in the
+    session, then in the on-disk cache by exact hash, then by perceptual
+    near-duplicate.
+    """
+    parsed_images = st.session_state.setdefault("parsed_images", {})
+    if (current_hash, version) in parsed_images:
+        return parsed_images[(current_hash, version)]
+    parsed = get_parse_cache().get(current_hash, version)
+    if parsed is None:
+        parsed = _near_duplicate_parse(upload, version)
+        if parsed is not None:
+            _store_parse(upload, current_hash, parsed, version)
+    if parsed is not None:
+        parsed_images[(current_hash, version)] = parsed
+    return parsed
+
+
+def _near_duplicate_parse(upload: UploadedImage, version: str) -> Optional[dict]:
+    """
+    Reuse the parse of a near-identical cached screenshot whose value
+    column has not changed.
+    """
+    cache = get_parse_cache()
+    region = value_region(upload.image)
+    for _, image_hash, cached_region in cache.find_similar(
+        dhash(upload.image), version
+    ):
+        if region_changed(region, cached_region):
+            logger.info(f"Near-duplicate {image_hash[:12]} has changed values")
+            continue
+        parsed = cache.get(image_hash, version)
+        if parsed is not None:
+            logger.info(f"Reusing parse of near-duplicate {image_hash[:12]}")
+            return parsed
+    return None
+
+
+def _store_parse(
+    upload: UploadedImage, current_hash: str, parsed: dict, version: str
+) -> None:
+    """Save a parse and the image's perceptual fingerprint to the disk cache."""
+    cache = get_parse_cache()
+    cache.put(current_hash, version, parsed)
+    cache.add_fingerprint(
+        current_hash, version, dhash(upload.image), value_region(upload.image)
+    )
+
+
+def get_parse_cache() -> ParseCache:
+    """Return the shared parse cache under the app's DATA_DIR."""
+    return _open_parse_cache(st.session_state.get("DATA_DIR", "data"))
+
+
+@lru_cache(maxsize=None)
+def _open_parse_cache(data_dir: str) -> ParseCache:
+    return ParseCache(os.path.join(data_dir, "parse_cache.sqlite3"))
+
+
+def _validate_parsed(parsed: dict) -> dict:
+    """Raise ValueError unless every slice has a type and value."""
+    if not isinstance(parsed, dict) or not all(
+        isinstance(v, dict) and "type" in v and "value" in v for v in parsed.values()
+    ):
+        raise ValueError("Parsed structure is invalid")
+    return parsed
+
+
 def clean_parsed_slices(raw_slices: dict) -> dict:
     """
     Ensure all parsed slices from GPT include a valid 'type' field ('ticker' or 'pie').
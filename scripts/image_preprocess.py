@@ -0,0 +1,199 @@
+"""
+image_preprocess.py: Shrink screenshots before they are sent to the Vision API.
+
+Retina phone screenshots encoded as full-resolution PNG produce multi-megabyte
+payloads. The pipeline here crops to the holdings list, dropping the status
+bar, header and tab bar around it, downscales to a target long edge, and
+encodes as WebP or JPEG at the highest quality that fits a byte budget. Very tall
+screenshots are first split into overlapping tiles so each Vision response
+stays within its token limit and the text stays legible after downscaling.
+"""
+
+from io import BytesIO
+from typing import Any, Dict, List, Union
+
+import numpy as np
+from PIL import Image, features
+
+from scripts.log_util import app_logger
+from scripts.uploaded_image import UploadedImage
+
+logger = app_logger(__name__)
+
+MAX_LONG_EDGE = 1600
+MIN_LONG_EDGE = 512
+MAX_PAYLOAD_BYTES = 400 * 1024
+QUALITY_STEPS = (85, 75, 65, 55, 45)
+CROP_TOLERANCE = 12
+CROP_MARGIN = 8
+# Bands of content further apart than LIST_GAP of the image width belong to
+# separate blocks; the block with the most bands is taken as the list.
+LIST_GAP = 0.08
+MIN_LIST_BANDS = 3
+# Images taller than MAX_TILE_ASPECT widths are split into tiles of
+# TILE_ASPECT widths overlapping by TILE_OVERLAP of a tile.
+MAX_TILE_ASPECT = 2.5
+TILE_ASPECT = 2.0
+TILE_OVERLAP = 0.15
+
+MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+def preprocess_image(
+    upload: Union[UploadedImage, Image.Image, Any],
+    max_long_edge: int = MAX_LONG_EDGE,
+    max_bytes: int = MAX_PAYLOAD_BYTES,
+    crop: bool = True,
+) -> Dict[str, Any]:
+    """
+    Crop, downscale and re-encode an uploaded screenshot.
+
+    :param upload: UploadedImage, uploaded file, path, or an already decoded
+        image such as a tile from `split_tiles`.
+    :param max_long_edge: Longest side after downscaling, in pixels.
+    :param max_bytes: Byte budget for the encoded image.
+    :param crop: Crop to the holdings list, see `crop_to_holdings`.
+    :return: Dict with `data` (encoded bytes), `mime`, `size` (width,
+        height), `original_bytes` (raw pixel bytes for decoded images) and
+        `bytes`.
+    """
+    if isinstance(upload, Image.Image):
+        image = upload
+        original_bytes = image.width * image.height * len(image.getbands())
+    else:
+        upload = UploadedImage.wrap(upload)
+        image = upload.image
+        original_bytes = len(upload)
+    image = image.convert("RGB")
+    if crop:
+        image = crop_to_holdings(image)
+    image = _downscale(image, max_long_edge)
+
+    data, fmt = _encode_within_budget(image, max_bytes)
+    while len(data) > max_bytes and max(image.size) > MIN_LONG_EDGE:
+        image = _downscale(image, int(max(image.size) * 0.8))
+        data, fmt = _encode_within_budget(image, max_bytes)
+
+    logger.info(
+        f"Preprocessed image {original_bytes} -> {len(data)} bytes "
+        f"({fmt}, {image.size[0]}x{image.size[1]})"
+    )
+    return {
+        "data": data,
+        "mime": MIME_TYPES[fmt],
+        "size": image.size,
+        "original_bytes": original_bytes,
+        "bytes": len(data),
+    }
+
+
+def crop_to_holdings(image: Image.Image) -> Image.Image:
+    """
+    Crop to the holdings list. The list is a run of evenly spaced rows, while
+    the status bar, header and tab bar are set apart by wider gaps, so
+    horizontal bands of content are grouped wherever the gap between them is
+    under `LIST_GAP` of the width and the group with the most bands is kept.
+    Falls back to `crop_to_content` when no group has `MIN_LIST_BANDS` bands.
+
+    :param image: RGB or grayscale image.
+    :return: Cropped image.
+    """
+    rows = _content_mask(image).any(axis=1).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], rows, [0]])))
+    starts, ends = edges[::2], edges[1::2]
+    gaps = starts[1:] - ends[:-1]
+    breaks = np.flatnonzero(gaps > image.width * LIST_GAP) + 1
+    block = max(np.split(np.arange(len(starts)), breaks), key=len)
+    if len(block) < MIN_LIST_BANDS:
+        return crop_to_content(image)
+
+    top = max(int(starts[block[0]]) - CROP_MARGIN, 0)
+    bottom = min(int(ends[block[-1]]) + CROP_MARGIN, image.height)
+    return crop_to_content(image.crop((0, top, image.width, bottom)))
+
+
+def crop_to_content(image: Image.Image) -> Image.Image:
+    """
+    Trim rows and columns at the edges that match the background colour,
+    taken from the top-left pixel, leaving a small margin.
+
+    :param image: RGB or grayscale image.
+    :return: Cropped image, or the original if it is uniform.
+    """
+    differs = _content_mask(image)
+    rows = np.flatnonzero(differs.any(axis=1))
+    cols = np.flatnonzero(differs.any(axis=0))
+    if not len(rows):
+        return image
+
+    height, width = differs.shape
+    box = (
+        max(int(cols[0]) - CROP_MARGIN, 0),
+        max(int(rows[0]) - CROP_MARGIN, 0),
+        min(int(cols[-1]) + CROP_MARGIN + 1, width),
+        min(int(rows[-1]) + CROP_MARGIN + 1, height),
+    )
+    return image.crop(box)
+
+
+def split_tiles(
+    image: Image.Image,
+    max_aspect: float = MAX_TILE_ASPECT,
+    tile_aspect: float = TILE_ASPECT,
+    overlap: float = TILE_OVERLAP,
+) -> List[Image.Image]:
+    """
+    Split a tall image into full-width horizontal tiles that overlap, so a
+    row cut at one tile's edge appears whole in the next.
+
+    :param image: Screenshot.
+    :param max_aspect: Height/width ratio above which the image is tiled.
+    :param tile_aspect: Height/width ratio of each tile.
+    :param overlap: Fraction of a tile shared with the next one.
+    :return: Tiles top to bottom; the image itself when it is not tall.
+    """
+    if image.height <= image.width * max_aspect:
+        return [image]
+
+    tile_height = int(image.width * tile_aspect)
+    step = max(int(tile_height * (1 - overlap)), 1)
+    tops = list(range(0, image.height - tile_height, step))
+    tops.append(image.height - tile_height)
+    return [image.crop((0, top, image.width, top + tile_height)) for top in tops]
+
+
+def _content_mask(image: Image.Image) -> np.ndarray:
+    """Pixels that differ from the background colour of the top-left pixel."""
+    pixels = np.asarray(image, dtype=np.int16)
+    differs = np.abs(pixels - pixels[0, 0]) > CROP_TOLERANCE
+    return differs.any(axis=2) if differs.ndim == 3 else differs
+
+
+def _downscale(image: Image.Image, max_long_edge: int) -> Image.Image:
+    """Resize so the longest side is at most `max_long_edge`."""
+    scale = max_long_edge / max(image.size)
+    if scale >= 1:
+        return image
+    size = (max(round(image.width * scale), 1), max(round(image.height * scale), 1))
+    return image.resize(size, Image.LANCZOS)
+
+
+def _encode_within_budget(image: Image.Image, max_bytes: int) -> tuple[bytes, str]:
+    """
+    Encode at the highest quality that fits the budget, preferring WebP
+    when Pillow supports it. Returns the smallest encoding if none fits.
+    """
+    formats = ["JPEG"]
+    if features.check("webp"):
+        formats.insert(0, "WEBP")
+    smallest = None
+    for quality in QUALITY_STEPS:
+        for fmt in formats:
+            buffer = BytesIO()
+            image.save(buffer, format=fmt, quality=quality)
+            data = buffer.getvalue()
+            if len(data) <= max_bytes:
+                return data, fmt
+            if smallest is None or len(data) < len(smallest[0]):
+                smallest = (data, fmt)
+    return smallest
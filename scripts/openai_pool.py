@@ -0,0 +1,277 @@
+"""
+openai_pool.py: Shared OpenAI clients with retries, a circuit breaker and
+single-flight request coalescing.
+
+Streamlit serves every session from one process, so Vision calls go through
+one pooled client per API key (keep-alive connections, explicit timeouts)
+instead of the module-global `openai.api_key`. Transient failures are retried
+with full-jitter exponential backoff; repeated failures open a per-key circuit
+breaker so a dead endpoint fails fast; and concurrent parses of the same image
+share one in-flight call.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+import httpx
+import openai
+
+from scripts.log_util import app_logger
+
+logger = app_logger(__name__)
+
+REQUEST_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+CONNECTION_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+MAX_ATTEMPTS = 3
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    # A streamed response can break off after the request succeeded.
+    httpx.TransportError,
+)
+
+_clients: Dict[str, openai.OpenAI] = {}
+_breakers: Dict[str, "CircuitBreaker"] = {}
+_pool_lock = threading.Lock()
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is refused because the circuit breaker is open."""
+
+
+def get_client(api_key: str) -> openai.OpenAI:
+    """
+    Return the pooled client for an API key, creating it on first use.
+
+    :param api_key: OpenAI API key.
+    :return: Client with keep-alive connections and request timeouts.
+    """
+    with _pool_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = openai.OpenAI(
+                api_key=api_key,
+                timeout=REQUEST_TIMEOUT,
+                max_retries=0,
+                http_client=httpx.Client(
+                    timeout=REQUEST_TIMEOUT, limits=CONNECTION_LIMITS
+                ),
+            )
+            _clients[api_key] = client
+        return client
+
+
+def new_async_client(api_key: str) -> openai.AsyncOpenAI:
+    """
+    Create an async client with the pool's timeouts and limits. Async
+    connections are bound to their event loop, so one is made per batch
+    rather than pooled.
+
+    :param api_key: OpenAI API key.
+    :return: Async client; retries are handled by `call_with_retries_async`.
+    """
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        timeout=REQUEST_TIMEOUT,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT, limits=CONNECTION_LIMITS
+        ),
+    )
+
+
+def get_breaker(api_key: str) -> "CircuitBreaker":
+    """Return the circuit breaker shared by all calls made with an API key."""
+    with _pool_lock:
+        return _breakers.setdefault(api_key, CircuitBreaker())
+
+
+class CircuitBreaker:
+    """
+    Closed: calls pass. After `failure_threshold` consecutive failures it
+    opens and refuses calls for `reset_timeout` seconds, then lets one trial
+    call through (half-open); success closes it, failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half-open'."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may proceed now."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise CircuitOpenError("Vision API circuit is open; try again shortly")
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self) -> None:
+        """Close the circuit and reset the failure count."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        """
+        End a call that neither succeeded nor failed transiently, e.g. a
+        rejected request or a cancellation, letting the next call be the
+        half-open trial.
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Count a failure; open (or re-open) the circuit past the threshold."""
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Opening circuit after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given zero-based retry."""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt))
+
+
+def call_with_retries(
+    func: Callable[[], Any], breaker: CircuitBreaker, attempts: int = MAX_ATTEMPTS
+) -> Any:
+    """
+    Call `func`, retrying transient OpenAI errors with jittered backoff.
+
+    :param func: Zero-argument callable making one request.
+    :param breaker: Circuit breaker guarding the endpoint.
+    :param attempts: Maximum number of calls.
+    :return: Whatever `func` returns.
+    """
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            result = func()
+        except RETRYABLE_ERRORS as e:
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Vision call failed ({e}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+        except BaseException:
+            breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+async def call_with_retries_async(
+    func: Callable[[], Any], breaker: CircuitBreaker, attempts: int = MAX_ATTEMPTS
+) -> Any:
+    """Async variant of `call_with_retries`; `func` returns an awaitable."""
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            result = await func()
+        except RETRYABLE_ERRORS as e:
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Vision call failed ({e}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        except BaseException:
+            breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run `func` unless a call for `key` is already in flight, in which
+        case wait for and return (or raise) that call's outcome.
+
+        :param key: Coalescing key, e.g. an image hash.
+        :param func: Zero-argument callable.
+        :return: Result of the single execution.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            logger.info(f"Joining in-flight call for {str(key)[:12]}")
+            return future.result()
+
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    async def do_async(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Async variant of `do`: `func` returns an awaitable. Sync and async
+        callers share the same in-flight calls.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            logger.info(f"Joining in-flight call for {str(key)[:12]}")
+            return await asyncio.wrap_future(future)
+
+        try:
+            future.set_result(await func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
@@ -0,0 +1,128 @@
+"""
+orders.py: Turn allocated dollar amounts into executable buy orders.
+
+Drops buys below the minimum trade size, redistributes their capital over the
+remaining tickers, and rounds to cents so the orders sum exactly to the
+deposit. Rounds in integer cents with NumPy so it stays fast for thousands of
+tickers.
+"""
+
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from scripts.log_util import app_logger
+from scripts.portfolio import VALUE_SCALE, PortfolioTree
+
+logger = app_logger(__name__)
+
+MIN_TRADE = Decimal("1.00")
+CENT = Decimal("0.01")
+
+
+def generate_orders(
+    allocations: Dict[str, Decimal],
+    deposit: Optional[Decimal] = None,
+    min_trade: Decimal = MIN_TRADE,
+) -> list[dict]:
+    """
+    Build a flat list of buy orders from allocated amounts.
+
+    Greedy pass: with amounts sorted ascending, drop the smallest k buys,
+    where k is the first count at which every remaining buy, scaled up to
+    absorb the dropped capital, reaches `min_trade`. Remaining amounts are
+    rounded down to cents and leftover cents go to the largest fractions.
+
+    :param allocations: Mapping from ticker to allocated capital.
+    :param deposit: Total to spend; defaults to the allocations' sum
+        rounded to cents.
+    :param min_trade: Smallest allowed buy.
+    :return: List of {"ticker": str, "amount": Decimal} in input order.
+    """
+    tickers = list(allocations)
+    amounts = np.array([max(float(v), 0.0) for v in allocations.values()])
+    if deposit is None:
+        deposit = Decimal(str(sum(allocations.values()))).quantize(CENT)
+    deposit_cents = int(deposit / CENT)
+    min_cents = int(min_trade / CENT)
+
+    if deposit_cents < min_cents or not amounts.any():
+        logger.warning(f"Deposit {deposit} is below the minimum trade size.")
+        return []
+
+    keep = _keep_mask(amounts, deposit_cents, min_cents)
+    scaled = amounts[keep] / amounts[keep].sum() * deposit_cents
+    cents = _round_to_total(scaled, deposit_cents)
+
+    dropped = len(tickers) - int(keep.sum())
+    if dropped:
+        logger.info(f"Redistributed {dropped} buys below {min_trade}")
+    kept = np.flatnonzero(keep)
+    return [
+        {"ticker": tickers[i], "amount": Decimal(int(c)) * CENT}
+        for i, c in zip(kept, cents)
+        if c > 0
+    ]
+
+
+def _keep_mask(amounts: np.ndarray, deposit_cents: int, min_cents: int) -> np.ndarray:
+    """Mark the buys that stay above the minimum once small ones are dropped."""
+    order = np.argsort(amounts, kind="stable")
+    ascending = amounts[order]
+    # Total still kept after dropping the k smallest, for k = 0..n-1
+    kept_totals = ascending.sum() - np.concatenate([[0.0], np.cumsum(ascending)[:-1]])
+    smallest_scaled = ascending / kept_totals * deposit_cents
+    # Scaling is monotone in k, so the first passing k is the answer
+    first = int(np.argmax(smallest_scaled >= min_cents))
+
+    keep = np.zeros(len(amounts), dtype=bool)
+    keep[order[first:]] = True
+    return keep
+
+
+def _round_to_total(amounts: np.ndarray, total: int) -> np.ndarray:
+    """Round down to integers, then give leftover units to the largest fractions."""
+    floored = np.floor(amounts).astype(np.int64)
+    leftover = total - int(floored.sum())
+    if leftover > 0:
+        floored[np.argpartition(floored - amounts, leftover - 1)[:leftover]] += 1
+    return floored
+
+
+def allocations_from_adjustment(
+    original: Dict[str, Any], adjusted: Dict[str, Any]
+) -> Dict[str, Decimal]:
+    """
+    Compute capital bought per ticker between two versions of a pie, e.g.
+    the input and output of `recalculate_pie_allocation`.
+
+    When a pie grew by more than its children did (root-only allocation
+    scales sub-pie totals but not their tickers), the difference is pushed
+    down to the children by their current shares, top-down. Tickers are
+    keyed by `id`, falling back to the slice name; decreases are ignored.
+
+    :param original: Pie before allocation.
+    :param adjusted: Pie after allocation.
+    :return: Mapping from ticker to capital allocated.
+    """
+    before = PortfolioTree.from_dict(original)
+    before_units = dict(zip(before.paths(), before.values))
+    tree = PortfolioTree.from_dict(adjusted).compute_weights()
+    delta = tree.values - np.array(
+        [before_units.get(path, 0) for path in tree.paths()], dtype=np.int64
+    )
+
+    children, bounds = tree.child_index()
+    for pie in np.flatnonzero(tree.has_children()):
+        kids = children[bounds[pie] : bounds[pie + 1]]
+        residual = delta[pie] - delta[kids].sum()
+        if residual > 0:
+            delta[kids] += np.rint(residual * tree.weights[kids]).astype(np.int64)
+
+    allocations = {}
+    for i in tree.leaf_indices():
+        if delta[i] > 0:
+            key = tree.attrs[i].get("id", tree.names[i])
+            allocations[key] = allocations.get(key, 0) + int(delta[i])
+    return {key: Decimal(units) / VALUE_SCALE for key, units in allocations.items()}
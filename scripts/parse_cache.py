@@ -0,0 +1,279 @@
+"""
+parse_cache.py: Persistent content-addressed cache of parsed screenshots.
+
+Parsed slices are stored in a SQLite file keyed by the image's SHA-256 and the
+parser version (prompt and model), so a screenshot parsed in any session is not
+sent to the Vision API again until the prompt changes. Entries expire after a
+TTL and the least recently used are evicted once the cache exceeds its size
+budget. Perceptual fingerprints of cached images are kept alongside so
+near-identical re-screenshots can reuse a parse (see `perceptual_hash`).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+from scripts.log_util import app_logger
+from scripts.perceptual_hash import MAX_HAMMING_DISTANCE, HammingIndex
+
+logger = app_logger(__name__)
+
+MAX_CACHE_BYTES = 16 * 1024 * 1024
+CACHE_TTL_SECONDS = 90 * 24 * 60 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parses (
+    image_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (image_hash, version)
+);
+CREATE INDEX IF NOT EXISTS parses_accessed ON parses (accessed);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    image_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    dhash TEXT NOT NULL,
+    region BLOB NOT NULL,
+    PRIMARY KEY (image_hash, version)
+);
+"""
+_ORPHAN_FINGERPRINT = (
+    "NOT EXISTS (SELECT 1 FROM parses "
+    "WHERE parses.image_hash = fingerprints.image_hash "
+    "AND parses.version = fingerprints.version)"
+)
+
+
+class ParseCache:
+    """SQLite-backed parse cache with size-based LRU eviction and a TTL."""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = MAX_CACHE_BYTES,
+        ttl: float = CACHE_TTL_SECONDS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        # The cache is shared between sessions: the lock guards the counters
+        # and keeps the fingerprints table and its in-memory index in step.
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per call keeps the cache safe to share
+        # between Streamlit's script threads.
+        return closing(sqlite3.connect(self.path, timeout=5, isolation_level=None))
+
+    def get(self, image_hash: str, version: str) -> Optional[Dict[str, Any]]:
+        """
+        Return cached slices for an image, or None on a miss or expiry.
+
+        :param image_hash: SHA-256 of the image bytes.
+        :param version: Parser version the result must come from.
+        :return: Parsed slice dict or None.
+        """
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT payload, created FROM parses "
+                    "WHERE image_hash = ? AND version = ?",
+                    (image_hash, version),
+                ).fetchone()
+                if row and now - row[1] > self.ttl:
+                    conn.execute(
+                        "DELETE FROM parses WHERE image_hash = ? AND version = ?",
+                        (image_hash, version),
+                    )
+                    self._drop_orphan_fingerprints(conn)
+                    row = None
+                if row:
+                    conn.execute(
+                        "UPDATE parses SET accessed = ? "
+                        "WHERE image_hash = ? AND version = ?",
+                        (now, image_hash, version),
+                    )
+        except sqlite3.Error as e:
+            logger.error(f"Parse cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return json.loads(row[0]) if row else None
+
+    def put(self, image_hash: str, version: str, parsed: Dict[str, Any]) -> None:
+        """
+        Store parsed slices for an image, then evict down to the size budget.
+
+        :param image_hash: SHA-256 of the image bytes.
+        :param version: Parser version that produced the result.
+        :param parsed: Parsed slice dict; must be JSON serializable.
+        """
+        payload = json.dumps(parsed, separators=(",", ":"))
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?, ?, ?)",
+                    (image_hash, version, payload, len(payload), now, now),
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.error(f"Parse cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop expired entries, then least recently used ones over budget."""
+        expired = conn.execute(
+            "DELETE FROM parses WHERE created < ?", (time.time() - self.ttl,)
+        ).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM parses").fetchone()[0]
+
+        evicted = 0
+        for image_hash, version, size in conn.execute(
+            "SELECT image_hash, version, size FROM parses ORDER BY accessed"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute(
+                "DELETE FROM parses WHERE image_hash = ? AND version = ?",
+                (image_hash, version),
+            )
+            total -= size
+            evicted += 1
+        if expired or evicted:
+            self._drop_orphan_fingerprints(conn)
+        if evicted:
+            logger.info(f"Evicted {evicted} parse cache entries")
+
+    def _drop_orphan_fingerprints(self, conn: sqlite3.Connection) -> None:
+        """
+        Delete fingerprints whose parse is gone, from disk and from the
+        in-memory index.
+        """
+        with self._lock:
+            orphans = conn.execute(
+                f"SELECT * FROM fingerprints WHERE {_ORPHAN_FINGERPRINT}"
+            ).fetchall()
+            # Delete only the rows read, so the index loses exactly what the
+            # table loses even while another session evicts.
+            conn.executemany(
+                "DELETE FROM fingerprints WHERE image_hash = ? AND version = ?",
+                [(image_hash, version) for image_hash, version, _, _ in orphans],
+            )
+            if self._index is not None:
+                for image_hash, version, hex_hash, region in orphans:
+                    key = (image_hash, version, region)
+                    self._index.remove(int(hex_hash, 16), key)
+
+    def add_fingerprint(
+        self, image_hash: str, version: str, dhash: int, region: bytes
+    ) -> None:
+        """
+        Record an image's perceptual hash and value-region fingerprint, if its
+        parse is still cached.
+
+        :param image_hash: SHA-256 of the image bytes.
+        :param version: Parser version of the cached parse.
+        :param dhash: 64-bit difference hash of the whole image.
+        :param region: Value-region fingerprint from `value_region`.
+        """
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    previous = conn.execute(
+                        "SELECT dhash, region FROM fingerprints "
+                        "WHERE image_hash = ? AND version = ?",
+                        (image_hash, version),
+                    ).fetchone()
+                    # Skip parses already evicted by another session.
+                    added = conn.execute(
+                        "INSERT OR REPLACE INTO fingerprints "
+                        "SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM parses "
+                        "WHERE image_hash = ? AND version = ?)",
+                        (image_hash, version, f"{dhash:016x}", region)
+                        + (image_hash, version),
+                    ).rowcount
+            except sqlite3.Error as e:
+                logger.error(f"Parse cache fingerprint write failed: {e}")
+                return
+            if not added:
+                return
+            if self._index is not None:
+                if previous:
+                    self._index.remove(
+                        int(previous[0], 16), (image_hash, version, previous[1])
+                    )
+                self._index.add(dhash, (image_hash, version, region))
+
+    def find_similar(
+        self, dhash: int, version: str, max_distance: int = MAX_HAMMING_DISTANCE
+    ) -> List[Tuple[int, str, bytes]]:
+        """
+        Find cached images whose perceptual hash is within `max_distance`.
+
+        The perceptual index is loaded from disk on first use and kept in memory.
+
+        :param dhash: Difference hash of the new image.
+        :param version: Parser version the cached parse must come from.
+        :param max_distance: Maximum Hamming distance.
+        :return: (distance, image_hash, region) tuples, nearest first.
+        """
+        with self._lock:
+            if self._index is None:
+                index = HammingIndex()
+                with self._connect() as conn:
+                    rows = conn.execute("SELECT * FROM fingerprints").fetchall()
+                for image_hash, row_version, hex_hash, region in rows:
+                    index.add(int(hex_hash, 16), (image_hash, row_version, region))
+                self._index = index
+            found = self._index.search(dhash, max_distance)
+        return [
+            (distance, image_hash, region)
+            for distance, (image_hash, row_version, region) in found
+            if row_version == version
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters, hit rate and on-disk size."""
+        with self._connect() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM parses"
+            ).fetchone()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters."""
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM parses")
+                conn.execute("DELETE FROM fingerprints")
+            self._index = None
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,364 @@
+"""
+parser_backends.py: Interchangeable screenshot parsers and the policy that
+routes between them.
+
+Every backend turns an `UploadedImage` into a parse result dict:
+`{"slices": {name: {type, value}}, "confidence": float, "backend": str}`.
+
+- `OpenAIBackend` wraps the GPT-4o Vision call.
+- `LocalOCRBackend` reads M1's fixed row layout (name left, dollar value
+  right) with Tesseract, offline and free, when `pytesseract` is installed.
+- `ReplayBackend` serves recorded parses from disk, or records another
+  backend's parses, for offline demos and reproducible tests.
+
+`BackendRouter` tries backends in policy order, falls through on errors or
+low confidence, and keeps latency, fallback and accuracy metrics per backend.
+Backends and the router also have async variants for batch parsing.
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from scripts.log_util import app_logger
+from scripts.uploaded_image import UploadedImage
+
+logger = app_logger(__name__)
+
+MIN_CONFIDENCE = 0.8
+POLICIES = {
+    "cloud": ["openai"],
+    "local-first": ["local", "openai"],
+    "local": ["local"],
+    "replay-first": ["replay", "openai"],
+    "record": ["record"],
+}
+
+_MONEY = re.compile(r"^\$?\d{1,3}(,\d{3})*(\.\d{2})$|^\$?\d+\.\d{2}$")
+_TICKER = re.compile(r"^[A-Z][A-Z.]{0,5}$")
+# OCR words that are never part of a slice name (percentages, arrows).
+_NOISE = re.compile(r"^([+-]?\d+(\.\d+)?%|[<>›»→↑↓▲▼•]+)$")
+
+
+class BackendUnavailable(RuntimeError):
+    """Raised when a backend cannot run here (missing dependency or data)."""
+
+
+class ParserBackend:
+    """Base class; subclasses implement `parse`."""
+
+    name = "base"
+
+    def parse(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        """
+        Parse a screenshot into slices.
+
+        :param upload: Screenshot to parse.
+        :param context: Backend-specific options, e.g. `api_key`, `on_slice`.
+        :return: Dict with `slices`, `confidence` (0-1) and `backend`.
+        """
+        raise NotImplementedError
+
+    async def parse_async(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        """Async variant of `parse`; runs `parse` in a worker thread."""
+        return await asyncio.to_thread(self.parse, upload, **context)
+
+
+class OpenAIBackend(ParserBackend):
+    """
+    GPT-4o Vision through parse functions supplied by `image_parser`; the
+    async one is awaited directly so batches share an async client.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        parse_func: Callable[..., dict],
+        parse_async_func: Optional[Callable[..., Awaitable[dict]]] = None,
+    ):
+        self.parse_func = parse_func
+        self.parse_async_func = parse_async_func
+
+    def parse(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        slices = self.parse_func(upload, **context)
+        return {"slices": slices, "confidence": 1.0, "backend": self.name}
+
+    async def parse_async(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        if self.parse_async_func is None:
+            return await super().parse_async(upload, **context)
+        slices = await self.parse_async_func(upload, **context)
+        return {"slices": slices, "confidence": 1.0, "backend": self.name}
+
+
+class LocalOCRBackend(ParserBackend):
+    """Offline Tesseract parser tuned to M1's one-slice-per-row layout."""
+
+    name = "local"
+
+    def parse(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        try:
+            import pytesseract
+        except ImportError as e:
+            raise BackendUnavailable("pytesseract is not installed") from e
+
+        image = upload.image.convert("L")
+        words = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+        slices, confidence = slices_from_ocr_words(words)
+        return {"slices": slices, "confidence": confidence, "backend": self.name}
+
+
+def slices_from_ocr_words(words: Dict[str, list]) -> tuple[dict, float]:
+    """
+    Turn Tesseract `image_to_data` output into slices.
+
+    Words are grouped into lines; a line holding a dollar amount becomes a
+    slice named by the words to its left. Names that look like ticker
+    symbols are typed 'ticker', other names 'pie'.
+
+    :param words: Dict of parallel lists with `text`, `conf`, `left`,
+        `block_num`, `par_num` and `line_num`.
+    :return: (slices, confidence), where confidence is the mean OCR
+        confidence of the words used, 0 when nothing was found.
+    """
+    lines = defaultdict(list)
+    for i, text in enumerate(words["text"]):
+        text = text.strip()
+        if text and float(words["conf"][i]) >= 0:
+            key = (words["block_num"][i], words["par_num"][i], words["line_num"][i])
+            lines[key].append((words["left"][i], text, float(words["conf"][i])))
+
+    slices, confidences = {}, []
+    for line in lines.values():
+        line.sort()
+        amounts = [i for i, (_, text, _) in enumerate(line) if _MONEY.match(text)]
+        if not amounts:
+            continue
+        name_words = [w for w in line[: amounts[0]] if not _NOISE.match(w[1])]
+        if not name_words:
+            continue
+        name = " ".join(text for _, text, _ in name_words)
+        value = float(line[amounts[0]][1].lstrip("$").replace(",", ""))
+        slices[name] = {
+            "type": "ticker" if _TICKER.match(name) else "pie",
+            "value": value,
+        }
+        confidences.extend(conf for _, _, conf in name_words + [line[amounts[0]]])
+
+    confidence = sum(confidences) / len(confidences) / 100 if confidences else 0.0
+    return slices, confidence
+
+
+class ReplayBackend(ParserBackend):
+    """
+    Serve recorded parses keyed by image SHA-256 from a directory. With an
+    `inner` backend it records that backend's results on a miss.
+    """
+
+    name = "replay"
+
+    def __init__(self, directory: str, inner: Optional[ParserBackend] = None):
+        self.directory = directory
+        self.inner = inner
+
+    def _path(self, upload: UploadedImage) -> str:
+        return os.path.join(self.directory, f"{upload.sha256}.json")
+
+    def parse(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        replayed = self._replay(upload)
+        if replayed is not None:
+            return replayed
+        result = self.inner.parse(upload, **context)
+        self._record(upload, result)
+        return result
+
+    async def parse_async(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        replayed = self._replay(upload)
+        if replayed is not None:
+            return replayed
+        result = await self.inner.parse_async(upload, **context)
+        self._record(upload, result)
+        return result
+
+    def _replay(self, upload: UploadedImage) -> Optional[Dict[str, Any]]:
+        """Return the recorded result, None if `inner` should record one."""
+        path = self._path(upload)
+        if os.path.exists(path):
+            with open(path) as f:
+                slices = json.load(f)
+            return {"slices": slices, "confidence": 1.0, "backend": self.name}
+        if self.inner is None:
+            raise BackendUnavailable(f"No recording for {upload.sha256[:12]}")
+        return None
+
+    def _record(self, upload: UploadedImage, result: Dict[str, Any]) -> None:
+        path = self._path(upload)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(result["slices"], f, indent=2)
+        logger.info(f"Recorded {result['backend']} parse to {path}")
+
+
+class BackendRouter:
+    """
+    Try backends in order; accept the first result at or above
+    `min_confidence`, falling back on errors and low confidence. The last
+    backend's result is accepted whatever its confidence.
+
+    When a low-confidence result is overridden, it is scored against the
+    accepted one, giving each backend an agreement-based accuracy. Metrics
+    are shared by every session using the router and kept under a lock.
+    """
+
+    def __init__(
+        self, backends: List[ParserBackend], min_confidence: float = MIN_CONFIDENCE
+    ):
+        self.backends = backends
+        self.min_confidence = min_confidence
+        self._metrics = defaultdict(
+            lambda: {
+                "calls": 0,
+                "errors": 0,
+                "fallbacks": 0,
+                "seconds": 0.0,
+                "scored": 0,
+                "agreement": 0.0,
+            }
+        )
+        self._lock = threading.Lock()
+
+    def parse(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        """
+        Parse with the first backend that succeeds confidently.
+
+        :param upload: Screenshot to parse.
+        :param context: Passed to every backend.
+        :return: Accepted parse result.
+        """
+        rejected, last_error = [], None
+        for backend in self.backends:
+            start = time.perf_counter()
+            try:
+                result = backend.parse(upload, **context)
+            except Exception as e:
+                last_error = self._record_error(backend, start, e)
+                continue
+            if self._accept(backend, start, result, rejected):
+                return result
+        return self._give_up(rejected, last_error)
+
+    async def parse_async(self, upload: UploadedImage, **context) -> Dict[str, Any]:
+        """Async variant of `parse`, awaiting each backend's `parse_async`."""
+        rejected, last_error = [], None
+        for backend in self.backends:
+            start = time.perf_counter()
+            try:
+                result = await backend.parse_async(upload, **context)
+            except Exception as e:
+                last_error = self._record_error(backend, start, e)
+                continue
+            if self._accept(backend, start, result, rejected):
+                return result
+        return self._give_up(rejected, last_error)
+
+    def _record_error(
+        self, backend: ParserBackend, start: float, error: Exception
+    ) -> Exception:
+        """Count a failed call and return its error."""
+        with self._lock:
+            stats = self._metrics[backend.name]
+            stats["calls"] += 1
+            stats["errors"] += 1
+            stats["seconds"] += time.perf_counter() - start
+        logger.warning(f"Parser backend '{backend.name}' failed: {error}")
+        return error
+
+    def _accept(
+        self,
+        backend: ParserBackend,
+        start: float,
+        result: Dict[str, Any],
+        rejected: List[Dict[str, Any]],
+    ) -> bool:
+        """
+        Count a completed call and decide whether its result is accepted.
+        A rejected result is appended to `rejected`; an accepted one is used
+        to score the results rejected before it.
+        """
+        final = backend is self.backends[-1]
+        fallback = result["confidence"] < self.min_confidence and not final
+        with self._lock:
+            stats = self._metrics[backend.name]
+            stats["calls"] += 1
+            stats["seconds"] += time.perf_counter() - start
+            if fallback:
+                stats["fallbacks"] += 1
+            else:
+                for low in rejected:
+                    self._score(low, result)
+        if fallback:
+            rejected.append(result)
+            logger.info(
+                f"Backend '{backend.name}' confidence {result['confidence']:.2f} "
+                "below threshold; falling back"
+            )
+        return not fallback
+
+    def _give_up(
+        self, rejected: List[Dict[str, Any]], last_error: Optional[Exception]
+    ) -> Dict[str, Any]:
+        """Return the last low-confidence result, or raise the last error."""
+        if rejected:
+            return rejected[-1]
+        raise last_error or BackendUnavailable("No parser backends configured")
+
+    def _score(self, candidate: Dict[str, Any], reference: Dict[str, Any]) -> None:
+        """
+        Record how many reference slices a rejected result got right.
+        Called with the metrics lock held.
+        """
+        expected = reference["slices"]
+        if not expected:
+            return
+        found = candidate["slices"]
+        correct = sum(
+            1
+            for name, entry in expected.items()
+            if name in found
+            and _same_value(found[name].get("value"), entry.get("value"))
+        )
+        stats = self._metrics[candidate["backend"]]
+        stats["scored"] += 1
+        stats["agreement"] += correct / len(expected)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return per-backend counters, mean latency in milliseconds and
+        accuracy (mean agreement with the accepted parse, None if unscored).
+        """
+        with self._lock:
+            snapshot = {name: dict(stats) for name, stats in self._metrics.items()}
+        report = {}
+        for name, stats in snapshot.items():
+            report[name] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "fallbacks": stats["fallbacks"],
+                "mean_latency_ms": 1000 * stats["seconds"] / stats["calls"],
+                "accuracy": (
+                    stats["agreement"] / stats["scored"] if stats["scored"] else None
+                ),
+            }
+        return report
+
+
+def _same_value(a, b) -> bool:
+    try:
+        return abs(float(a) - float(b)) < 0.005
+    except (TypeError, ValueError):
+        return False
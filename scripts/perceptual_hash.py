@@ -0,0 +1,166 @@
+"""
+perceptual_hash.py: Near-duplicate detection for re-taken screenshots.
+
+Re-screenshotting the same pie changes the SHA-256 (status bar clock,
+compression) but barely changes its layout. A 64-bit difference hash (dHash)
+finds such near-duplicates by Hamming distance through a multi-index hash
+table, and a small grayscale fingerprint of the value column decides whether
+any dollar amounts changed since the cached parse.
+"""
+
+from operator import itemgetter
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+MAX_HAMMING_DISTANCE = 4
+# Value column: right part of the screenshot below the status bar. The
+# thumbnail keeps enough detail that a single changed digit moves some cell
+# well past the tolerance, which in turn sits above JPEG recompression noise.
+VALUE_REGION = (0.55, 0.06, 1.0, 1.0)
+REGION_SIZE = (160, 640)
+REGION_TOLERANCE = 16
+
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """
+    Difference hash: compare horizontally adjacent pixels of a downscaled
+    grayscale image, one bit per comparison.
+
+    :param image: Image to hash.
+    :param hash_size: Grid size; the hash has hash_size**2 bits.
+    :return: Hash as an integer.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return (a ^ b).bit_count()
+
+
+def value_region(image: Image.Image) -> bytes:
+    """
+    Grayscale thumbnail of the value column, used to tell whether amounts
+    changed between two near-identical screenshots.
+
+    :param image: Screenshot.
+    :return: REGION_SIZE thumbnail as raw uint8 bytes.
+    """
+    left, top, right, bottom = VALUE_REGION
+    box = (
+        int(image.width * left),
+        int(image.height * top),
+        int(image.width * right),
+        int(image.height * bottom),
+    )
+    region = image.convert("L").crop(box).resize(REGION_SIZE, Image.BOX)
+    return region.tobytes()
+
+
+def region_changed(a: bytes, b: bytes, tolerance: int = REGION_TOLERANCE) -> bool:
+    """
+    True when any cell of two value-region thumbnails differs by more than
+    `tolerance` gray levels.
+    """
+    if len(a) != len(b):
+        return True
+    diff = np.abs(
+        np.frombuffer(a, dtype=np.uint8).astype(np.int16)
+        - np.frombuffer(b, dtype=np.uint8)
+    )
+    return bool(diff.max(initial=0) > tolerance)
+
+
+class HammingIndex:
+    """
+    Multi-index hash over fixed-width integer hashes. Each hash is split
+    into `max_distance + 1` chunks, each with its own exact-match table; by
+    the pigeonhole principle any hash within `max_distance` bits of a query
+    shares at least one chunk with it, so only those buckets are verified.
+    """
+
+    def __init__(
+        self,
+        bits: int = HASH_SIZE * HASH_SIZE,
+        max_distance: int = MAX_HAMMING_DISTANCE,
+    ):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        edges = [bits * i // chunks for i in range(chunks + 1)]
+        self._chunks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self._entries = []
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: int, value: Any) -> None:
+        """
+        Insert a hash with an associated value.
+
+        :param key: Perceptual hash.
+        :param value: Payload returned by `search`.
+        """
+        entry = len(self._entries)
+        self._entries.append((key, value))
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((key >> shift) & mask, []).append(entry)
+        self._size += 1
+
+    def remove(self, key: int, value: Any) -> bool:
+        """
+        Remove one stored hash with the given value.
+
+        :param key: Perceptual hash it was added with.
+        :param value: Payload it was added with.
+        :return: Whether a matching entry was found.
+        """
+        shift, mask = self._chunks[0]
+        for entry in self._tables[0].get((key >> shift) & mask, ()):
+            if self._entries[entry] == (key, value):
+                break
+        else:
+            return False
+
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            bucket = table[(key >> shift) & mask]
+            bucket.remove(entry)
+            if not bucket:
+                del table[(key >> shift) & mask]
+        self._entries[entry] = None
+        self._size -= 1
+        return True
+
+    def search(self, key: int, radius: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """
+        Find every stored hash within `radius` of `key`.
+
+        :param key: Query hash.
+        :param radius: Maximum Hamming distance, at most `max_distance`.
+        :return: (distance, value) pairs, nearest first.
+        """
+        radius = self.max_distance if radius is None else radius
+        if radius > self.max_distance:
+            raise ValueError(f"radius {radius} exceeds index limit {self.max_distance}")
+
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            candidates.update(table.get((key >> shift) & mask, ()))
+
+        found = []
+        for entry in candidates:
+            if self._entries[entry] is None:
+                continue
+            stored, value = self._entries[entry]
+            distance = (key ^ stored).bit_count()
+            if distance <= radius:
+                found.append((distance, value))
+        found.sort(key=itemgetter(0))
+        return found
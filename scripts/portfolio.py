@@ -1,61 +1,416 @@
 """portfolio.py: Portfolio data loading and normalization functions.
 
-Handles parsing of canonical JSON format and recursive weight normalization.
+Handles parsing of canonical JSON format and weight normalization. Whole-tree
+passes run on `PortfolioTree`, a flat array-backed view of the nested dicts.
 """
 
 import base64
 import os
-from decimal import Decimal
-from typing import Any, Dict
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, Iterator, Optional
 
+import numpy as np
 import streamlit as st
 
 from scripts.account import add_or_replace_portfolio
-from scripts.cookie_account import save_account_to_cookie
+from scripts.account_sync import mark_account_dirty, rerun
 from scripts.log_util import app_logger
 from scripts.sample_portfolios import EXAMPLE_PORTFOLIO
 
 logger = app_logger(__name__)
 
+NODE_TYPES = ("ticker", "pie")
+TICKER, PIE = 0, 1
+
+# Values are held as integer micro-dollars so pie sums stay exact. Digits
+# below a micro-dollar are rounded half up; only values the tree computes
+# (pie rollups, DCA updates) are rounded, untouched values keep their input.
+VALUE_SCALE = 10**6
+_DECIMAL_SCALE = Decimal(VALUE_SCALE)
+
+
+def _to_units(value: Any) -> int:
+    """
+    Convert a dollar value (Decimal, float, int or str) to micro-dollars,
+    rounding half up below one micro-dollar.
+    """
+    scaled = Decimal(str(value)) * _DECIMAL_SCALE
+    return int(scaled.to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _from_units(units: int) -> Decimal:
+    """Convert micro-dollars back to a Decimal dollar value."""
+    return Decimal(int(units)) / _DECIMAL_SCALE
+
+
+def _weight(units: int, total: int) -> Decimal:
+    """Exact Decimal share of `units` in `total` micro-dollars, 0 if empty."""
+    if total <= 0:
+        return Decimal("0")
+    return Decimal(int(units)) / Decimal(int(total))
+
+
+def _node_kind(node_type: Any, names: list[str], parent: list[int]) -> int:
+    """
+    Type code of the node just appended to `names`/`parent`.
+
+    :raises ValueError: If the type is not one of NODE_TYPES, naming the
+        node's path.
+    """
+    if node_type in NODE_TYPES:
+        return NODE_TYPES.index(node_type)
+    path, index = [], len(names) - 1
+    while index > 0:
+        path.append(names[index])
+        index = parent[index]
+    label = "/".join(reversed(path)) or names[0]
+    raise ValueError(
+        f"Unknown node type {node_type!r} at '{label}'; "
+        f"expected one of {', '.join(NODE_TYPES)}"
+    )
+
+
+def _iter_nodes(portfolio: Dict[str, Any]) -> Iterator[tuple]:
+    """
+    Walk a nested portfolio in pre-order without recursion.
+
+    :param portfolio: Portfolio root node.
+    :return: Iterator of (name, node, parent_index, depth) tuples.
+    """
+    stack = [(portfolio.get("name", ""), portfolio, -1, 0)]
+    index = 0
+    while stack:
+        name, node, parent, depth = stack.pop()
+        yield name, node, parent, depth
+        if node["type"] == "pie":
+            children = node.get("children") or {}
+            stack.extend(
+                (child_name, child, index, depth + 1)
+                for child_name, child in reversed(children.items())
+            )
+        index += 1
+
+
+class PortfolioTree:
+    """
+    Flat, array-backed view of a nested portfolio.
+
+    Nodes are stored with parallel arrays for parent index, depth, type code
+    and value (integer micro-dollars). A parent always precedes its children,
+    so whole-tree passes run level by level with NumPy instead of recursing
+    through dicts. Node 0 is the root.
+    """
+
+    def __init__(
+        self,
+        names: list[str],
+        parent: list[int],
+        depth: list[int],
+        kind: list[int],
+        values: list[int],
+        attrs: list[dict],
+    ):
+        self.names = names
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.depth = np.asarray(depth, dtype=np.int32)
+        self.kind = np.asarray(kind, dtype=np.int8)
+        self.values = np.asarray(values, dtype=np.int64)
+        self.attrs = attrs
+        self.weights = None
+        self._parent_totals = None
+        self._source_values = self.values.copy()
+        self._levels = None
+
+    @classmethod
+    def from_dict(cls, portfolio: Dict[str, Any]) -> "PortfolioTree":
+        """
+        Build a tree from the canonical nested dict format.
+
+        :param portfolio: Portfolio root node.
+        :return: PortfolioTree holding every node in pre-order.
+        """
+        names, parent, depth, kind, values, attrs = [], [], [], [], [], []
+        for name, node, parent_idx, level in _iter_nodes(portfolio):
+            names.append(name)
+            parent.append(parent_idx)
+            depth.append(level)
+            kind.append(_node_kind(node.get("type"), names, parent))
+            values.append(_to_units(node.get("value", 0)))
+            attrs.append({k: v for k, v in node.items() if k != "children"})
+        return cls(names, parent, depth, kind, values, attrs)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def levels(self) -> list[np.ndarray]:
+        """Node indices grouped by depth, root level first."""
+        if self._levels is None:
+            order = np.argsort(self.depth, kind="stable")
+            counts = np.bincount(self.depth)
+            self._levels = np.split(order, np.cumsum(counts)[:-1])
+        return self._levels
+
+    def paths(self) -> list[str]:
+        """
+        Return a '/'-joined path label per node, e.g. 'Urithiru/Windrunners'.
+        The root is labelled with its own name.
+        """
+        paths = [self.names[0]]
+        for i in range(1, len(self)):
+            parent = self.parent[i]
+            name = self.names[i]
+            paths.append(f"{paths[parent]}/{name}" if parent else name)
+        return paths
+
+    def dollar_values(self) -> np.ndarray:
+        """Return node values as float dollars."""
+        return self.values / VALUE_SCALE
+
+    def leaf_indices(self) -> np.ndarray:
+        """Return indices of all ticker nodes."""
+        return np.flatnonzero(self.kind == TICKER)
+
+    def child_index(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Group node indices by parent.
+
+        :return: (children, bounds) where the children of node i are
+            `children[bounds[i]:bounds[i + 1]]`, in original order.
+        """
+        children = np.argsort(self.parent[1:], kind="stable") + 1
+        bounds = np.searchsorted(self.parent[children], np.arange(len(self) + 1))
+        return children, bounds
+
+    def has_children(self) -> np.ndarray:
+        """Return a mask of nodes that have at least one child."""
+        return np.bincount(self.parent[1:], minlength=len(self)) > 0
+
+    def add_children(
+        self,
+        parents: np.ndarray,
+        names: list[str],
+        node_type: str,
+        values: np.ndarray,
+    ) -> None:
+        """
+        Append new nodes under existing parents. Appended nodes come after
+        their parents, so level passes and `to_dict` keep working.
+
+        :param parents: Parent index for each new node.
+        :param names: Name for each new node.
+        :param node_type: 'ticker' or 'pie' for all new nodes.
+        :param values: Value in micro-dollars for each new node.
+        """
+        parents = np.asarray(parents, dtype=np.int32)
+        values = np.asarray(values, dtype=np.int64)
+        self.names.extend(names)
+        self.parent = np.concatenate([self.parent, parents])
+        self.depth = np.concatenate([self.depth, self.depth[parents] + 1])
+        kind = np.full(len(names), NODE_TYPES.index(node_type), dtype=np.int8)
+        self.kind = np.concatenate([self.kind, kind])
+        self.values = np.concatenate([self.values, values])
+        self._source_values = np.concatenate([self._source_values, values])
+        self.attrs.extend({"type": node_type, "value": _from_units(v)} for v in values)
+        self.weights = None
+        self._levels = None
+
+    def rollup(self) -> "PortfolioTree":
+        """
+        Set each pie's value to the sum of its children, deepest level first.
+        Pies without children keep their own value.
+        """
+        size = len(self)
+        child_totals = np.zeros(size, dtype=np.int64)
+        has_children = self.has_children()
+        for level in reversed(self.levels):
+            summed = level[has_children[level]]
+            self.values[summed] = child_totals[summed]
+            if self.depth[level[0]] > 0:
+                np.add.at(child_totals, self.parent[level], self.values[level])
+        return self
+
+    def compute_weights(self) -> "PortfolioTree":
+        """
+        Compute each node's weight as its share of its siblings' total value.
+        Nodes whose siblings sum to zero get weight 0; the root gets 1.
+        """
+        size = len(self)
+        totals = np.zeros(size, dtype=np.int64)
+        np.add.at(totals, self.parent[1:], self.values[1:])
+        parent_totals = totals[self.parent[1:]]
+        weights = np.zeros(size, dtype=np.float64)
+        np.divide(
+            self.values[1:], parent_totals, out=weights[1:], where=parent_totals > 0
+        )
+        weights[0] = 1.0
+        self.weights = weights
+        self._parent_totals = np.concatenate([[0], parent_totals])
+        return self
+
+    def normalize(self) -> "PortfolioTree":
+        """Roll pie values up from their children, then recompute weights."""
+        return self.rollup().compute_weights()
+
+    def leaf_factors(self, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Return each node's share of the root, i.e. the product of weights on
+        its path. Ticker entries are the DCA allocation factors.
+
+        :param weights: Per-node share of its parent to use instead of the
+            tree's current weights, e.g. target shares.
+        :return: Factor per node (root is 1).
+        """
+        if weights is None:
+            if self.weights is None:
+                self.compute_weights()
+            weights = self.weights
+        factors = np.ones(len(self), dtype=np.float64)
+        for level in self.levels[1:]:
+            factors[level] = factors[self.parent[level]] * weights[level]
+        return factors
+
+    def _node_dict(self, index: int, changed: bool) -> Dict[str, Any]:
+        """Build the dict fields of a single node, without children."""
+        node = dict(self.attrs[index])
+        node["type"] = NODE_TYPES[self.kind[index]]
+        if changed:
+            node["value"] = _from_units(self.values[index])
+        if self.weights is not None and index > 0:
+            node["weight"] = self._decimal_weight(index)
+        return node
+
+    def _decimal_weight(self, index: int) -> Decimal:
+        """Weight of a node as an exact Decimal, for writing to dicts."""
+        return _weight(self.values[index], self._parent_totals[index])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert back to the canonical nested dict format. Values that were
+        not changed keep their original objects, so an unmodified round trip
+        is lossless.
+
+        :return: New nested portfolio dict.
+        """
+        changed = self.values != self._source_values
+        nodes = []
+        for i in range(len(self)):
+            node = self._node_dict(i, changed[i])
+            if self.kind[i] == PIE:
+                node["children"] = {}
+            if i > 0:
+                nodes[self.parent[i]]["children"][self.names[i]] = node
+            nodes.append(node)
+        return nodes[0]
+
+    def write_to(self, portfolio: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Write values and weights back into the dict the tree was built from.
+
+        :param portfolio: The same portfolio passed to `from_dict`.
+        :return: The updated portfolio.
+        """
+        changed = self.values != self._source_values
+        for i, (_, node, _, _) in enumerate(_iter_nodes(portfolio)):
+            if node["type"] == "pie":
+                node.setdefault("children", {})
+            if changed[i]:
+                node["value"] = _from_units(self.values[i])
+            if self.weights is not None and i > 0:
+                node["weight"] = self._decimal_weight(i)
+        return portfolio
+
 
 def normalize_portfolio(portfolio: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Recalculate and inject weight values for all child nodes recursively
-    based on their `value`. Also updates each pie node's `value` to the
-    sum of its children. Uses Decimal for precision.
+    Recalculate and inject weight values for all child nodes based on their
+    `value`. Also updates each pie node's `value` to the sum of its children.
+    Runs as level-by-level passes over a `PortfolioTree`.
 
     :param portfolio: Portfolio root node.
     :return: Portfolio with updated weights and values.
     """
     logger.info("Normalizing portfolio weights")
+    tree = PortfolioTree.from_dict(portfolio).normalize()
+    return tree.write_to(portfolio)
 
-    def recurse(node: Dict[str, Any]) -> Dict[str, Any]:
-        if node["type"] == "ticker":
-            return node
-        if "children" not in node:
-            node["children"] = {}
 
-        total = sum(
-            Decimal(child.get("value", "0")) for child in node["children"].values()
-        )
-        if node["children"]:
-            node["value"] = total  # Only recalculate if children exist
+def _normalize_pie_level(node: Dict[str, Any]) -> None:
+    """
+    Re-sum one pie from its direct children and re-weight those children.
+    Uses the same arithmetic as `PortfolioTree.normalize` so results match.
+    """
+    children = node.setdefault("children", {})
+    units = {name: _to_units(child.get("value", 0)) for name, child in children.items()}
+    total = sum(units.values())
+    if children and total != _to_units(node.get("value", 0)):
+        node["value"] = _from_units(total)
+
+    for name, child in children.items():
+        if child["type"] == "pie":
+            child.setdefault("children", {})
+        child["weight"] = _weight(units[name], total)
 
-        for child in node["children"].values():
-            if total > 0:
-                child["weight"] = Decimal(child["value"]) / total
-            else:
-                child["weight"] = Decimal("0")
-            recurse(child)
 
-        return node
+def normalize_paths(
+    portfolio: Dict[str, Any], paths: Iterable[tuple[str, ...]]
+) -> Dict[str, Any]:
+    """
+    Re-normalize only the pies on the given paths and their ancestors.
+
+    Each path lists pie names from the root down to an edited pie. Every
+    affected pie is re-summed once, deepest first, so an edit costs
+    O(depth) pie updates instead of a whole-tree pass. Falls back to a full
+    normalization if a path no longer exists.
+
+    :param portfolio: Portfolio root node.
+    :param paths: Paths of edited pies; `()` is the root.
+    :return: Portfolio with updated weights and values along the paths.
+    """
+    affected = {path[:i] for path in paths for i in range(len(path) + 1)}
+    nodes = {}
+    try:
+        for path in sorted(affected, key=len):
+            parent = nodes[path[:-1]] if path else portfolio
+            nodes[path] = parent["children"][path[-1]] if path else portfolio
+    except KeyError:
+        logger.debug("Dirty path not found; falling back to full normalize")
+        return normalize_portfolio(portfolio)
+
+    logger.info(f"Normalizing {len(nodes)} pies along edited paths")
+    for path in sorted(nodes, key=len, reverse=True):
+        _normalize_pie_level(nodes[path])
+    return portfolio
+
 
-    return recurse(portfolio)
+def mark_portfolio_dirty(path: tuple[str, ...] = ()) -> None:
+    """
+    Record that the children of the pie at `path` in the session portfolio
+    changed and need re-normalizing.
+
+    :param path: Pie names from the root to the edited pie.
+    """
+    st.session_state.setdefault("dirty_paths", set()).add(tuple(path))
+
+
+def flush_portfolio_changes(portfolio: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Re-normalize the pies marked dirty since the last flush. A no-op when
+    nothing changed, so it is cheap to call on every rerun.
+
+    :param portfolio: Session portfolio root node.
+    :return: The portfolio, normalized along any dirty paths.
+    """
+    dirty = st.session_state.pop("dirty_paths", None)
+    if not dirty:
+        return portfolio
+    return normalize_paths(portfolio, dirty)
 
 
 def create_named_portfolio(account: dict, name: str) -> dict:
     """
-    Create, persist, and load a new empty pie portfolio into the session.
+    Create a new empty pie portfolio, mark the account for saving and load
+    the portfolio into the session.
 
     :param account: Account dictionary
     :param name: Portfolio name
@@ -70,7 +425,7 @@ def create_named_portfolio(account: dict, name: str) -> dict:
     }
     portfolio = normalize_portfolio(portfolio)
     updated = add_or_replace_portfolio(account, name, portfolio)
-    save_account_to_cookie(updated)
+    mark_account_dirty()
     st.session_state["portfolio"] = portfolio
     st.session_state["portfolio_file"] = name
     return updated
@@ -92,12 +447,18 @@ def summarize_children(portfolio: Dict[str, Any]) -> list[tuple[str, float, floa
     return summary
 
 
-def update_children(portfolio: dict, parsed: dict) -> dict:
+def update_children(
+    portfolio: dict, parsed: dict, path: tuple = (), persist: bool = True
+) -> dict:
     """
-    Update the children of a portfolio with parsed slice values.
+    Update the children of a portfolio with parsed slice values and mark the
+    pie dirty so `flush_portfolio_changes` re-normalizes only its path.
 
     :param portfolio: The portfolio node to modify.
     :param parsed: Mapping of slice_name to {"type": str, "value": float}.
+    :param path: Pie names from the session root to this node.
+    :param persist: Store the session portfolio in the account afterwards;
+        batch callers pass False and store once.
     :return: The updated portfolio dictionary.
     """
     children = portfolio.setdefault("children", {})
@@ -112,19 +473,22 @@ def update_children(portfolio: dict, parsed: dict) -> dict:
             logger.warning(f"Skipping malformed slice: {name} -> {meta}")
 
     logger.debug(f"Final merged children: {children}")
-    save_current_portfolio()
+    mark_portfolio_dirty(path)
+    if persist:
+        save_current_portfolio()
     return portfolio
 
 
 def save_current_portfolio():
     """
-    Save the current portfolio to the session's account and persist to cookie.
+    Store the current portfolio in the session's account and mark the
+    account for saving at the end of the rerun.
     """
     account = st.session_state["account"]
     portfolio = st.session_state["portfolio"]
     updated = add_or_replace_portfolio(account, portfolio["name"], portfolio)
     st.session_state["account"] = updated
-    save_account_to_cookie(updated)
+    mark_account_dirty()
 
 
 def get_icon(asset_type: str, output: str = "markdown") -> str:
@@ -165,7 +529,7 @@ def create_and_save():
             st.session_state["account"], name
         )
         st.session_state["new_portfolio_name"] = ""  # Clear input
-        st.rerun()
+        rerun()
 
 
 def make_example_portfolio():
@@ -178,7 +542,7 @@ def make_example_portfolio():
     updated = add_or_replace_portfolio(account, "example", EXAMPLE_PORTFOLIO)
     st.session_state["account"] = updated
     st.session_state["active_portfolio_name"] = "example"
-    save_account_to_cookie(updated)
+    mark_account_dirty()
     logger.info("System-generated portfolio creation: 'example'")
 
 
@@ -187,31 +551,24 @@ def get_aggrid_portfolio_rows(portfolio: dict) -> list[dict]:
     Flatten a nested portfolio into tree-structured rows for AgGrid.
     Adds 'icon' field as base64 HTML image string for inline rendering.
     """
-
-    def recurse(node: dict, parent_path: list[str] = []) -> list[dict]:
-        rows = []
-        if node["type"] != "pie":
-            return []
-
-        total_value = sum(Decimal(str(c["value"])) for c in node["children"].values())
-
-        for name, child in node["children"].items():
-            value = Decimal(str(child["value"]))
-            weight = (value / total_value) * 100 if total_value > 0 else Decimal("0")
-
-            row = {
-                "path": parent_path + [name],
-                "name": name,
-                "value": float(value),
-                "weight": float(weight),
-                "type": child["type"],
-                "icon": get_icon(child["type"], output="base64"),
+    tree = PortfolioTree.from_dict(portfolio).compute_weights()
+    values = tree.dollar_values()
+    icons = {t: get_icon(t, output="base64") for t in NODE_TYPES}
+
+    paths = [[]]
+    rows = []
+    for i in range(1, len(tree)):
+        path = paths[tree.parent[i]] + [tree.names[i]]
+        paths.append(path)
+        asset_type = NODE_TYPES[tree.kind[i]]
+        rows.append(
+            {
+                "path": path,
+                "name": tree.names[i],
+                "value": float(values[i]),
+                "weight": float(tree.weights[i] * 100),
+                "type": asset_type,
+                "icon": icons[asset_type],
             }
-
-            rows.append(row)
-            if child["type"] == "pie":
-                rows.extend(recurse(child, row["path"]))
-
-        return rows
-
-    return recurse(portfolio)
+        )
+    return rows
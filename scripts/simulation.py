@@ -0,0 +1,148 @@
+"""
+simulation.py: Monte Carlo simulation of recurring DCA deposits.
+
+Simulates randomized monthly price paths for every ticker in a portfolio while
+a fixed deposit is split by target weights each month. Paths are generated as
+NumPy arrays in seeded shards, optionally spread across a process pool, and
+summarized as distributions of ending value and per-pie weight drift.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from scripts.dca_allocator import target_shares
+from scripts.log_util import app_logger
+from scripts.portfolio import PortfolioTree
+
+logger = app_logger(__name__)
+
+# Paths per shard; fixed so results for a seed do not depend on worker count.
+SHARD_PATHS = 250
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def simulate_dca_schedule(
+    portfolio: Dict[str, Any],
+    monthly_deposit: Decimal,
+    months: int = 12,
+    n_paths: int = 1000,
+    annual_return: float = 0.07,
+    annual_volatility: float = 0.20,
+    seed: Optional[int] = None,
+    workers: Optional[int] = 1,
+) -> Dict[str, Any]:
+    """
+    Run randomized price paths over a recurring-deposit schedule.
+
+    Each month the deposit is split across tickers by the product of target
+    shares down each pie path (see `target_shares`), then every ticker grows
+    by an independent lognormal monthly return.
+
+    :param portfolio: Portfolio root node.
+    :param monthly_deposit: Cash deposited at the start of each month.
+    :param months: Number of months to simulate.
+    :param n_paths: Number of price paths.
+    :param annual_return: Expected annual log return per ticker.
+    :param annual_volatility: Annual volatility of log returns per ticker.
+    :param seed: Seed for reproducible results.
+    :param workers: Process count; 1 runs in-process, None uses all CPUs.
+    :return: Dict with `ending_values` (array per path), `ending_summary`
+        and `pie_drift` (summary per pie path of total weight drift).
+    :raises ValueError: If `n_paths` is less than 1.
+    """
+    if n_paths < 1:
+        raise ValueError(f"n_paths must be at least 1, got {n_paths}")
+    tree = PortfolioTree.from_dict(portfolio).rollup().compute_weights()
+    terminal = np.flatnonzero(~tree.has_children())
+    targets = target_shares(tree)
+    factors = tree.leaf_factors(targets)[terminal]
+    start_values = tree.dollar_values()[terminal]
+
+    monthly_mu = annual_return / 12
+    monthly_sigma = annual_volatility / np.sqrt(12)
+    shard_sizes = [
+        min(SHARD_PATHS, n_paths - start) for start in range(0, n_paths, SHARD_PATHS)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(shard_sizes))
+    deposits = factors * float(monthly_deposit)
+    jobs = [
+        (start_values, deposits, months, size, monthly_mu, monthly_sigma, shard_seed)
+        for size, shard_seed in zip(shard_sizes, seeds)
+    ]
+
+    logger.info(f"Simulating {n_paths} paths over {months} months")
+    if workers == 1:
+        shards = [_simulate_shard(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shards = list(pool.map(_simulate_shard, jobs))
+
+    node_values = np.zeros((n_paths, len(tree)))
+    node_values[:, terminal] = np.concatenate(shards)
+    _rollup_paths(tree, node_values)
+
+    ending_values = node_values[:, 0]
+    return {
+        "ending_values": ending_values,
+        "ending_summary": _summarize(ending_values),
+        "pie_drift": _pie_drift(tree, node_values, targets),
+    }
+
+
+def _simulate_shard(job: tuple) -> np.ndarray:
+    """
+    Simulate one shard of paths. Top-level so it can run in a worker process.
+
+    :param job: (start_values, deposits, months, paths, mu, sigma, seed)
+    :return: Ending value per path and ticker, shape (paths, tickers).
+    """
+    start_values, deposits, months, paths, mu, sigma, seed = job
+    rng = np.random.default_rng(seed)
+    values = np.tile(start_values, (paths, 1))
+    for _ in range(months):
+        values += deposits
+        values *= np.exp(rng.normal(mu, sigma, size=values.shape))
+    return values
+
+
+def _rollup_paths(tree: PortfolioTree, node_values: np.ndarray) -> None:
+    """Sum terminal values up to every pie, deepest level first, for all paths."""
+    for level in reversed(tree.levels[1:]):
+        np.add.at(node_values, (slice(None), tree.parent[level]), node_values[:, level])
+
+
+def _pie_drift(
+    tree: PortfolioTree, node_values: np.ndarray, targets: np.ndarray
+) -> Dict[str, dict]:
+    """
+    Summarize each pie's drift from its target shares at the end.
+
+    Drift is half the sum of absolute weight differences across the pie's
+    children: 0 means on target, 1 means fully misallocated. `targets` holds
+    each node's target share of its parent, from `target_shares`.
+    """
+    children, bounds = tree.child_index()
+    paths = tree.paths()
+
+    drift = {}
+    for pie in np.flatnonzero(tree.has_children()):
+        kids = children[bounds[pie] : bounds[pie + 1]]
+        kid_values = node_values[:, kids]
+        totals = node_values[:, [pie]]
+        weights = np.divide(
+            kid_values, totals, out=np.zeros_like(kid_values), where=totals > 0
+        )
+        deviation = np.abs(weights - targets[kids]).sum(axis=1) / 2
+        drift[paths[pie]] = _summarize(deviation)
+    return drift
+
+
+def _summarize(samples: np.ndarray) -> Dict[str, float]:
+    """Return mean and percentiles of a sample array."""
+    summary = {"mean": float(samples.mean())}
+    for pct, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+        summary[f"p{pct}"] = float(value)
+    return summary
@@ -0,0 +1,77 @@
+"""
+slice_stream.py: Incremental parser for streamed slice JSON.
+
+The Vision model answers with one JSON object of the form
+`{name: {type, value}, ...}`, possibly wrapped in a markdown code fence. While
+the response streams in, `SliceStreamParser` scans each new chunk once and
+yields every `name: {...}` entry as soon as its closing brace arrives, so the
+UI can show slices before the whole response is complete.
+"""
+
+import json
+from typing import Any, Dict, List, Tuple
+
+from scripts.log_util import app_logger
+
+logger = app_logger(__name__)
+
+
+class SliceStreamParser:
+    """Yield complete top-level entries of a streamed JSON object."""
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Consume the next chunk of response text.
+
+        :param chunk: Newly streamed text.
+        :return: (name, entry) pairs completed by this chunk, in order.
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(text[self._key_start : i + 1])
+                        self._key_start = None
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key_start = i
+            elif char == "{":
+                self._depth += 1
+                if self._depth == 2:
+                    self._value_start = i
+            elif char == "}":
+                if self._depth == 2:
+                    entry = self._decode_entry(text[self._value_start : i + 1])
+                    if entry is not None:
+                        completed.append((self._key, entry))
+                    self._value_start = None
+                self._depth = max(self._depth - 1, 0)
+        self._pos = len(text)
+        return completed
+
+    def _decode_entry(self, raw: str):
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed streamed slice {self._key!r}: {e}")
+            return None
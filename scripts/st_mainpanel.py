@@ -1,4 +1,4 @@
-"""st_mainpanel.py: Streamlit main panel using cookie-backed portfolio storage."""
+"""st_mainpanel.py: Streamlit main panel backed by the session's account store."""
 
 from copy import deepcopy
 from decimal import Decimal
@@ -6,15 +6,29 @@ from decimal import Decimal
 import streamlit as st
 
 from scripts.account import add_or_replace_portfolio
-from scripts.cookie_account import save_account_to_cookie
-from scripts.dca_allocator import recalculate_pie_allocation
-from scripts.image_parser import handle_image_upload
+from scripts.allocation_cache import ALLOCATION_CACHE
+from scripts.account_sync import mark_account_dirty
+from scripts.dca_allocator import (
+    allocate_buy_only,
+    recalculate_pie_allocation,
+    recalculate_tree_allocation,
+)
+from scripts.image_parser import (
+    MULTI_UPLOAD_MODES,
+    get_parser_router,
+    handle_image_upload,
+    handle_multi_image_upload,
+)
 from scripts.log_util import app_logger
+from scripts.orders import allocations_from_adjustment, generate_orders
+from scripts.parser_backends import POLICIES as PARSER_POLICIES
 from scripts.portfolio import normalize_portfolio
 from scripts.st_aggrid import render_portfolio_aggrid
 from scripts.st_utils import (
     render_allocation_comparison_charts,
     render_allocation_review_table,
+    render_order_tickets,
+    render_parser_metrics,
     render_sankey_diagram,
 )
 
@@ -24,7 +38,7 @@ logger = app_logger(__name__)
 def render_mainpanel():
     """
     Render the main content panel: portfolio display and tabbed tools.
-    Uses cookie-backed session state for account and portfolio.
+    Uses session state for account and portfolio, persisted via `account_sync`.
     """
     st.title("\U0001f4c8 M1 Pie DCA Allocator")
 
@@ -54,29 +68,56 @@ def render_mainpanel():
     with tab1:
         st.subheader("Upload Screenshot")
 
-        img_file = st.file_uploader(
-            "Upload M1 screenshot (mixed pies/tickers)",
+        img_files = st.file_uploader(
+            "Upload M1 screenshots (mixed pies/tickers)",
             type=["png", "jpg", "jpeg"],
             key="uploaded_image",
+            accept_multiple_files=True,
         )
 
         reparse = st.checkbox("Force re-parse image")
+        policy = st.selectbox(
+            "Parser",
+            list(PARSER_POLICIES),
+            help="local-first tries offline OCR and falls back to GPT-4o "
+            "when its confidence is low.",
+            key="parser_policy",
+        )
+        upload_mode = st.radio(
+            "Multiple screenshots",
+            list(MULTI_UPLOAD_MODES),
+            format_func=MULTI_UPLOAD_MODES.get,
+            horizontal=True,
+            key="multi_upload_mode",
+        )
+        expected_total = st.number_input(
+            "Pie total shown in M1 (optional, checks multi-screenshot stitching)",
+            min_value=0.0,
+            value=0.0,
+            disabled=upload_mode != "stitch",
+        )
 
-        if img_file:
-            handle_image_upload(
-                img_file,
-                reparse,
-                portfolio,
-                st.secrets["openai"]["api_key"],
-            )
-            st.session_state["portfolio"] = normalize_portfolio(portfolio)
-            st.session_state["account"] = add_or_replace_portfolio(
-                st.session_state["account"],
-                st.session_state["portfolio_file"],
-                st.session_state["portfolio"],
-            )
-            save_account_to_cookie(st.session_state["account"])
-            st.success("Portfolio updated from image.")
+        render_parser_metrics(
+            get_parser_router(
+                policy, st.session_state.get("DATA_DIR", "data")
+            ).metrics()
+        )
+
+        # Handlers update, normalize and persist the portfolio themselves,
+        # once per upload or batch.
+        if img_files:
+            api_key = st.secrets["openai"]["api_key"]
+            if len(img_files) == 1:
+                handle_image_upload(img_files[0], reparse, portfolio, api_key)
+            else:
+                handle_multi_image_upload(
+                    img_files,
+                    reparse,
+                    portfolio,
+                    api_key,
+                    expected_total or None,
+                    mode=upload_mode,
+                )
 
         with tab2:
             st.subheader("Adjust Positions")
@@ -91,21 +132,49 @@ def render_mainpanel():
                     )
 
                 percent_to_new = st.slider("Percent to new", 0, 100, value=80)
+                col1, col2 = st.columns(2)
+                with col1:
+                    mode = st.selectbox(
+                        "Allocation mode",
+                        ["Root pie only", "All nested pies", "Buy underweight first"],
+                        help="Buy underweight first ignores the new-ticker settings.",
+                    )
+                with col2:
+                    mock_depth = st.number_input(
+                        "New ticker depth", min_value=1, value=1
+                    )
                 submit = st.form_submit_button("Recalculate Allocation")
 
             if submit:
                 original = deepcopy(st.session_state["portfolio"])
-                updated = recalculate_pie_allocation(
-                    pie_data=original,
+                params = dict(
                     new_funds=Decimal(str(new_funds)),
                     new_ticker_count=new_ticker_count,
                     percent_to_new=Decimal(str(percent_to_new)),
                 )
-                st.session_state["adjusted_portfolio"] = updated
-                st.session_state["original_portfolio"] = (
-                    original  # cache for true before/after
-                )
-                st.success("What-if allocation calculated.")
+                func = recalculate_pie_allocation
+                if mode == "All nested pies":
+                    func = recalculate_tree_allocation
+                    params["mock_depth"] = mock_depth
+                elif mode == "Buy underweight first":
+                    func = allocate_buy_only
+                    params = {"new_funds": params["new_funds"]}
+                try:
+                    updated = ALLOCATION_CACHE.get_or_compute(func, original, **params)
+                except ValueError as e:
+                    logger.warning(f"Allocation failed: {e}")
+                    st.error(f"Allocation failed: {e}")
+                else:
+                    st.session_state["adjusted_portfolio"] = updated
+                    st.session_state["original_portfolio"] = (
+                        original  # cache for true before/after
+                    )
+                    st.success("What-if allocation calculated.")
+                    stats = ALLOCATION_CACHE.stats()
+                    st.caption(
+                        f"Shared allocation cache (all sessions): "
+                        f"{stats['hits']} hits, {stats['misses']} misses"
+                    )
 
             if "adjusted_portfolio" in st.session_state:
                 st.subheader("Adjusted Allocation Review")
@@ -121,6 +190,13 @@ def render_mainpanel():
                         st.session_state["adjusted_portfolio"],
                     )
 
+                with st.expander("Order Tickets"):
+                    allocations = allocations_from_adjustment(
+                        st.session_state["original_portfolio"],
+                        st.session_state["adjusted_portfolio"],
+                    )
+                    render_order_tickets(generate_orders(allocations))
+
                 if st.button("Confirm and Save Changes"):
                     st.session_state["portfolio"] = normalize_portfolio(
                         st.session_state["adjusted_portfolio"]
@@ -130,5 +206,5 @@ def render_mainpanel():
                         st.session_state["portfolio_file"],
                         st.session_state["portfolio"],
                     )
-                    save_account_to_cookie(st.session_state["account"])
+                    mark_account_dirty()
                     st.success("Portfolio changes saved.")
@@ -5,9 +5,10 @@ import streamlit as st
 from scripts.account import (
     delete_portfolio,
     get_portfolio,
-    list_portfolios,
+    portfolio_index,
 )
-from scripts.cookie_account import load_account_from_cookie, save_account_to_cookie
+from scripts.account_sync import mark_account_dirty, remember_persisted, rerun
+from scripts.account_store import load_session_account
 from scripts.log_util import app_logger  # , set_log_level -- add this if for ux control
 from scripts.portfolio import (
     create_and_save,
@@ -21,27 +22,36 @@ logger = app_logger(__name__)
 
 def render_sidepanel():
     """
-    Render the sidebar interface for managing portfolios, using cookie-based account storage.
+    Render the sidebar interface for managing portfolios, using the configured account store.
     """
     if "account" not in st.session_state:
-        st.session_state["account"] = load_account_from_cookie()
+        account = load_session_account()
+        if account is None:
+            # The cookie component reruns the script once the browser reports.
+            st.info("Loading your portfolios...")
+            st.stop()
+        st.session_state["account"] = account
+        remember_persisted(account)
 
     account = st.session_state["account"]
-    portfolio_names = list_portfolios(account)
+    # Summaries only; a portfolio is decoded when its button is clicked.
+    index = portfolio_index(account)
 
     with st.sidebar:
         st.header("\U0001f4c1 Portfolios")
 
-        for name in portfolio_names:
-            portfolio = get_portfolio(account, name)
-            display_name = portfolio.get("name", name)
-
+        for name, summary in index.items():
             col1, col2 = st.columns([0.8, 0.2])
             with col1:
-                if st.button(display_name, key=f"load_{name}"):
-                    st.session_state["portfolio"] = normalize_portfolio(portfolio)
-                    st.session_state["portfolio_file"] = name
-                    st.session_state.pop("adjusted_portfolio", None)
+                if st.button(summary["name"], key=f"load_{name}"):
+                    portfolio = get_portfolio(account, name)
+                    if portfolio is None:
+                        st.error(f"Portfolio '{name}' could not be loaded.")
+                    else:
+                        st.session_state["portfolio"] = normalize_portfolio(portfolio)
+                        st.session_state["portfolio_file"] = name
+                        st.session_state.pop("adjusted_portfolio", None)
+                        st.session_state.pop("dirty_paths", None)
 
             with col2:
                 if st.button("❌", key=f"delete_{name}"):
@@ -55,7 +65,7 @@ def render_sidepanel():
             if confirm_col.button("Yes, Delete"):
                 account = delete_portfolio(account, name)
                 st.session_state["account"] = account
-                save_account_to_cookie(account)
+                mark_account_dirty()
 
                 if st.session_state.get("portfolio_file") == name:
                     for key in [
@@ -68,7 +78,7 @@ def render_sidepanel():
 
                 del st.session_state["confirm_delete"]
                 st.success(f"Deleted {name}")
-                st.rerun()
+                rerun()
 
             if cancel_col.button("Cancel"):
                 del st.session_state["confirm_delete"]
@@ -14,6 +14,7 @@ import streamlit as st
 from plotly.colors import qualitative
 
 from scripts.log_util import app_logger
+from scripts.portfolio import PortfolioTree
 
 logger = app_logger(__name__)
 
@@ -76,6 +77,42 @@ def render_allocation_review_table(original: dict, adjusted: dict) -> None:
     )
 
 
+def render_order_tickets(orders: list[dict]) -> None:
+    """
+    Render the buy orders produced by `orders.generate_orders`.
+
+    :param orders: List of {"ticker": str, "amount": Decimal}
+    :return: None
+    """
+    if not orders:
+        st.info("No buys meet the minimum trade size.")
+        return
+
+    df = pd.DataFrame(
+        [{"Ticker": o["ticker"], "Buy Amount": f"${o['amount']:,.2f}"} for o in orders]
+    )
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    total = sum(o["amount"] for o in orders)
+    st.caption(f"{len(orders)} orders totalling ${total:,.2f}")
+
+
+def render_parser_metrics(metrics: dict) -> None:
+    """
+    Render per-backend parser latency and accuracy as a caption.
+
+    :param metrics: Output of `BackendRouter.metrics()`
+    :return: None
+    """
+    parts = []
+    for name, m in metrics.items():
+        part = f"{name}: {m['calls']} calls, {m['mean_latency_ms']:.0f} ms avg"
+        if m["accuracy"] is not None:
+            part += f", {m['accuracy']:.0%} accurate"
+        parts.append(part)
+    if parts:
+        st.caption(" · ".join(parts))
+
+
 def render_allocation_comparison_charts(original: dict, adjusted: dict) -> None:
     """
     Render vertically stacked pie charts comparing original and adjusted portfolio weights using Plotly.
@@ -138,20 +175,18 @@ def render_sankey_diagram(portfolio: dict) -> None:
             node_map[name] = len(node_map)
         return node_map[name]
 
-    def visit(node, parent_name, depth=0):
-        parent_id = get_node_id(parent_name)
-        if parent_name not in positions:
-            positions[parent_name] = depth
-        if node["type"] == "pie":
-            for name, child in node["children"].items():
-                child_id = get_node_id(name)
-                links.append((parent_id, child_id, float(child["value"])))
-                positions[name] = depth + 1
-                if child["type"] == "pie":
-                    visit(child, name, depth + 1)
-
-    root_name = portfolio["name"]
-    visit(portfolio, root_name)
+    tree = PortfolioTree.from_dict(portfolio)
+    values = tree.dollar_values()
+    root_name = tree.names[0]
+    get_node_id(root_name)
+    positions[root_name] = 0
+
+    for i in range(1, len(tree)):
+        name = tree.names[i]
+        parent_id = get_node_id(tree.names[tree.parent[i]])
+        child_id = get_node_id(name)
+        links.append((parent_id, child_id, float(values[i])))
+        positions[name] = int(tree.depth[i])
 
     label = list(node_map.keys())
     source, target, value = zip(*links) if links else ([], [], [])
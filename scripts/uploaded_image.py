@@ -0,0 +1,62 @@
+"""
+uploaded_image.py: One-read, one-decode wrapper around an uploaded screenshot.
+
+An upload used to be read whole for hashing, decoded for display and decoded
+again for encoding, rewinding the file in between. `UploadedImage` reads the
+bytes once into a shared buffer, hashes them in chunks and decodes the PIL
+image lazily, so hashing, display and preprocessing all reuse the same data.
+"""
+
+import hashlib
+from functools import cached_property
+from io import BytesIO
+
+from PIL import Image
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadedImage:
+    """Uploaded image bytes with a lazily computed hash and decoded image."""
+
+    def __init__(self, data: bytes, name: str = ""):
+        self.data = data
+        self.name = name
+
+    @classmethod
+    def wrap(cls, upload) -> "UploadedImage":
+        """
+        Wrap an upload, path or file-like object; existing wrappers pass through.
+
+        :param upload: UploadedImage, file path, or binary file-like object.
+        :return: UploadedImage over the upload's bytes.
+        """
+        if isinstance(upload, cls):
+            return upload
+        if isinstance(upload, str):
+            with open(upload, "rb") as f:
+                return cls(f.read(), upload)
+        name = getattr(upload, "name", "")
+        if hasattr(upload, "getvalue"):
+            return cls(upload.getvalue(), name)
+        upload.seek(0)
+        return cls(upload.read(), name)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @cached_property
+    def sha256(self) -> str:
+        """SHA-256 of the bytes, fed in chunks without copying the buffer."""
+        digest = hashlib.sha256()
+        view = memoryview(self.data)
+        for start in range(0, len(view), HASH_CHUNK_BYTES):
+            digest.update(view[start : start + HASH_CHUNK_BYTES])
+        return digest.hexdigest()
+
+    @cached_property
+    def image(self) -> Image.Image:
+        """Decoded image, loaded on first access and shared thereafter."""
+        image = Image.open(BytesIO(self.data))
+        image.load()
+        return image
@@ -19,5 +19,8 @@ def to_decimal(value: float) -> Decimal:
 
 
 def file_hash(file: BinaryIO) -> str:
-    """Generate SHA-256 hash for a file-like object."""
-    return hashlib.sha256(file.read()).hexdigest()
+    """Generate SHA-256 hash for a file-like object, reading it in chunks."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
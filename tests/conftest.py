@@ -0,0 +1,81 @@
+import pytest
+import streamlit as st
+from PIL import Image, ImageDraw, ImageFont
+from streamlit.errors import StreamlitDuplicateElementKey
+
+from scripts.cookie_manager import COOKIE_RUN_KEY, MANAGER_KEY, begin_cookie_run
+
+
+def _screenshot(clock="9:41", amount="$1,234.56", font_size=20):
+    """Pie screenshot with a status bar clock and a value column."""
+    image = Image.new("RGB", (600, 1200), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=font_size)
+    draw.text((20, 10), clock, fill="black", font=font)
+    for row, top in enumerate(range(150, 1100, 120)):
+        draw.rectangle((20, top, 300, top + 60), fill=(40 * row % 255, 90, 160))
+        label = amount if row == 0 else "$100.00"
+        draw.text((400, top + 20), label, fill="black", font=font)
+    return image.resize((1200, 2400))
+
+
+@pytest.fixture
+def screenshot():
+    """Factory for pie screenshots, see `_screenshot`."""
+    return _screenshot
+
+
+class FakeBrowser(dict):
+    """
+    Browser cookie jar behind a stand-in for stx.CookieManager. Like the real
+    component, it rejects a component key used twice in one run, and its
+    `delete` raises KeyError for a cookie missing from the manager's snapshot.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reported = True
+        self.managers = 0
+        self.writes = []
+        self._keys = set()
+
+    def new_run(self):
+        """Start a new script run, as app.py does."""
+        self._keys.clear()
+        begin_cookie_run()
+
+    def component(self, key):
+        if key in self._keys:
+            raise StreamlitDuplicateElementKey(key)
+        self._keys.add(key)
+
+
+@pytest.fixture
+def browser(monkeypatch, mocker):
+    """Fake browser cookies behind the real cookie_manager functions."""
+    jar = FakeBrowser()
+
+    class CookieManager:
+        def __init__(self, key):
+            jar.component(key)
+            jar.managers += 1
+            self.cookies = dict(jar) if jar.reported else {}
+            # Streamlit keeps None as the component's value until it reports.
+            st.session_state[key] = dict(jar) if jar.reported else None
+
+        def set(self, cookie, val, key, expires_at=None):
+            jar.component(key)
+            jar[cookie] = val
+            jar.writes.append(cookie)
+            self.cookies[cookie] = val
+
+        def delete(self, cookie, key):
+            jar.component(key)
+            jar.pop(cookie, None)
+            del self.cookies[cookie]
+
+    mocker.patch("scripts.cookie_manager.stx.CookieManager", CookieManager)
+    monkeypatch.setitem(st.session_state, MANAGER_KEY, None)
+    monkeypatch.setitem(st.session_state, COOKIE_RUN_KEY, None)
+    jar.new_run()
+    return jar
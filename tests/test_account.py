@@ -1,6 +1,9 @@
 # import pytest
 from scripts.account import (
+    LazyPortfolios,
     create_empty_account,
+    portfolio_index,
+    portfolio_summary,
     list_portfolios,
     get_portfolio,
     add_or_replace_portfolio,
@@ -35,3 +38,73 @@ def test_delete_portfolio():
     add_or_replace_portfolio(account, "Old", {"name": "Old", "value": 300})
     delete_portfolio(account, "Old")
     assert "Old" not in account["portfolios"]
+
+
+def test_empty_accounts_do_not_share_portfolios():
+    first = create_empty_account()
+    add_or_replace_portfolio(first, "Tech", {"name": "Tech"})
+    assert create_empty_account()["portfolios"] == {}
+
+
+def _lazy(decode_log, **portfolios):
+    def decode(name, body):
+        decode_log.append(name)
+        return None if body == "corrupt" else {"name": body, "value": 1}
+
+    lazy = LazyPortfolios("test", decode)
+    for name, body in portfolios.items():
+        lazy.add_encoded(name, body, {"name": body, "value": 1, "slices": 0})
+    return lazy
+
+
+def test_lazy_portfolios_decode_once_on_access():
+    decoded = []
+    lazy = _lazy(decoded, a="Alpha", b="Beta")
+
+    assert list(lazy) == ["a", "b"]
+    assert portfolio_index({"portfolios": lazy})["b"]["name"] == "Beta"
+    assert decoded == []
+
+    assert lazy["a"] == {"name": "Alpha", "value": 1}
+    assert lazy["a"] is lazy["a"]
+    assert decoded == ["a"]
+    assert lazy.is_decoded("a") and not lazy.is_decoded("b")
+    assert lazy.encoded("b", "test") == "Beta"
+    assert lazy.encoded("a", "test") is None
+    assert lazy.encoded("b", "other") is None
+
+
+def test_lazy_portfolio_that_fails_to_decode_is_dropped():
+    lazy = _lazy([], a="corrupt", b="Beta")
+
+    assert get_portfolio({"portfolios": lazy}, "a") is None
+    assert list(lazy) == ["b"]
+
+
+def test_lazy_portfolios_support_account_operations():
+    decoded = []
+    account = {"type": "account", "portfolios": _lazy(decoded, a="Alpha", b="Beta")}
+
+    add_or_replace_portfolio(account, "c", {"name": "Gamma", "children": {"X": {}}})
+    delete_portfolio(account, "a")
+
+    assert list_portfolios(account) == ["b", "c"]
+    assert portfolio_index(account)["c"] == {
+        "name": "Gamma",
+        "value": None,
+        "slices": 1,
+    }
+    assert decoded == []
+
+
+def test_portfolio_summary_counts_slices():
+    portfolio = {
+        "name": "Mixed",
+        "value": 30,
+        "children": {"A": {"children": {"B": {}, "C": {}}}, "D": {}},
+    }
+    assert portfolio_summary("mixed", portfolio) == {
+        "name": "Mixed",
+        "value": 30,
+        "slices": 4,
+    }
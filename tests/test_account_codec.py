@@ -0,0 +1,111 @@
+import base64
+import copy
+import json
+import zlib
+from decimal import Decimal
+
+import pytest
+
+from scripts import account_codec
+from scripts.account_codec import codec_stats, decode_account, encode_account
+from scripts.cookie_account import (
+    CODEC_PREFIX,
+    _json_fallback,
+    decode_account_cookie,
+    encode_account_cookie,
+)
+from scripts.portfolio import normalize_portfolio
+from scripts.sample_portfolios import EXAMPLE_PORTFOLIO
+
+
+def _json_round_trip(account):
+    """What the legacy JSON cookie format gives back for an account."""
+    return json.loads(json.dumps(account, default=_json_fallback))
+
+
+@pytest.fixture
+def account():
+    example = normalize_portfolio(copy.deepcopy(EXAMPLE_PORTFOLIO))
+    return {"type": "account", "portfolios": {"Roshar": example}}
+
+
+def test_round_trip_matches_json_format(account):
+    assert decode_account(encode_account(account)) == _json_round_trip(account)
+
+
+def test_round_trip_keeps_unusual_fields():
+    account = {
+        "type": "account",
+        "owner": "kaladin",
+        "portfolios": {
+            "odd": {
+                "name": "renamed",
+                "type": "pie",
+                "value": Decimal("10.125"),
+                "note": "hi",
+                "children": {
+                    "BTC": {"type": "crypto", "value": -3.5, "weight": 0.25},
+                    "CASH": {"type": "ticker", "value": None},
+                    "": {"value": 12},
+                },
+            },
+            "bare": {"type": "pie", "value": 100},
+        },
+    }
+
+    assert decode_account(encode_account(account)) == _json_round_trip(account)
+
+
+def test_derived_weights_are_not_stored(account):
+    unweighted = copy.deepcopy(account)
+    stack = [unweighted["portfolios"]["Roshar"]]
+    while stack:
+        node = stack.pop()
+        node.pop("weight", None)
+        stack.extend(node.get("children", {}).values())
+
+    assert len(encode_account(account)) == len(encode_account(unweighted))
+
+
+def test_binary_cookie_is_smaller_than_json(account):
+    legacy = base64.b64encode(
+        zlib.compress(json.dumps(account, default=_json_fallback).encode())
+    ).decode()
+    encoded = encode_account_cookie(account)
+
+    assert encoded.startswith(CODEC_PREFIX)
+    assert len(encoded) < len(legacy) / 2
+    assert decode_account_cookie(encoded) == _json_round_trip(account)
+
+
+def test_cookie_falls_back_to_json_for_unsupported_accounts():
+    account = {"portfolios": {"x": "not a portfolio"}}
+    encoded = encode_account_cookie(account)
+
+    assert not encoded.startswith(CODEC_PREFIX)
+    assert decode_account_cookie(encoded) == account
+
+
+@pytest.mark.parametrize(
+    "data", [b"", b"\x09\x00", b"\x01\x01garbage", b"\x01\x00\x05ab"]
+)
+def test_malformed_data_raises_value_error(data):
+    with pytest.raises(ValueError):
+        decode_account(data)
+
+
+def test_codec_stats_reports_bytes_per_slice(account):
+    data = encode_account(account)
+    stats = codec_stats(account, data)
+
+    assert stats["slices"] == 16
+    assert stats["bytes"] == len(data)
+    assert stats["bytes_per_slice"] == pytest.approx(len(data) / 16)
+
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 300, 2**35 + 7, 2**64 - 1]
+    packed = account_codec._pack_varints(values)
+
+    assert len(packed) == 1 + 1 + 1 + 2 + 2 + 6 + 10
+    assert account_codec._unpack_varints(packed) == values
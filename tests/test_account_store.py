@@ -0,0 +1,263 @@
+import sqlite3
+import threading
+
+import pytest
+import streamlit as st
+
+from scripts import account_store
+from scripts.account import create_empty_account, portfolio_index
+from scripts.account_store import (
+    ACCOUNT_ID_COOKIE,
+    ACCOUNT_ID_KEY,
+    MemoryAccountStore,
+    SQLiteAccountStore,
+    get_account_id,
+    load_session_account,
+    save_session_account,
+)
+from scripts.cookie_account import WRITTEN_COOKIES_KEY, save_account_to_cookie
+
+
+def _account(**portfolios):
+    return {
+        "type": "account",
+        "portfolios": {
+            name: {
+                "name": name,
+                "type": "pie",
+                "value": value,
+                "children": {"VTI": {"type": "ticker", "value": value}},
+            }
+            for name, value in portfolios.items()
+        },
+    }
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    store = SQLiteAccountStore(str(tmp_path / "accounts.sqlite3"))
+    yield store
+    store.close()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryAccountStore()
+    return request.getfixturevalue("sqlite_store")
+
+
+def test_round_trip(store):
+    account = _account(growth=10.5, income=2.25)
+
+    assert store.save("abc", account)
+    assert store.load("abc") == account
+    assert store.list_portfolios("abc") == ["growth", "income"]
+    assert store.load_portfolio("abc", "income") == account["portfolios"]["income"]
+    assert store.load_portfolio("abc", "missing") is None
+
+
+def test_unknown_account_is_empty(store):
+    assert store.load("nobody") == create_empty_account()
+
+
+def test_accounts_are_isolated(store):
+    store.save("a", _account(one=1.0))
+    store.save("b", _account(two=2.0))
+
+    assert list(store.load("a")["portfolios"]) == ["one"]
+    assert list(store.load("b")["portfolios"]) == ["two"]
+
+
+def test_sqlite_rewrites_only_changed_portfolios(sqlite_store, mocker):
+    account = _account(a=1.0, b=2.0, c=3.0)
+    sqlite_store.save("abc", account)
+
+    clock = mocker.patch("scripts.account_store.time.time", return_value=1e9)
+    account["portfolios"]["b"]["children"]["VTI"]["value"] = 5.0
+    del account["portfolios"]["c"]
+    sqlite_store.save("abc", account)
+
+    with sqlite3.connect(sqlite_store.path) as conn:
+        rows = dict(conn.execute("SELECT name, updated FROM portfolios"))
+    assert set(rows) == {"a", "b"}
+    assert rows["b"] == clock.return_value
+    assert rows["a"] != clock.return_value
+    assert sqlite_store.load("abc") == account
+
+
+def test_sqlite_reads_one_portfolio_without_decoding_others(sqlite_store, mocker):
+    sqlite_store.save("abc", _account(a=1.0, b=2.0, c=3.0))
+    decode = mocker.spy(account_store, "decode_portfolio")
+
+    assert sqlite_store.list_portfolios("abc") == ["a", "b", "c"]
+    sqlite_store.load_portfolio("abc", "b")
+
+    assert decode.call_count == 1
+
+
+def test_sqlite_uses_wal_mode(sqlite_store):
+    with sqlite_store.pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_sqlite_pool_serves_concurrent_sessions(tmp_path):
+    store = SQLiteAccountStore(str(tmp_path / "accounts.sqlite3"), pool_size=2)
+
+    def session(i):
+        for value in range(5):
+            assert store.save(f"user{i}", _account(main=float(value)))
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i in range(6):
+        assert store.load(f"user{i}") == _account(main=4.0)
+    store.close()
+
+
+def test_sqlite_failed_load_leaves_no_open_transaction(sqlite_store):
+    sqlite_store.save("acct", _account(Growth=100))
+    with sqlite_store.pool.connection() as conn:
+        conn.execute("ALTER TABLE portfolios RENAME TO moved")
+
+    with pytest.raises(sqlite3.OperationalError):
+        sqlite_store.load("acct")
+
+    with sqlite_store.pool.connection() as conn:
+        assert not conn.in_transaction
+        conn.execute("ALTER TABLE moved RENAME TO portfolios")
+    assert sqlite_store.save("acct", _account(Value=50))
+    assert list(sqlite_store.load("acct")["portfolios"]) == ["Value"]
+
+
+def test_unsupported_portfolio_is_stored_as_json(sqlite_store):
+    # The binary codec rejects NUL in names.
+    portfolio = {"type": "pie", "children": {"A\0B": {"type": "ticker"}}}
+    account = {"type": "account", "portfolios": {"odd": portfolio}}
+
+    sqlite_store.save("abc", account)
+
+    assert sqlite_store.load("abc") == account
+
+
+@pytest.fixture
+def session(monkeypatch, mocker, browser):
+    """Memory-backed store with a fake browser holding the cookies."""
+    store = MemoryAccountStore()
+    mocker.patch("scripts.account_store.get_account_store", return_value=store)
+    monkeypatch.delitem(st.session_state, ACCOUNT_ID_KEY, raising=False)
+    monkeypatch.delitem(st.session_state, WRITTEN_COOKIES_KEY, raising=False)
+    return store, browser
+
+
+def _new_session(browser):
+    st.session_state.pop(ACCOUNT_ID_KEY, None)
+    st.session_state.pop(WRITTEN_COOKIES_KEY, None)
+    browser.new_run()
+
+
+def test_account_id_is_created_once_and_kept_in_a_cookie(session):
+    _, browser = session
+
+    account_id = get_account_id()
+    _new_session(browser)
+
+    assert browser == {ACCOUNT_ID_COOKIE: account_id}
+    assert get_account_id() == account_id
+
+
+def test_nothing_is_loaded_before_the_browser_reports(session):
+    store, browser = session
+    browser[ACCOUNT_ID_COOKIE] = "0" * 32
+    store.save("0" * 32, _account(main=1.0))
+    browser.reported = False
+    browser.new_run()
+
+    assert get_account_id() is None
+    assert load_session_account() is None
+    assert not save_session_account(_account(other=2.0))
+    assert browser == {ACCOUNT_ID_COOKIE: "0" * 32}
+
+    browser.reported = True
+    browser.new_run()
+    assert load_session_account() == _account(main=1.0)
+
+
+def test_session_account_round_trip(session):
+    account = _account(main=1.0)
+
+    assert save_session_account(account)
+    assert load_session_account() == account
+
+
+def test_legacy_cookie_account_is_migrated_once(session):
+    store, browser = session
+    legacy = _account(old=7.0, older=8.0)
+    save_account_to_cookie(legacy)
+    _new_session(browser)
+
+    assert load_session_account() == legacy
+    account_id = browser[ACCOUNT_ID_COOKIE]
+    assert store.load(account_id) == legacy
+    assert browser == {ACCOUNT_ID_COOKIE: account_id}
+
+    assert save_session_account(create_empty_account())
+    _new_session(browser)
+    assert load_session_account() == create_empty_account()
+
+
+def test_sqlite_load_decodes_portfolios_on_access(sqlite_store, mocker):
+    sqlite_store.save("abc", _account(a=1.0, b=2.0))
+    decode = mocker.spy(account_store, "decode_portfolio")
+
+    loaded = sqlite_store.load("abc")
+    assert portfolio_index(loaded) == {
+        "a": {"name": "a", "value": 1.0, "slices": 1},
+        "b": {"name": "b", "value": 2.0, "slices": 1},
+    }
+    decode.assert_not_called()
+
+    assert loaded["portfolios"]["b"] == _account(b=2.0)["portfolios"]["b"]
+    assert decode.call_count == 1
+
+
+def test_sqlite_saves_untouched_lazy_portfolios_as_stored(sqlite_store, mocker):
+    sqlite_store.save("abc", _account(a=1.0, b=2.0))
+    loaded = sqlite_store.load("abc")
+    loaded["portfolios"]["c"] = _account(c=3.0)["portfolios"]["c"]
+    encode = mocker.spy(account_store, "encode_portfolio")
+    decode = mocker.spy(account_store, "decode_portfolio")
+
+    assert sqlite_store.save("abc", loaded)
+
+    encode.assert_called_once()
+    decode.assert_not_called()
+    assert sqlite_store.load("abc") == _account(a=1.0, b=2.0, c=3.0)
+
+
+def test_sqlite_adds_summaries_to_older_databases(tmp_path):
+    path = str(tmp_path / "accounts.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.executescript(account_store._SCHEMA.replace("    summary TEXT,\n", ""))
+    store = SQLiteAccountStore(path)
+
+    store.save("abc", _account(a=1.0))
+
+    assert portfolio_index(store.load("abc"))["a"]["slices"] == 1
+    store.close()
+
+
+def test_sqlite_drops_rows_found_unreadable(sqlite_store):
+    sqlite_store.save("abc", _account(a=1.0, b=2.0))
+    with sqlite3.connect(sqlite_store.path) as conn:
+        conn.execute("UPDATE portfolios SET body = x'00ff' WHERE name = 'a'")
+    loaded = sqlite_store.load("abc")
+    # Untouched rows are kept as stored; one found unreadable is dropped.
+    assert loaded["portfolios"].get("a") is None
+
+    assert sqlite_store.save("abc", loaded)
+    assert sqlite_store.list_portfolios("abc") == ["b"]
@@ -0,0 +1,129 @@
+import pytest
+import streamlit as st
+
+from scripts.account import LazyPortfolios
+from scripts.account_sync import (
+    DIRTY_KEY,
+    HASH_KEY,
+    STATS_KEY,
+    account_hash,
+    account_write_stats,
+    flush_account,
+    mark_account_dirty,
+    remember_persisted,
+    rerun,
+)
+
+
+@pytest.fixture
+def account(monkeypatch):
+    account = {"type": "account", "portfolios": {"a": {"type": "pie", "value": 1}}}
+    monkeypatch.setitem(st.session_state, "account", account)
+    for key in (DIRTY_KEY, HASH_KEY, STATS_KEY):
+        monkeypatch.delitem(st.session_state, key, raising=False)
+    return account
+
+
+@pytest.fixture
+def save(mocker):
+    return mocker.patch("scripts.account_sync.save_session_account", return_value=True)
+
+
+def test_flush_without_changes_does_not_write(account, save):
+    assert flush_account() is False
+    save.assert_not_called()
+
+
+def test_many_marks_coalesce_into_one_write(account, save):
+    for _ in range(3):
+        mark_account_dirty()
+
+    assert flush_account() is True
+    assert flush_account() is False
+    save.assert_called_once_with(account)
+    assert account_write_stats() == {"marked": 3, "writes": 1, "skipped": 0}
+
+
+def test_unchanged_content_is_skipped(account, save):
+    remember_persisted(account)
+    mark_account_dirty()
+
+    assert flush_account() is False
+    save.assert_not_called()
+    assert account_write_stats()["skipped"] == 1
+
+    account["portfolios"]["a"]["value"] = 2
+    mark_account_dirty()
+    assert flush_account() is True
+    save.assert_called_once()
+
+
+def test_failed_save_is_retried_on_next_flush(account, save):
+    save.return_value = False
+    mark_account_dirty()
+    assert flush_account() is False
+    assert st.session_state[DIRTY_KEY]
+
+    save.return_value = True
+    assert flush_account() is True
+    assert DIRTY_KEY not in st.session_state
+    assert save.call_count == 2
+
+
+def test_save_error_keeps_the_account_dirty(account, save):
+    save.side_effect = RuntimeError("disk full")
+    mark_account_dirty()
+
+    with pytest.raises(RuntimeError):
+        flush_account()
+
+    assert st.session_state[DIRTY_KEY]
+
+
+def test_failed_save_is_retried_on_next_change(account, save):
+    save.return_value = False
+    mark_account_dirty()
+    assert flush_account() is False
+
+    save.return_value = True
+    mark_account_dirty()
+    assert flush_account() is True
+    assert save.call_count == 2
+
+
+def test_rerun_flushes_before_rerunning(account, save, mocker):
+    st_rerun = mocker.patch.object(st, "rerun")
+    mark_account_dirty()
+
+    rerun()
+
+    save.assert_called_once()
+    st_rerun.assert_called_once()
+
+
+def test_hash_of_lazy_account_decodes_nothing():
+    decode = []
+    portfolios = LazyPortfolios("test", lambda name, body: decode.append(name) or {})
+    portfolios.add_encoded("a", b"body", None)
+    account = {"type": "account", "portfolios": portfolios}
+
+    digest = account_hash(account)
+
+    assert decode == []
+    portfolios["a"] = {"type": "pie"}
+    assert account_hash(account) != digest
+
+
+def test_reading_a_lazy_portfolio_keeps_the_account_hash():
+    portfolios = LazyPortfolios("test", lambda name, body: {"type": "pie", "v": 1})
+    portfolios.add_encoded("a", b"body", None)
+    account = {"type": "account", "portfolios": portfolios}
+    digest = account_hash(account)
+
+    portfolios["a"]
+    assert account_hash(account) == digest
+
+    portfolios["a"]["v"] = 2
+    assert account_hash(account) != digest
+    portfolios["a"]["v"] = 1
+    assert account_hash(account) == digest
@@ -0,0 +1,97 @@
+import threading
+from decimal import Decimal
+
+from scripts.allocation_cache import AllocationCache, portfolio_hash
+from scripts.dca_allocator import recalculate_pie_allocation
+
+
+def make_pie():
+    return {
+        "name": "main",
+        "type": "pie",
+        "value": 300.0,
+        "children": {
+            "AAPL": {"type": "ticker", "value": 150.0},
+            "MSFT": {"type": "ticker", "value": Decimal("150.00")},
+        },
+    }
+
+
+def test_portfolio_hash_ignores_key_order():
+    """Equal content hashes the same regardless of dict ordering."""
+    pie = make_pie()
+    reordered = {k: pie[k] for k in reversed(list(pie))}
+    assert portfolio_hash(pie) == portfolio_hash(reordered)
+
+    pie["children"]["AAPL"]["value"] = 151.0
+    assert portfolio_hash(pie) != portfolio_hash(make_pie())
+
+
+def test_portfolio_hash_treats_equal_numbers_alike():
+    """Float, int and Decimal forms of one value share a cache key."""
+    as_float = make_pie()
+    as_decimal = make_pie()
+    as_decimal["value"] = Decimal("300")
+    as_decimal["children"]["AAPL"]["value"] = Decimal("150.0")
+    as_decimal["children"]["MSFT"]["value"] = 150
+    assert portfolio_hash(as_float) == portfolio_hash(as_decimal)
+
+    as_text = make_pie()
+    as_text["children"]["MSFT"]["value"] = "#1.5E+2"
+    assert portfolio_hash(as_text) != portfolio_hash(as_float)
+
+
+def test_cache_is_safe_across_threads():
+    """Concurrent sessions share the cache without corrupting it."""
+    cache = AllocationCache(maxsize=4)
+
+    def session(offset):
+        for i in range(40):
+            funds = Decimal((i + offset) % 7 + 1)
+            cache.get_or_compute(
+                recalculate_pie_allocation, make_pie(), new_funds=funds
+            )
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 8 * 40
+    assert stats["size"] == 4
+
+
+def test_cache_hits_misses_and_copies():
+    """Repeated inputs hit the cache and callers get independent copies."""
+    cache = AllocationCache(maxsize=2)
+    params = dict(new_funds=Decimal("50"), new_ticker_count=2)
+
+    first = cache.get_or_compute(recalculate_pie_allocation, make_pie(), **params)
+    second = cache.get_or_compute(recalculate_pie_allocation, make_pie(), **params)
+    assert first == second
+    assert first is not second
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+
+    first["children"].clear()
+    third = cache.get_or_compute(recalculate_pie_allocation, make_pie(), **params)
+    assert third == second
+
+
+def test_cache_evicts_least_recently_used():
+    """The oldest unused scenario is evicted once the cache is full."""
+    cache = AllocationCache(maxsize=2)
+    for funds in ("10", "20", "10", "30"):
+        cache.get_or_compute(
+            recalculate_pie_allocation, make_pie(), new_funds=Decimal(funds)
+        )
+    assert cache.stats()["misses"] == 3
+    cache.get_or_compute(
+        recalculate_pie_allocation, make_pie(), new_funds=Decimal("10")
+    )
+    assert cache.stats()["hits"] == 2
+    cache.get_or_compute(
+        recalculate_pie_allocation, make_pie(), new_funds=Decimal("20")
+    )
+    assert cache.stats()["misses"] == 4
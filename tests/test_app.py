@@ -0,0 +1,32 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from scripts.cookie_manager import MANAGER_KEY
+
+
+@pytest.fixture
+def app(tmp_path):
+    at = AppTest.from_file("../app.py", default_timeout=30)
+    at.secrets["openai"] = {"api_key": "test"}
+    at.secrets["storage"] = {"backend": "memory"}
+    at.session_state["DATA_DIR"] = str(tmp_path)
+    return at
+
+
+def test_first_load_waits_for_browser_cookies(app):
+    app.run()
+
+    assert not app.exception
+    assert "account" not in app.session_state
+    assert [info.value for info in app.info] == ["Loading your portfolios..."]
+
+
+def test_app_renders_once_cookies_are_reported(app):
+    # Streamlit holds the component's value once the browser has answered.
+    app.session_state[MANAGER_KEY] = {}
+    app.run()
+    app.run()
+
+    assert not app.exception
+    assert app.session_state["account"]["type"] == "account"
+    assert app.session_state["account_id"]
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.backtest import backtest_dca, load_price_matrix
+
+
+@pytest.fixture
+def portfolio():
+    """Pie with a sub-pie, all on target at 50/50."""
+    return {
+        "name": "main",
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "TECH": {
+                "type": "pie",
+                "value": 0,
+                "target_weight": 50,
+                "children": {
+                    "AAPL": {"type": "ticker", "value": 50, "target_weight": 50},
+                    "MSFT": {"type": "ticker", "value": 50, "target_weight": 50},
+                },
+            },
+            "GOOGL": {"type": "ticker", "value": 100, "target_weight": 50},
+        },
+    }
+
+
+@pytest.fixture
+def price_frame():
+    """Three months of daily prices; GOOGL doubles on the last day."""
+    dates = pd.date_range("2024-01-01", "2024-03-31", freq="D", name="date")
+    frame = pd.DataFrame(
+        {"AAPL": 10.0, "MSFT": 20.0, "GOOGL": 5.0, "UNUSED": 1.0}, index=dates
+    )
+    frame.loc[dates[-1], "GOOGL"] = 10.0
+    frame.loc[dates[3], "MSFT"] = np.nan
+    return frame
+
+
+def test_load_price_matrix_memory_maps_cache(tmp_path, price_frame):
+    """CSV prices are cached as .npy, memory-mapped and forward-filled."""
+    source = tmp_path / "prices.csv"
+    price_frame.to_csv(source)
+
+    dates, tickers, prices = load_price_matrix(str(source), str(tmp_path / "cache"))
+    assert tickers == ["AAPL", "MSFT", "GOOGL", "UNUSED"]
+    assert isinstance(prices, np.memmap)
+    assert prices.shape == (91, 4)
+    assert dates[0] == np.datetime64("2024-01-01")
+    assert prices[3, 1] == 20.0
+
+    again = load_price_matrix(str(source), str(tmp_path / "cache"))
+    assert np.array_equal(again[2], prices)
+
+
+def test_load_price_matrix_matches_pandas_rows(tmp_path):
+    """Quoted headers, a BOM and blank lines keep the shape pandas parses."""
+    source = tmp_path / "prices.csv"
+    source.write_text(
+        '\ufeffdate,"BRK,B",AAPL\n2024-01-01,1.0,2.0\n\n2024-01-02,,3.0\n',
+        encoding="utf-8",
+    )
+
+    dates, tickers, prices = load_price_matrix(str(source), str(tmp_path / "cache"))
+    assert tickers == ["BRK,B", "AAPL"]
+    assert prices.shape == (2, 2)
+    assert dates[-1] == np.datetime64("2024-01-02")
+    assert prices[1].tolist() == [1.0, 3.0]
+
+
+def test_backtest_dca_monthly_deposits(tmp_path, portfolio, price_frame):
+    """Deposits land on each month's first day and values track prices."""
+    source = tmp_path / "prices.parquet"
+    price_frame.to_parquet(source)
+
+    result = backtest_dca(portfolio, str(source), deposit=100.0)
+    values, weights = result["values"], result["weights"]
+
+    assert values.loc["2024-01-01", "main"] == pytest.approx(300.0)
+    assert values.loc["2024-03-30", "main"] == pytest.approx(500.0)
+    assert values.loc["2024-03-31", "GOOGL"] == pytest.approx(500.0)
+    assert values.loc["2024-03-31", "TECH/AAPL"] == pytest.approx(125.0)
+    assert weights.loc["2024-03-30", "TECH"] == pytest.approx(0.5)
+    assert weights.loc["2024-03-31", "GOOGL"] == pytest.approx(500 / 750)
+
+
+def test_backtest_dca_missing_ticker(tmp_path, portfolio, price_frame):
+    """Tickers without a price column are reported."""
+    source = tmp_path / "prices.csv"
+    price_frame.drop(columns="MSFT").to_csv(source)
+    with pytest.raises(ValueError, match="MSFT"):
+        backtest_dca(portfolio, str(source), deposit=100.0)
+
+
+def test_backtest_dca_starts_when_every_ticker_has_a_price(
+    tmp_path, portfolio, price_frame
+):
+    """Leading gaps are skipped instead of turning every result into NaN."""
+    source = tmp_path / "prices.csv"
+    price_frame.loc[:"2024-01-10", "GOOGL"] = np.nan
+    price_frame.to_csv(source)
+
+    values = backtest_dca(portfolio, str(source), deposit=100.0)["values"]
+
+    assert values.index[0] == pd.Timestamp("2024-01-11")
+    assert values.loc["2024-01-11", "main"] == pytest.approx(300.0)
+    assert not values.isna().any().any()
+
+
+def test_backtest_dca_without_complete_day(tmp_path, portfolio, price_frame):
+    source = tmp_path / "prices.csv"
+    price_frame["GOOGL"] = np.nan
+    price_frame.to_csv(source)
+    with pytest.raises(ValueError, match="every ticker"):
+        backtest_dca(portfolio, str(source), deposit=100.0)
@@ -4,8 +4,24 @@ import zlib
 import base64
 import os
 
-from scripts.cookie_account import save_account_to_cookie, load_account_from_cookie
-from scripts.account import create_empty_account
+import streamlit as st
+
+from scripts import cookie_account
+from scripts.cookie_account import (
+    COOKIE_KEY,
+    MAX_SHARD_COOKIES,
+    SHARD_BYTES,
+    WRITTEN_COOKIES_KEY,
+    save_account_to_cookie,
+    load_account_from_cookie,
+    shard_cookie_key,
+)
+from scripts.account import create_empty_account, portfolio_index
+
+
+@pytest.fixture(autouse=True)
+def fresh_session(monkeypatch):
+    monkeypatch.delitem(st.session_state, WRITTEN_COOKIES_KEY, raising=False)
 
 
 @pytest.fixture
@@ -13,15 +29,22 @@ def sample_account():
     return {"type": "account", "portfolios": {"foo": {"type": "pie", "value": 100}}}
 
 
+@pytest.fixture
+def jar(browser):
+    """Fake browser cookies; `new_run` starts the next script run."""
+    return browser
+
+
 def test_save_account_to_cookie_success(mocker, sample_account):
     mock_set = mocker.patch("scripts.cookie_account.set_cookie")
     save_account_to_cookie(sample_account)
-    mock_set.assert_called_once()
+    written = [call.args[0] for call in mock_set.call_args_list]
+    assert written == [shard_cookie_key(0, 0), COOKIE_KEY]
 
 
 def test_save_account_oversize(mocker):
-    # Use incompressible data to exceed cookie limit after compression
-    noisy = os.urandom(6000).hex()
+    # Use incompressible data to exceed the cookie budget after compression
+    noisy = os.urandom(MAX_SHARD_COOKIES * SHARD_BYTES).hex()
     big_account = {"portfolios": {"x": noisy}}
     mock_set = mocker.patch("scripts.cookie_account.set_cookie")
     save_account_to_cookie(big_account)
@@ -47,3 +70,146 @@ def test_load_account_corrupt_cookie(mocker):
     mocker.patch("scripts.cookie_account.get_cookie", return_value="not-valid-base64")
     result = load_account_from_cookie()
     assert result == create_empty_account()
+
+
+def _portfolio(*tickers):
+    children = {t: {"type": "ticker", "value": 10.5} for t in tickers}
+    return {"type": "pie", "value": 10.5 * len(tickers), "children": children}
+
+
+def test_sharded_round_trip(jar):
+    account = {
+        "type": "account",
+        "portfolios": {"a": _portfolio("AAPL"), "b": _portfolio("MSFT", "V")},
+    }
+    save_account_to_cookie(account)
+    st.session_state.pop(WRITTEN_COOKIES_KEY)
+    jar.new_run()
+
+    assert load_account_from_cookie() == account
+    assert set(jar) == {COOKIE_KEY, shard_cookie_key(0, 0), shard_cookie_key(1, 0)}
+
+
+def test_large_portfolio_is_chunked(jar):
+    noisy = {os.urandom(8).hex(): {"type": "ticker", "value": 1.25} for _ in range(600)}
+    account = {
+        "type": "account",
+        "portfolios": {"big": {"type": "pie", "value": 750.0, "children": noisy}},
+    }
+    save_account_to_cookie(account)
+    st.session_state.pop(WRITTEN_COOKIES_KEY)
+    jar.new_run()
+
+    assert shard_cookie_key(0, 1) in jar
+    assert all(len(value) <= SHARD_BYTES for value in jar.values())
+    assert load_account_from_cookie() == account
+
+
+def test_only_changed_shards_are_rewritten(jar):
+    account = {
+        "type": "account",
+        "portfolios": {"a": _portfolio("AAPL"), "b": _portfolio("MSFT")},
+    }
+    save_account_to_cookie(account)
+    account["portfolios"]["b"]["children"]["MSFT"]["value"] = 99.0
+    jar.writes.clear()
+
+    save_account_to_cookie(account)
+    assert jar.writes == [shard_cookie_key(1, 0), COOKIE_KEY]
+
+    jar.writes.clear()
+    save_account_to_cookie(account)
+    assert jar.writes == []
+
+
+def test_deleted_portfolio_shards_are_removed(jar):
+    account = {
+        "type": "account",
+        "portfolios": {"a": _portfolio("AAPL"), "b": _portfolio("MSFT")},
+    }
+    save_account_to_cookie(account)
+    del account["portfolios"]["a"]
+    save_account_to_cookie(account)
+
+    assert shard_cookie_key(0, 0) not in jar
+    assert shard_cookie_key(1, 0) in jar
+
+
+def test_corrupt_shard_only_drops_its_portfolio(jar):
+    account = {
+        "type": "account",
+        "portfolios": {"a": _portfolio("AAPL"), "b": _portfolio("MSFT")},
+    }
+    save_account_to_cookie(account)
+    key = shard_cookie_key(0, 0)
+    jar[key] = jar[key][:-2] + ("AA" if not jar[key].endswith("AA") else "BB")
+    jar.new_run()
+
+    loaded = load_account_from_cookie()
+    assert list(loaded["portfolios"]) == ["b"]
+
+
+def test_sharded_load_decodes_portfolios_on_access(jar, mocker):
+    account = {
+        "type": "account",
+        "portfolios": {"a": _portfolio("AAPL"), "b": _portfolio("MSFT", "V")},
+    }
+    save_account_to_cookie(account)
+    st.session_state.pop(WRITTEN_COOKIES_KEY)
+    jar.new_run()
+    decode = mocker.spy(cookie_account, "decode_account_cookie")
+
+    loaded = load_account_from_cookie()
+    assert portfolio_index(loaded)["b"] == {"name": "b", "value": 21.0, "slices": 2}
+    decode.assert_not_called()
+
+    assert loaded["portfolios"]["b"] == account["portfolios"]["b"]
+    assert decode.call_count == 1
+
+
+def test_untouched_lazy_shards_are_not_reencoded(jar, mocker):
+    account = {
+        "type": "account",
+        "portfolios": {"a": _portfolio("AAPL"), "b": _portfolio("MSFT")},
+    }
+    save_account_to_cookie(account)
+    st.session_state.pop(WRITTEN_COOKIES_KEY)
+    jar.new_run()
+    loaded = load_account_from_cookie()
+    loaded["portfolios"]["b"]["children"]["MSFT"]["value"] = 99.0
+    encode = mocker.spy(cookie_account, "encode_account_cookie")
+    jar.writes.clear()
+
+    save_account_to_cookie(loaded)
+
+    assert encode.call_count == 1
+    assert jar.writes == [shard_cookie_key(1, 0), COOKIE_KEY]
+
+
+def test_manifest_without_summaries_still_loads(jar):
+    account = {"type": "account", "portfolios": {"a": _portfolio("AAPL")}}
+    save_account_to_cookie(account)
+    manifest = json.loads(cookie_account._b64decode(jar[COOKIE_KEY][2:]))
+    manifest["shards"] = [entry[:4] for entry in manifest["shards"]]
+    jar[COOKIE_KEY] = "m." + cookie_account._b64encode(json.dumps(manifest).encode())
+    st.session_state.pop(WRITTEN_COOKIES_KEY)
+    jar.new_run()
+
+    loaded = load_account_from_cookie()
+    assert portfolio_index(loaded)["a"]["slices"] == 1
+    assert loaded == account
+
+
+def test_save_and_reload_in_one_run_use_one_manager(jar):
+    account = {
+        "type": "account",
+        "portfolios": {"a": _portfolio("AAPL"), "b": _portfolio("MSFT")},
+    }
+    save_account_to_cookie(account)
+    del account["portfolios"]["a"]
+    account["portfolios"]["b"]["children"]["MSFT"]["value"] = 99.0
+    save_account_to_cookie(account)
+    st.session_state.pop(WRITTEN_COOKIES_KEY)
+
+    assert load_account_from_cookie() == account
+    assert jar.managers == 1
@@ -1,34 +1,85 @@
 from datetime import datetime, timedelta, timezone
 
-from scripts.cookie_manager import get_cookie, set_cookie
+from scripts.cookie_manager import (
+    cookies_ready,
+    delete_cookie,
+    get_all_cookies,
+    get_cookie,
+    set_cookie,
+)
 
 
-def test_get_cookie_returns_value(mocker):
-    mock_mgr = mocker.patch("scripts.cookie_manager.get_cookie_manager")
-    mock_mgr.return_value.get_all.return_value = {"test": "abc"}
+def test_get_cookie_returns_value(browser):
+    browser["test"] = "abc"
+    browser.new_run()
     assert get_cookie("test") == "abc"
 
 
-def test_get_cookie_missing_key(mocker):
-    mock_mgr = mocker.patch("scripts.cookie_manager.get_cookie_manager")
-    mock_mgr.return_value.get_all.return_value = {}
+def test_get_cookie_missing_key(browser):
     assert get_cookie("missing") is None
 
 
-def test_set_cookie_calls_manager(mocker):
-    mock_mgr = mocker.patch("scripts.cookie_manager.get_cookie_manager")
-    manager = mock_mgr.return_value
+def test_set_cookie_calls_manager(browser):
+    set_cookie("foo", "bar")
+
+    assert browser == {"foo": "bar"}
+    assert get_cookie("foo") == "bar"
+
+
+def test_set_cookie_expires_in_thirty_days(mocker):
+    manager = mocker.patch("scripts.cookie_manager.get_cookie_manager").return_value
+    mocker.patch("scripts.cookie_manager._component_key", return_value="set_foo")
 
     set_cookie("foo", "bar")
 
     _, kwargs = manager.set.call_args
-
     assert kwargs["cookie"] == "foo"
     assert kwargs["val"] == "bar"
-
     expires_at = kwargs["expires_at"]
     assert isinstance(expires_at, datetime)
     assert expires_at.tzinfo == timezone.utc
     current_time = datetime.now(timezone.utc)
     assert expires_at > current_time
     assert expires_at < current_time + timedelta(days=365)
+
+
+def test_delete_cookie_calls_manager(browser):
+    browser["foo"] = "bar"
+    browser.new_run()
+
+    delete_cookie("foo")
+
+    assert "foo" not in browser
+
+
+def test_delete_cookie_missing_from_snapshot(browser):
+    delete_cookie("never-read")
+
+    assert get_cookie("never-read") is None
+
+
+def test_one_manager_per_run(browser):
+    browser["a"] = "1"
+    browser.new_run()
+
+    assert get_all_cookies() == {"a": "1"}
+    set_cookie("b", "2")
+    set_cookie("b", "3")
+    delete_cookie("a")
+    delete_cookie("a")
+    assert get_cookie("b") == "3"
+    assert browser.managers == 1
+
+    browser.new_run()
+    assert get_all_cookies() == {"b": "3"}
+    assert browser.managers == 2
+
+
+def test_cookies_ready_once_the_browser_reports(browser):
+    browser.reported = False
+    browser.new_run()
+    assert not cookies_ready()
+
+    browser.reported = True
+    browser.new_run()
+    assert cookies_ready()
@@ -1,11 +1,24 @@
 import pytest
 from decimal import Decimal
+
+import numpy as np
 from scripts.dca_allocator import (
+    allocate_buy_only,
+    allocate_dca,
+    allocate_dca_batch,
     scale_existing_positions,
     add_mock_targets,
     compute_target_weights,
+    mock_ticker_names,
     recalculate_pie_allocation,
+    recalculate_tree_allocation,
+    round_pie_weights,
+    solve_target_weights,
+    sweep_pie_allocation,
+    target_leaf_factors,
+    water_fill,
 )
+from scripts.portfolio import PortfolioTree
 
 
 @pytest.fixture
@@ -85,6 +98,27 @@ def test_compute_target_weights():
     assert weights["A"] > weights["B"] > weights["C"]
 
 
+@pytest.mark.parametrize(
+    "children",
+    [{}, {"A": {"type": "ticker", "value": 0}, "B": {"type": "ticker", "value": 0}}],
+)
+def test_compute_target_weights_without_value(children):
+    """Empty or worthless pies get no target weights, as before."""
+    assert compute_target_weights({"type": "pie", "children": children}) == {}
+
+
+def test_allocate_dca_batch_empty_pie():
+    """An empty pie allocates nothing, like allocate_dca."""
+    empty = {"type": "pie", "value": 0, "children": {}}
+    assert allocate_dca(empty, Decimal("100")) == {}
+    assert allocate_dca_batch(empty, [100.0]).empty
+
+
+def test_round_pie_weights_empty_pie():
+    weights, binding, error = round_pie_weights(np.zeros(0))
+    assert len(weights) == 0 and binding == [] and error == 0.0
+
+
 def test_recalculate_pie_allocation_full(base_pie):
     """
     Full pipeline test: scale, add tickers, compute weights.
@@ -96,3 +130,281 @@ def test_recalculate_pie_allocation_full(base_pie):
     assert "NEW_2" in children
     assert all("target_weight" in v for v in children.values())
     assert sum(v["target_weight"] for v in children.values()) == 100
+
+
+def test_allocate_dca_nested_factors():
+    """Capital is split by the product of weights down each pie path."""
+    portfolio = {
+        "name": "root",
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "P": {
+                "type": "pie",
+                "value": 0,
+                "children": {
+                    "X": {"type": "ticker", "value": 25},
+                    "Y": {"type": "ticker", "value": 75},
+                },
+            },
+            "Z": {"type": "ticker", "value": 100, "id": "ZZ"},
+        },
+    }
+    allocations = allocate_dca(portfolio, Decimal("100"))
+    assert allocations == {
+        "X": Decimal("12.5"),
+        "Y": Decimal("37.5"),
+        "ZZ": Decimal("50.0"),
+    }
+
+
+def test_allocate_dca_batch_matches_single_calls():
+    """Each batch row equals a single allocate_dca call for that amount."""
+    portfolio = {
+        "name": "root",
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "P": {
+                "type": "pie",
+                "value": 0,
+                "children": {
+                    "X": {"type": "ticker", "value": 30},
+                    "Y": {"type": "ticker", "value": 70},
+                },
+            },
+            "X2": {"type": "ticker", "value": 100, "id": "X"},
+        },
+    }
+    matrix = allocate_dca_batch(portfolio, [10, 250.5])
+    assert list(matrix.columns) == ["X", "Y"]
+    for amount in (10, 250.5):
+        single = allocate_dca(portfolio, Decimal(str(amount)))
+        for key, value in single.items():
+            assert matrix.loc[amount, key] == pytest.approx(float(value))
+
+
+def test_sweep_pie_allocation_matches_recalculate(base_pie):
+    """A sweep row matches the capital recalculate_pie_allocation assigns."""
+    sweep = sweep_pie_allocation(base_pie, [50.0, 500.0], [0, 80], [1, 2])
+    assert sweep.shape == (8, 5)
+
+    result = recalculate_pie_allocation(base_pie)
+    row = sweep.loc[(50.0, 80.0, 2)]
+    for name, child in result["children"].items():
+        current = base_pie["children"].get(name, {}).get("value", 0.0)
+        assert row[name] == pytest.approx(child["value"] - current, abs=0.01)
+    assert sweep.loc[(50.0, 80.0, 1), "NEW_2"] == 0.0
+
+
+def test_mock_tickers_never_overwrite_existing_slices():
+    """Mock names skip NEW_i names that a pie already uses."""
+    pie = {
+        "type": "pie",
+        "value": 30.0,
+        "children": {
+            "NEW_1": {"type": "ticker", "value": 20.0},
+            "A": {"type": "ticker", "value": 10.0},
+        },
+    }
+    assert mock_ticker_names(pie["children"], 2) == ["NEW_2", "NEW_3"]
+
+    result = recalculate_pie_allocation(pie)
+    assert result["children"]["NEW_1"]["value"] == pytest.approx(26.67, abs=0.01)
+    assert set(result["children"]) == {"NEW_1", "A", "NEW_2", "NEW_3"}
+
+    tree_result = recalculate_tree_allocation(pie)
+    assert set(tree_result["children"]) == {"NEW_1", "A", "NEW_2", "NEW_3"}
+
+    sweep = sweep_pie_allocation(pie, [50.0], [80], [2])
+    assert list(sweep.columns) == ["NEW_1", "A", "NEW_2", "NEW_3"]
+
+
+def test_sweep_pie_allocation_zero_value_pie():
+    """A pie worth nothing splits funds equally instead of producing NaN."""
+    pie = {
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "A": {"type": "ticker", "value": 0},
+            "B": {"type": "ticker", "value": 0},
+        },
+    }
+    sweep = sweep_pie_allocation(pie, [100.0], [50], [1])
+    assert np.isfinite(sweep.to_numpy()).all()
+    assert sweep.loc[(100.0, 50.0, 1)].tolist() == [25.0, 25.0, 50.0]
+
+    empty = sweep_pie_allocation(
+        {"type": "pie", "value": 0, "children": {}}, [10.0], [0], [0]
+    )
+    assert empty.shape == (1, 0)
+
+
+def test_target_leaf_factors_zero_value_pie():
+    """Target factors stay finite when a pie and its children are worth 0."""
+    pie = {
+        "type": "pie",
+        "value": 0,
+        "children": {"P": {"type": "pie", "value": 0, "children": {}}},
+    }
+    tree = PortfolioTree.from_dict(pie).rollup().compute_weights()
+    assert np.isfinite(target_leaf_factors(tree)).all()
+
+
+def test_target_leaf_factors_leaves_weights_unchanged():
+    """Target factors follow target_weight without overwriting tree weights."""
+    pie = {
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "A": {"type": "ticker", "value": 30, "target_weight": 50},
+            "B": {"type": "ticker", "value": 70, "target_weight": 50},
+        },
+    }
+    tree = PortfolioTree.from_dict(pie).rollup().compute_weights()
+    weights = tree.weights.copy()
+    assert target_leaf_factors(tree).tolist() == [1.0, 0.5, 0.5]
+    np.testing.assert_array_equal(tree.weights, weights)
+
+
+@pytest.fixture
+def nested_pie():
+    """Two-level pie: a sub-pie worth 200 and a ticker worth 100."""
+    return {
+        "name": "main",
+        "type": "pie",
+        "value": 300.0,
+        "children": {
+            "TECH": {
+                "type": "pie",
+                "value": 200.0,
+                "children": {
+                    "AAPL": {"type": "ticker", "value": 150.0},
+                    "MSFT": {"type": "ticker", "value": 50.0},
+                },
+            },
+            "GOOGL": {"type": "ticker", "value": 100.0},
+        },
+    }
+
+
+def test_recalculate_tree_allocation_scales_nested_pies(nested_pie):
+    """Capital for existing positions reaches tickers inside sub-pies."""
+    result = recalculate_tree_allocation(
+        nested_pie,
+        new_funds=Decimal("100"),
+        new_ticker_count=2,
+        percent_to_new=Decimal("40"),
+    )
+    tech = result["children"]["TECH"]
+    assert tech["children"]["AAPL"]["value"] == Decimal("180")
+    assert tech["children"]["MSFT"]["value"] == Decimal("60")
+    assert tech["value"] == Decimal("240")
+    assert result["children"]["NEW_1"]["value"] == Decimal("20")
+    assert result["value"] == Decimal("400")
+    assert tech["target_weight"] == 60
+    assert sum(c["target_weight"] for c in tech["children"].values()) == 100
+
+
+def test_recalculate_tree_allocation_mock_depth(nested_pie):
+    """Mock tickers can be added inside every pie at a deeper level."""
+    result = recalculate_tree_allocation(
+        nested_pie,
+        new_funds=Decimal("50"),
+        new_ticker_count=2,
+        percent_to_new=Decimal("100"),
+        mock_depth=2,
+    )
+    tech_children = result["children"]["TECH"]["children"]
+    assert tech_children["NEW_2"]["value"] == Decimal("25")
+    assert "NEW_1" not in result["children"]
+    assert result["value"] == Decimal("350")
+
+    with pytest.raises(ValueError):
+        recalculate_tree_allocation(nested_pie, mock_depth=5)
+
+
+def test_water_fill_buys_underweight_first():
+    """Cash tops up the most underweight slots and never sells."""
+    buys = water_fill([50, 30, 20], [1, 1, 1], 30)
+    assert buys.tolist() == pytest.approx([0, 10, 20])
+
+    buys = water_fill([50, 30, 20], [0.5, 0.3, 0.2], 100)
+    assert buys.tolist() == pytest.approx([50, 30, 20])
+    assert water_fill([10, 0], [0, 0], 5).tolist() == [0, 0]
+
+
+def test_allocate_buy_only_reduces_nested_drift(nested_pie):
+    """Deposits follow target weights down through sub-pies."""
+    nested_pie["children"]["TECH"]["target_weight"] = 50
+    nested_pie["children"]["GOOGL"]["target_weight"] = 50
+    tech = nested_pie["children"]["TECH"]["children"]
+    tech["AAPL"]["target_weight"] = 50
+    tech["MSFT"]["target_weight"] = 50
+
+    result = allocate_buy_only(nested_pie, Decimal("150"))
+    assert result["value"] == Decimal("450")
+    assert result["children"]["GOOGL"]["value"] == Decimal("225")
+    tech = result["children"]["TECH"]["children"]
+    assert tech["AAPL"]["value"] == Decimal("150")
+    assert tech["MSFT"]["value"] == Decimal("75")
+
+
+def test_allocate_buy_only_without_targets_is_proportional(nested_pie):
+    """Without target weights, buys keep current proportions."""
+    result = allocate_buy_only(nested_pie, Decimal("30"))
+    assert result["children"]["GOOGL"]["value"] == Decimal("110")
+    assert result["children"]["TECH"]["children"]["MSFT"]["value"] == Decimal("55")
+
+
+@pytest.mark.parametrize("values", [(30.0, 10.0), (0.0, 0.0)])
+def test_allocate_buy_only_conserves_cash_with_zero_targets(values):
+    """Pies whose targets are all zero still spend their whole share."""
+    pie = {
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "A": {"type": "ticker", "value": values[0], "target_weight": 0},
+            "B": {"type": "ticker", "value": values[1], "target_weight": 0},
+        },
+    }
+    result = allocate_buy_only(pie, Decimal("40"))
+    bought = [
+        result["children"][k]["value"] - Decimal(str(v)) for k, v in zip("AB", values)
+    ]
+    assert sum(bought) == Decimal("40")
+    expected = [Decimal("30"), Decimal("10")] if values[0] else [Decimal("20")] * 2
+    assert bought == expected
+
+
+def test_round_pie_weights_enforces_minimum_slice():
+    """Tiny slices get 1% and the overshoot comes off the largest slice."""
+    weights, binding, error = round_pie_weights(np.array([980.0, 10, 5, 5]))
+    assert weights.tolist() == [97, 1, 1, 1]
+    assert binding == ["min_slice"]
+    assert error == pytest.approx(2.0)
+
+
+def test_round_pie_weights_wide_pie_and_limit():
+    """A 100-slice pie is allowed and binding; 101 slices are rejected."""
+    weights, binding, _ = round_pie_weights(np.arange(1.0, 101.0))
+    assert weights.sum() == 100
+    assert weights.min() == 1
+    assert "max_slices" in binding
+
+    with pytest.raises(ValueError):
+        round_pie_weights(np.ones(101))
+
+
+def test_solve_target_weights_every_pie(nested_pie):
+    """Every pie in the tree gets whole-percent weights summing to 100."""
+    nested_pie["children"]["TECH"]["children"]["TINY"] = {
+        "type": "ticker",
+        "value": 0.5,
+    }
+    result = solve_target_weights(nested_pie)
+    assert set(result) == {"main", "TECH"}
+    assert result["main"]["weights"] == {"TECH": 67, "GOOGL": 33}
+    assert result["TECH"]["weights"] == {"AAPL": 74, "MSFT": 25, "TINY": 1}
+    assert result["TECH"]["binding"] == ["min_slice"]
+    assert result["main"]["binding"] == []
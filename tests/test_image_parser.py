@@ -0,0 +1,463 @@
+import asyncio
+import base64
+import json
+import time
+from io import BytesIO
+
+import httpx
+import openai
+import pytest
+import streamlit as st
+from PIL import Image
+
+from scripts import image_parser, openai_pool
+from scripts.image_parser import (
+    RESPONSE_TOKEN_CAPS,
+    TruncatedResponse,
+    _extract_with_openai,
+    check_stitched_total,
+    clean_parsed_slices,
+    extract_hybrid_slices_from_image,
+    handle_image_upload,
+    handle_multi_image_upload,
+    parse_images,
+    parse_images_async,
+    stitch_slices,
+)
+from scripts.uploaded_image import UploadedImage
+
+
+def _png(color):
+    buf = BytesIO()
+    Image.new("RGB", (4, 4), color).save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+
+def _completion(content, finish_reason="stop"):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }
+        ],
+    }
+
+
+@pytest.fixture
+def fake_vision():
+    """
+    Fake Vision server recording peak concurrency and request count. Red
+    images get a non-JSON reply.
+    """
+    state = {"active": 0, "peak": 0, "requests": 0}
+
+    async def handler(request):
+        state["requests"] += 1
+        number = state["requests"]
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+
+        body = json.loads(request.content)
+        image_url = body["messages"][0]["content"][1]["image_url"]["url"]
+        image = Image.open(BytesIO(base64.b64decode(image_url.split(",", 1)[1])))
+        red, green, _ = image.convert("RGB").getpixel((0, 0))
+        if red > 200 and green < 50:
+            return httpx.Response(200, json=_completion("not json"))
+        slices = {f"T{number}": {"type": "ticker", "value": 10.5}}
+        reply = "```json\n" + json.dumps(slices) + "\n```"
+        return httpx.Response(200, json=_completion(reply))
+
+    def make_client():
+        return openai.AsyncOpenAI(
+            api_key="test",
+            base_url="http://fake-vision/v1",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            max_retries=0,
+        )
+
+    state["client"] = make_client
+    return state
+
+
+def test_parse_images_bounds_concurrency(fake_vision):
+    files = {f"img{i}": _png((i, i, i)) for i in range(10)}
+    results = asyncio.run(
+        parse_images_async(files, fake_vision["client"](), concurrency=3)
+    )
+
+    assert set(results) == set(files)
+    assert fake_vision["requests"] == 10
+    assert 1 < fake_vision["peak"] <= 3
+    for parsed in results.values():
+        (slice_,) = parsed.values()
+        assert slice_ == {"type": "ticker", "value": 10.5}
+
+
+def test_parse_images_reports_results_and_isolates_failures(fake_vision):
+    files = {"good": _png((0, 0, 0)), "bad": _png((255, 0, 0))}
+    seen = []
+
+    results = parse_images(
+        files,
+        api_key="unused",
+        on_result=lambda key, parsed: seen.append(key),
+        client=fake_vision["client"](),
+    )
+
+    assert seen == ["good"]
+    assert isinstance(results["bad"], Exception)
+    assert list(results["good"].values())[0]["value"] == 10.5
+
+
+def test_parse_images_closes_the_client_it_creates(fake_vision, mocker):
+    client = fake_vision["client"]()
+    mocker.patch("scripts.image_parser.new_async_client", return_value=client)
+
+    results = parse_images({"good": _png((0, 0, 0))}, api_key="test")
+
+    assert list(results["good"].values())[0]["value"] == 10.5
+    assert client.is_closed()
+
+
+def test_parse_images_leaves_a_given_client_open(fake_vision):
+    client = fake_vision["client"]()
+    parse_images({"good": _png((0, 0, 0))}, api_key="unused", client=client)
+    assert not client.is_closed()
+
+
+def test_parse_images_follows_the_routing_policy(fake_vision, tmp_path, monkeypatch):
+    monkeypatch.setitem(st.session_state, "DATA_DIR", str(tmp_path))
+    image = UploadedImage.wrap(_png((0, 0, 0)))
+    replays = tmp_path / "replays"
+    replays.mkdir()
+    recorded = {"VTI": {"type": "ticker", "value": 7.0}}
+    (replays / f"{image.sha256}.json").write_text(json.dumps(recorded))
+
+    results = parse_images(
+        {image.sha256: image, "new": _png((0, 0, 1))},
+        api_key="unused",
+        client=fake_vision["client"](),
+        policy="replay-first",
+    )
+
+    assert results[image.sha256] == recorded
+    assert list(results["new"]) == ["T1"]
+    assert fake_vision["requests"] == 1
+
+
+def test_tall_screenshot_is_parsed_as_tiles(fake_vision):
+    tall = BytesIO()
+    Image.new("RGB", (400, 2400), (0, 0, 0)).save(tall, format="PNG")
+
+    results = parse_images(
+        {"tall": tall}, api_key="unused", client=fake_vision["client"]()
+    )
+
+    assert fake_vision["requests"] == len(results["tall"]) == 4
+    assert fake_vision["peak"] > 1
+
+
+def test_tall_screenshot_closes_the_client_it_creates(fake_vision, mocker):
+    client = fake_vision["client"]()
+    mocker.patch("scripts.image_parser.new_async_client", return_value=client)
+    tall = BytesIO()
+    Image.new("RGB", (400, 2400), (0, 0, 0)).save(tall, format="PNG")
+
+    slices = _extract_with_openai(UploadedImage.wrap(tall), "test")
+
+    assert len(slices) == 4
+    assert client.is_closed()
+
+
+def test_stitch_slices_reconciles_overlap_rows():
+    tiles = [
+        {
+            "AAPL": {"type": "ticker", "value": 100.0},
+            "Dividend Gr": {"type": "pie", "value": 250.5},
+        },
+        {
+            "Dividend Growth": {"type": "pie", "value": "$250.50"},
+            "msft ": {"type": "ticker", "value": 80.0},
+        },
+        {"MSFT": {"type": "ticker", "value": 80.0}, "VTI": {"type": "ticker"}},
+    ]
+
+    merged = stitch_slices(tiles)
+
+    assert set(merged) == {"AAPL", "Dividend Growth", "msft ", "VTI"}
+    assert merged["Dividend Growth"]["value"] == 250.5
+
+
+def test_stitch_slices_keeps_rows_of_one_part_apart():
+    tiles = [
+        {
+            "VT": {"type": "ticker", "value": 50.0},
+            "VTI": {"type": "ticker", "value": 50},
+        },
+        {
+            "VTI": {"type": "ticker", "value": 50.0},
+            "BND": {"type": "ticker", "value": 5},
+        },
+        {
+            "BN": {"type": "ticker", "value": 5.0},
+            "VXUS": {"type": "ticker", "value": 50},
+        },
+    ]
+
+    merged = stitch_slices(tiles)
+
+    assert set(merged) == {"VT", "VTI", "BND", "VXUS"}
+
+
+def test_check_stitched_total():
+    slices = {
+        "A": {"type": "ticker", "value": 60.0},
+        "B": {"type": "ticker", "value": "$40.00"},
+    }
+
+    assert check_stitched_total(slices, 100.0) is None
+    assert check_stitched_total(slices, 100.5) is None
+    assert check_stitched_total(slices, 150.0) == -50.0
+
+
+def test_multi_upload_stitches_and_persists_once(tmp_path, monkeypatch, mocker):
+    monkeypatch.setitem(st.session_state, "DATA_DIR", str(tmp_path))
+    monkeypatch.setitem(st.session_state, "parsed_images", {})
+    monkeypatch.delitem(st.session_state, "processed_batch", raising=False)
+    monkeypatch.delitem(st.session_state, "dirty_paths", raising=False)
+    portfolio = {"name": "test", "type": "pie", "value": 0, "children": {}}
+    monkeypatch.setitem(st.session_state, "portfolio", portfolio)
+    parts = [
+        {"A": {"type": "ticker", "value": 60.0}, "B": {"type": "ticker", "value": 20}},
+        {"B": {"type": "ticker", "value": 20}, "C": {"type": "ticker", "value": 20}},
+    ]
+    files = [_png((0, 0, 0)), _png((0, 0, 1))]
+
+    def fake_parse(pending, api_key, on_result, policy):
+        for (key, _), parsed in zip(pending.items(), parts):
+            on_result(key, parsed)
+        return dict(zip(pending, parts))
+
+    mocker.patch("scripts.image_parser.parse_images", side_effect=fake_parse)
+    save = mocker.patch("scripts.image_parser.save_current_portfolio")
+    mocker.patch.object(st, "rerun")
+    warning = mocker.patch.object(st, "warning")
+
+    handle_multi_image_upload(files, False, portfolio, "key", expected_total=130.0)
+
+    assert set(portfolio["children"]) == {"A", "B", "C"}
+    assert st.session_state["portfolio"]["value"] == 100
+    save.assert_called_once()
+    warning.assert_called_once()
+
+
+def test_multi_upload_merge_mode_skips_failed_screenshots(
+    tmp_path, monkeypatch, mocker
+):
+    monkeypatch.setitem(st.session_state, "DATA_DIR", str(tmp_path))
+    monkeypatch.setitem(st.session_state, "parsed_images", {})
+    monkeypatch.delitem(st.session_state, "processed_batch", raising=False)
+    monkeypatch.delitem(st.session_state, "dirty_paths", raising=False)
+    portfolio = {"name": "test", "type": "pie", "value": 0, "children": {}}
+    monkeypatch.setitem(st.session_state, "portfolio", portfolio)
+    parsed = {"VT": {"type": "ticker", "value": 50.0}}
+    merged_on_arrival = []
+
+    def fake_parse(pending, api_key, on_result, policy):
+        good, bad = pending
+        on_result(good, parsed)
+        merged_on_arrival.append(set(portfolio["children"]))
+        return {good: parsed, bad: ValueError("unreadable")}
+
+    mocker.patch("scripts.image_parser.parse_images", side_effect=fake_parse)
+    save = mocker.patch("scripts.image_parser.save_current_portfolio")
+    mocker.patch.object(st, "rerun")
+    error = mocker.patch.object(st, "error")
+    files = [_png((0, 0, 0)), _png((0, 0, 1))]
+
+    handle_multi_image_upload(files, False, portfolio, "key", mode="merge")
+
+    assert merged_on_arrival == [{"VT"}]
+    assert st.session_state["portfolio"]["value"] == 50
+    save.assert_called_once()
+    error.assert_called_once()
+
+
+def _sse(events):
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+    return body + "data: [DONE]\n\n"
+
+
+def test_streamed_vision_response_reports_slices_progressively():
+    reply = json.dumps(
+        {
+            "AAPL": {"type": "ticker", "value": 10},
+            "Growth": {"type": "pie", "value": 20},
+        }
+    )
+    chunks = [reply[i : i + 9] for i in range(0, len(reply), 9)]
+    events = [
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [{"index": 0, "delta": {"content": chunk}}],
+        }
+        for chunk in chunks
+    ]
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse(events).encode(),
+        )
+
+    client = openai.OpenAI(
+        api_key="test",
+        base_url="http://fake-vision/v1",
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+        max_retries=0,
+    )
+    seen = []
+
+    parsed = extract_hybrid_slices_from_image(
+        _png((0, 0, 0)),
+        "unused",
+        on_slice=lambda *entry: seen.append(entry),
+        client=client,
+    )
+
+    assert seen == list(parsed.items())
+    assert clean_parsed_slices(parsed)["Growth"] == {"type": "pie", "value": 20}
+
+
+def _sync_client(handler):
+    return openai.OpenAI(
+        api_key="test",
+        base_url="http://fake-vision/v1",
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+        max_retries=0,
+    )
+
+
+def test_truncated_response_is_retried_with_a_larger_cap():
+    caps = []
+
+    def handler(request):
+        caps.append(json.loads(request.content)["max_tokens"])
+        if len(caps) == 1:
+            return httpx.Response(200, json=_completion('{"AAPL": {', "length"))
+        reply = json.dumps({"AAPL": {"type": "ticker", "value": 10}})
+        return httpx.Response(200, json=_completion(reply))
+
+    upload = UploadedImage.wrap(_png((0, 0, 0)))
+    parsed = _extract_with_openai(upload, client=_sync_client(handler))
+
+    assert caps == list(RESPONSE_TOKEN_CAPS)
+    assert parsed == {"AAPL": {"type": "ticker", "value": 10}}
+
+
+def test_streamed_response_truncated_at_every_cap_raises():
+    events = [
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": '{"AAPL": {"type": "ticker", "value": 1}, '},
+                    "finish_reason": "length",
+                }
+            ],
+        }
+    ]
+
+    def handler(request):
+        return httpx.Response(
+            200,
+            headers={"content-type": "text/event-stream"},
+            content=_sse(events).encode(),
+        )
+
+    upload = UploadedImage.wrap(_png((0, 0, 0)))
+    seen = []
+
+    with pytest.raises(TruncatedResponse):
+        _extract_with_openai(
+            upload,
+            on_slice=lambda *entry: seen.append(entry),
+            client=_sync_client(handler),
+        )
+    assert len(seen) == len(RESPONSE_TOKEN_CAPS)
+
+
+def test_truncated_parse_is_shown_as_an_error(monkeypatch, mocker):
+    monkeypatch.setitem(st.session_state, "parsed_images", {})
+    mocker.patch.object(image_parser, "_show_uploaded_image")
+    mocker.patch.object(
+        image_parser,
+        "_parse_and_cache_image",
+        side_effect=TruncatedResponse("cut off"),
+    )
+    error = mocker.patch.object(image_parser.st, "error")
+    update = mocker.patch.object(image_parser, "update_children")
+
+    handle_image_upload(_png((0, 0, 0)), False, {"children": {}}, "key")
+
+    assert "cut off" in error.call_args.args[0]
+    update.assert_not_called()
+
+
+def test_stream_broken_off_midway_is_retried_and_counted(mocker):
+    mocker.patch("scripts.openai_pool.time.sleep")
+    reply = json.dumps({"AAPL": {"type": "ticker", "value": 10}})
+    event = {
+        "id": "chatcmpl-test",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "delta": {"content": reply}}],
+    }
+    calls = []
+
+    def broken_body():
+        yield f"data: {json.dumps(event)}\n\n".encode()
+        raise httpx.ReadError("connection lost")
+
+    def handler(request):
+        calls.append(request)
+        body = broken_body() if len(calls) == 1 else _sse([event]).encode()
+        return httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, content=body
+        )
+
+    client = _sync_client(handler)
+    client.api_key = "stream-retry-test"
+    breaker = openai_pool.get_breaker(client.api_key)
+    failure = mocker.spy(breaker, "record_failure")
+    seen = []
+
+    parsed = _extract_with_openai(
+        UploadedImage.wrap(_png((0, 0, 0))),
+        on_slice=lambda *entry: seen.append(entry),
+        client=client,
+    )
+
+    assert len(calls) == 2
+    assert failure.call_count == 1
+    assert parsed == json.loads(reply)
+    assert seen == [("AAPL", {"type": "ticker", "value": 10})] * 2
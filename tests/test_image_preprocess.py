@@ -0,0 +1,82 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from scripts.image_preprocess import (
+    crop_to_content,
+    crop_to_holdings,
+    preprocess_image,
+    split_tiles,
+)
+
+
+def _screenshot(size=(1170, 2532)):
+    """Retina-sized screenshot with noisy rows on a white background."""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    rng = np.random.default_rng(0)
+    for top in range(300, 2200, 120):
+        draw.rectangle((60, top, 1100, top + 80), fill=tuple(rng.integers(0, 255, 3)))
+        draw.text((80, top + 20), f"TICKER {top}", fill="black")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+
+def test_crop_to_content_trims_uniform_margins():
+    image = Image.new("RGB", (200, 100), "white")
+    ImageDraw.Draw(image).rectangle((50, 20, 149, 59), fill="black")
+
+    cropped = crop_to_content(image)
+
+    assert cropped.size == (100 + 16, 40 + 16)
+
+
+def test_crop_to_content_keeps_uniform_image():
+    image = Image.new("RGB", (20, 10), "white")
+
+    assert crop_to_content(image).size == (20, 10)
+
+
+def test_preprocess_image_shrinks_payload():
+    file = _screenshot()
+
+    result = preprocess_image(file, max_long_edge=1200, max_bytes=150_000)
+
+    assert result["original_bytes"] == len(file.getvalue())
+    assert result["bytes"] == len(result["data"]) <= 150_000
+    assert max(result["size"]) <= 1200
+    assert result["mime"] in {"image/webp", "image/jpeg"}
+    assert Image.open(BytesIO(result["data"])).size == result["size"]
+
+
+def test_crop_to_holdings_drops_header_and_tab_bar():
+    image = Image.new("RGB", (400, 900), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 10, 380, 40), fill="black")  # status bar
+    for top in range(200, 600, 50):
+        draw.rectangle((30, top, 370, top + 30), fill="gray")
+    draw.rectangle((0, 820, 399, 899), fill="black")  # tab bar
+
+    cropped = crop_to_holdings(image)
+
+    assert cropped.size == (341 + 16, 381 + 16)
+
+
+def test_crop_to_holdings_trims_margins_without_a_list():
+    image = Image.new("RGB", (200, 100), "white")
+    ImageDraw.Draw(image).rectangle((50, 20, 149, 59), fill="black")
+
+    assert crop_to_holdings(image).size == crop_to_content(image).size
+
+
+def test_split_tiles_covers_tall_images_with_overlap():
+    image = Image.new("RGB", (100, 1000))
+
+    tiles = split_tiles(image, max_aspect=2.5, tile_aspect=2.0, overlap=0.25)
+
+    assert [tile.size for tile in tiles] == [(100, 200)] * 7
+    short = Image.new("RGB", (100, 250))
+    assert split_tiles(short) == [short]
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from scripts.openai_pool import (
+    CircuitBreaker,
+    CircuitOpenError,
+    SingleFlight,
+    call_with_retries,
+    call_with_retries_async,
+    get_client,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(mocker):
+    mocker.patch("scripts.openai_pool.backoff_delay", return_value=0)
+
+
+def _flaky_client(failures):
+    """Client whose endpoint returns 503 `failures` times, then succeeds."""
+    calls = {"count": 0}
+
+    def handler(request):
+        calls["count"] += 1
+        if calls["count"] <= failures:
+            return httpx.Response(503, json={"error": {"message": "busy"}})
+        return httpx.Response(200, json={"data": [], "object": "list"})
+
+    client = openai.OpenAI(
+        api_key="test",
+        base_url="http://fake/v1",
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+        max_retries=0,
+    )
+    return client, calls
+
+
+def test_get_client_is_pooled_per_key():
+    assert get_client("key-a") is get_client("key-a")
+    assert get_client("key-a") is not get_client("key-b")
+
+
+def test_transient_errors_are_retried():
+    client, calls = _flaky_client(failures=2)
+    breaker = CircuitBreaker()
+
+    call_with_retries(client.models.list, breaker)
+
+    assert calls["count"] == 3
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_retries_are_bounded():
+    client, calls = _flaky_client(failures=10)
+
+    with pytest.raises(openai.InternalServerError):
+        call_with_retries(client.models.list, CircuitBreaker(), attempts=3)
+    assert calls["count"] == 3
+
+
+def test_async_retries():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 2:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://x"))
+        return "ok"
+
+    assert asyncio.run(call_with_retries_async(flaky, CircuitBreaker())) == "ok"
+    assert len(calls) == 2
+
+
+def test_circuit_opens_then_half_opens(mocker):
+    clock = mocker.patch("scripts.openai_pool.time.monotonic", return_value=100.0)
+    client, calls = _flaky_client(failures=3)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    with pytest.raises(openai.InternalServerError):
+        call_with_retries(client.models.list, breaker, attempts=2)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(client.models.list, breaker)
+    assert calls["count"] == 2
+
+    clock.return_value = 131.0
+    assert breaker.state == "half-open"
+    with pytest.raises(openai.InternalServerError):
+        call_with_retries(client.models.list, breaker, attempts=1)
+    assert breaker.state == "open"
+
+    clock.return_value = 162.0
+    call_with_retries(client.models.list, breaker, attempts=1)
+    assert breaker.state == "closed"
+
+
+@pytest.mark.parametrize("error", [ValueError("bad request"), asyncio.CancelledError()])
+def test_half_open_trial_is_released_by_other_errors(mocker, error):
+    clock = mocker.patch("scripts.openai_pool.time.monotonic", return_value=100.0)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.return_value = 131.0
+
+    def rejected():
+        raise error
+
+    async def rejected_async():
+        raise error
+
+    with pytest.raises(type(error)):
+        call_with_retries(rejected, breaker)
+    with pytest.raises(type(error)):
+        asyncio.run(call_with_retries_async(rejected_async, breaker))
+
+    assert breaker.state == "half-open"
+    assert call_with_retries(lambda: "ok", breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return {"parsed": True}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("hash", slow)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"parsed": True}] * 5
+    assert flight.do("hash", lambda: "fresh") == "fresh"
+
+
+def test_single_flight_shares_errors_and_async_callers():
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0)
+        raise ValueError("bad image")
+
+    async def run():
+        return await asyncio.gather(
+            *(flight.do_async("hash", failing) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import pytest
+
+from scripts.dca_allocator import recalculate_pie_allocation
+from scripts.orders import allocations_from_adjustment, generate_orders
+
+
+def test_generate_orders_sums_exactly_to_deposit():
+    """Cent rounding keeps the total equal to the deposit."""
+    allocations = {
+        "A": Decimal("33.333"),
+        "B": Decimal("33.333"),
+        "C": Decimal("33.334"),
+    }
+    orders = generate_orders(allocations)
+    assert sum(o["amount"] for o in orders) == Decimal("100.00")
+    assert sorted(o["amount"] for o in orders) == [
+        Decimal("33.33"),
+        Decimal("33.33"),
+        Decimal("33.34"),
+    ]
+
+
+def test_generate_orders_redistributes_small_buys():
+    """Buys under the minimum are dropped and their capital spread out."""
+    allocations = {"BIG": Decimal("9"), "MID": Decimal("0.9"), "TINY": Decimal("0.1")}
+    orders = generate_orders(allocations)
+    assert [o["ticker"] for o in orders] == ["BIG"]
+    assert orders[0]["amount"] == Decimal("10.00")
+
+    allocations = {"A": Decimal("5"), "B": Decimal("4.5"), "C": Decimal("0.5")}
+    orders = generate_orders(allocations, deposit=Decimal("10"))
+    assert {o["ticker"]: o["amount"] for o in orders} == {
+        "A": Decimal("5.26"),
+        "B": Decimal("4.74"),
+    }
+
+
+def test_generate_orders_below_minimum_deposit():
+    """A deposit under the minimum trade size produces no orders."""
+    assert generate_orders({"A": Decimal("0.5")}) == []
+
+
+def test_allocations_from_root_only_adjustment():
+    """Growth of a sub-pie is pushed down to its tickers."""
+    pie = {
+        "name": "main",
+        "type": "pie",
+        "value": 200.0,
+        "children": {
+            "TECH": {
+                "type": "pie",
+                "value": 100.0,
+                "children": {
+                    "AAPL": {"type": "ticker", "value": 75.0},
+                    "MSFT": {"type": "ticker", "value": 25.0},
+                },
+            },
+            "GOOGL": {"type": "ticker", "value": 100.0},
+        },
+    }
+    adjusted = recalculate_pie_allocation(
+        pie, new_funds=Decimal("100"), new_ticker_count=1, percent_to_new=Decimal("60")
+    )
+    allocations = allocations_from_adjustment(pie, adjusted)
+    assert allocations["AAPL"] == pytest.approx(Decimal("15"))
+    assert allocations["MSFT"] == pytest.approx(Decimal("5"))
+    assert allocations["GOOGL"] == Decimal("20")
+    assert allocations["NEW_1"] == Decimal("60")
@@ -0,0 +1,170 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+import streamlit as st
+
+from scripts import image_parser
+from scripts.parse_cache import ParseCache
+from scripts.perceptual_hash import dhash, value_region
+from scripts.uploaded_image import UploadedImage
+
+PARSED = {"AAPL": {"type": "ticker", "value": 12.5}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ParseCache(str(tmp_path / "cache.sqlite3"))
+
+
+def test_round_trip_is_keyed_by_hash_and_version(cache):
+    cache.put("abc", "v1", PARSED)
+
+    assert cache.get("abc", "v1") == PARSED
+    assert cache.get("abc", "v2") is None
+    assert cache.get("def", "v1") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_entries_persist_across_instances(cache):
+    cache.put("abc", "v1", PARSED)
+
+    assert ParseCache(cache.path).get("abc", "v1") == PARSED
+
+
+def test_expired_entries_are_misses(cache, mocker):
+    cache.put("abc", "v1", PARSED)
+    mocker.patch("scripts.parse_cache.time.time", return_value=cache.ttl + 1e10)
+
+    assert cache.get("abc", "v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, mocker):
+    clock = mocker.patch("scripts.parse_cache.time.time", return_value=1000.0)
+    entry_size = len('{"AAPL":{"type":"ticker","value":12.5}}')
+    cache = ParseCache(str(tmp_path / "cache.sqlite3"), max_bytes=2 * entry_size)
+
+    cache.put("a", "v1", PARSED)
+    clock.return_value = 1001.0
+    cache.put("b", "v1", PARSED)
+    clock.return_value = 1002.0
+    cache.get("a", "v1")
+    clock.return_value = 1003.0
+    cache.put("c", "v1", PARSED)
+
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") == PARSED
+    assert cache.get("c", "v1") == PARSED
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_evicted_entries_leave_the_perceptual_index(tmp_path, mocker, screenshot):
+    clock = mocker.patch("scripts.parse_cache.time.time", return_value=1000.0)
+    entry_size = len('{"AAPL":{"type":"ticker","value":12.5}}')
+    cache = ParseCache(str(tmp_path / "cache.sqlite3"), max_bytes=entry_size)
+    image = screenshot()
+    cache.put("a", "v1", PARSED)
+    cache.add_fingerprint("a", "v1", dhash(image), value_region(image))
+    assert [found[1] for found in cache.find_similar(dhash(image), "v1")] == ["a"]
+
+    clock.return_value = 1001.0
+    cache.put("b", "v1", PARSED)
+
+    assert cache.find_similar(dhash(image), "v1") == []
+    assert len(cache._index) == 0
+
+
+def test_shared_cache_is_safe_across_threads(tmp_path):
+    """Concurrent lookups, fingerprints and evictions keep index and counters."""
+    entry_size = len('{"AAPL":{"type":"ticker","value":12.5}}')
+    cache = ParseCache(str(tmp_path / "cache.sqlite3"), max_bytes=8 * entry_size)
+    rng = random.Random(0)
+    keys = [rng.getrandbits(64) for _ in range(40)]
+
+    def work(i):
+        cache.put(f"img{i}", "v1", PARSED)
+        cache.add_fingerprint(f"img{i}", "v1", keys[i], b"region")
+        cache.get(f"img{i}", "v1")
+        return cache.find_similar(keys[i], "v1")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(work, range(len(keys))))
+
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == len(keys)
+    assert len(cache._index) == stats["entries"] <= 8
+
+
+@pytest.fixture
+def upload(screenshot):
+    def make(**kwargs):
+        buffer = BytesIO()
+        screenshot(**kwargs).save(buffer, format="PNG")
+        return UploadedImage(buffer.getvalue())
+
+    return make
+
+
+@pytest.fixture
+def extract(tmp_path, monkeypatch, mocker):
+    monkeypatch.setitem(st.session_state, "DATA_DIR", str(tmp_path))
+    monkeypatch.setitem(st.session_state, "parsed_images", {})
+    return mocker.patch(
+        "scripts.image_parser.extract_hybrid_slices_from_image", return_value=PARSED
+    )
+
+
+def _parse(upload):
+    return image_parser._parse_and_cache_image(upload, upload.sha256, "key")
+
+
+def test_parse_and_cache_image_reuses_disk_cache(extract, upload):
+    upload = upload()
+
+    assert _parse(upload) == PARSED
+    st.session_state["parsed_images"].clear()
+    assert _parse(upload) == PARSED
+
+    extract.assert_called_once()
+    assert image_parser.get_parse_cache().stats()["entries"] == 1
+
+
+def test_near_duplicate_screenshot_reuses_parse(extract, upload):
+    _parse(upload())
+    retaken = upload(clock="10:02")
+
+    assert _parse(retaken) == PARSED
+    extract.assert_called_once()
+    cache = image_parser.get_parse_cache()
+    version = image_parser._parse_version("cloud")
+    assert cache.get(retaken.sha256, version) == PARSED
+
+
+def test_near_duplicate_from_another_parser_version_is_reparsed(
+    extract, upload, monkeypatch
+):
+    _parse(upload())
+    monkeypatch.setattr(image_parser, "PARSER_VERSION", "other")
+    _parse(upload(clock="10:02"))
+
+    assert extract.call_count == 2
+
+
+def test_near_duplicate_with_changed_values_is_reparsed(extract, upload):
+    _parse(upload())
+    _parse(upload(amount="$9,876.10"))
+
+    assert extract.call_count == 2
+
+
+def test_parse_is_not_reused_under_another_policy(extract, upload, monkeypatch):
+    _parse(upload())
+    monkeypatch.setitem(st.session_state, "parser_policy", "local-first")
+    _parse(upload())
+
+    assert extract.call_count == 2
+    assert extract.call_args.kwargs["policy"] == "local-first"
@@ -0,0 +1,174 @@
+import asyncio
+import sys
+import threading
+
+import pytest
+
+from scripts.parser_backends import (
+    BackendRouter,
+    BackendUnavailable,
+    LocalOCRBackend,
+    OpenAIBackend,
+    ParserBackend,
+    ReplayBackend,
+    slices_from_ocr_words,
+)
+from scripts.uploaded_image import UploadedImage
+
+SLICES = {
+    "AAPL": {"type": "ticker", "value": 100.0},
+    "Dividends": {"type": "pie", "value": 50.25},
+}
+
+
+class StubBackend(ParserBackend):
+    def __init__(self, name, slices=None, confidence=1.0, error=None):
+        self.name = name
+        self.slices = slices or {}
+        self.confidence = confidence
+        self.error = error
+        self.calls = 0
+
+    def parse(self, upload, **context):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return {
+            "slices": self.slices,
+            "confidence": self.confidence,
+            "backend": self.name,
+        }
+
+
+def _words(rows):
+    """Build image_to_data output from (line, left, text, conf) tuples."""
+    words = {
+        k: [] for k in ("text", "conf", "left", "block_num", "par_num", "line_num")
+    }
+    for line, left, text, conf in rows:
+        words["text"].append(text)
+        words["conf"].append(conf)
+        words["left"].append(left)
+        words["block_num"].append(1)
+        words["par_num"].append(1)
+        words["line_num"].append(line)
+    return words
+
+
+def test_slices_from_ocr_words_reads_m1_rows():
+    words = _words(
+        [
+            (1, 10, "Holdings", 95),
+            (2, 10, "AAPL", 96),
+            (2, 400, "$1,234.50", 92),
+            (2, 300, "12%", 90),
+            (3, 10, "Dividend", 90),
+            (3, 100, "Growth", 88),
+            (3, 400, "$50.25", 94),
+            (4, 10, "", -1),
+        ]
+    )
+
+    slices, confidence = slices_from_ocr_words(words)
+
+    assert slices == {
+        "AAPL": {"type": "ticker", "value": 1234.5},
+        "Dividend Growth": {"type": "pie", "value": 50.25},
+    }
+    assert confidence == pytest.approx(0.92)
+    assert slices_from_ocr_words(_words([(1, 0, "Hello", 90)])) == ({}, 0.0)
+
+
+def test_local_backend_reports_missing_tesseract(monkeypatch):
+    monkeypatch.setitem(sys.modules, "pytesseract", None)
+
+    with pytest.raises(BackendUnavailable):
+        LocalOCRBackend().parse(UploadedImage(b""))
+
+
+def test_replay_backend_records_then_replays(tmp_path):
+    upload = UploadedImage(b"screenshot")
+    inner = StubBackend("openai", SLICES)
+
+    recorded = ReplayBackend(str(tmp_path), inner=inner).parse(upload)
+    replayed = ReplayBackend(str(tmp_path)).parse(upload)
+
+    assert recorded["backend"] == "openai"
+    assert replayed == {"slices": SLICES, "confidence": 1.0, "backend": "replay"}
+    assert inner.calls == 1
+    with pytest.raises(BackendUnavailable):
+        ReplayBackend(str(tmp_path)).parse(UploadedImage(b"other"))
+
+
+def test_router_falls_back_on_low_confidence_and_scores_accuracy():
+    local = StubBackend("local", {"AAPL": {"value": 100.0}}, confidence=0.5)
+    cloud = StubBackend("openai", SLICES)
+    router = BackendRouter([local, cloud], min_confidence=0.8)
+
+    result = router.parse(UploadedImage(b"x"))
+
+    assert result["backend"] == "openai"
+    metrics = router.metrics()
+    assert metrics["local"]["fallbacks"] == 1
+    assert metrics["local"]["accuracy"] == 0.5
+    assert metrics["openai"]["calls"] == 1
+    assert metrics["openai"]["accuracy"] is None
+
+
+def test_router_accepts_confident_local_result():
+    local = StubBackend("local", SLICES, confidence=0.9)
+    cloud = StubBackend("openai", SLICES)
+
+    result = BackendRouter([local, cloud]).parse(UploadedImage(b"x"))
+
+    assert result["backend"] == "local"
+    assert cloud.calls == 0
+
+
+def test_router_falls_back_on_errors_and_raises_when_all_fail():
+    broken = StubBackend("local", error=BackendUnavailable("no tesseract"))
+    cloud = StubBackend("openai", SLICES)
+
+    assert BackendRouter([broken, cloud]).parse(UploadedImage(b"x"))["slices"] == SLICES
+    with pytest.raises(BackendUnavailable):
+        BackendRouter([broken]).parse(UploadedImage(b"x"))
+
+
+def test_router_returns_low_confidence_result_if_fallback_fails():
+    local = StubBackend("local", SLICES, confidence=0.3)
+    cloud = StubBackend("openai", error=RuntimeError("offline"))
+
+    result = BackendRouter([local, cloud]).parse(UploadedImage(b"x"))
+
+    assert result["backend"] == "local"
+
+
+def test_router_parse_async_falls_back_to_the_async_openai_parse():
+    local = StubBackend("local", {"AAPL": {"value": 100.0}}, confidence=0.5)
+
+    async def parse_async(upload, client):
+        return SLICES
+
+    cloud = OpenAIBackend(lambda upload, **context: {}, parse_async)
+    router = BackendRouter([local, cloud], min_confidence=0.8)
+
+    result = asyncio.run(router.parse_async(UploadedImage(b"x"), client=None))
+
+    assert result == {"slices": SLICES, "confidence": 1.0, "backend": "openai"}
+    assert router.metrics()["local"]["accuracy"] == 0.5
+
+
+def test_router_metrics_are_safe_to_share_between_threads():
+    router = BackendRouter([StubBackend("openai", SLICES)])
+
+    def session():
+        for _ in range(500):
+            router.parse(UploadedImage(b"x"))
+
+    threads = [threading.Thread(target=session) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert router.metrics()["openai"]["calls"] == 4000
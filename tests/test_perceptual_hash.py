@@ -0,0 +1,78 @@
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from scripts.perceptual_hash import (
+    HammingIndex,
+    dhash,
+    hamming,
+    region_changed,
+    value_region,
+)
+
+
+def test_dhash_tolerates_status_bar_changes(screenshot):
+    assert hamming(dhash(screenshot()), dhash(screenshot(clock="10:02"))) <= 2
+
+
+def test_value_region_detects_changed_amounts(screenshot):
+    base = value_region(screenshot())
+
+    assert not region_changed(base, value_region(screenshot(clock="10:02")))
+    assert region_changed(base, value_region(screenshot(amount="$9,876.10")))
+    assert region_changed(base, value_region(screenshot(amount="$1,234.58")))
+    assert region_changed(base, value_region(screenshot(amount="$1,234.57")))
+
+
+@pytest.mark.parametrize("digit", "01234789")
+def test_value_region_detects_one_digit_in_small_text(screenshot, digit):
+    base = value_region(screenshot(font_size=10))
+    changed = screenshot(amount=f"$1,234.5{digit}", font_size=10)
+
+    assert region_changed(base, value_region(changed))
+
+
+def test_value_region_ignores_recompression(screenshot):
+    image = screenshot()
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+
+    assert not region_changed(value_region(image), value_region(Image.open(buffer)))
+
+
+def test_hamming_index_matches_brute_force():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(3000)]
+    index = HammingIndex(max_distance=20)
+    for i, key in enumerate(hashes):
+        index.add(key, i)
+    query = hashes[42] ^ 0b1011
+
+    expected = sorted(
+        (hamming(query, key), i)
+        for i, key in enumerate(hashes)
+        if hamming(query, key) <= 20
+    )
+
+    assert len(index) == 3000
+    assert sorted(index.search(query)) == expected
+    assert index.search(query, 3) == [(3, 42)]
+    assert HammingIndex().search(query) == []
+
+
+def test_hamming_index_rejects_radius_beyond_limit():
+    with pytest.raises(ValueError):
+        HammingIndex(max_distance=6).search(0, 7)
+
+
+def test_hamming_index_remove():
+    index = HammingIndex()
+    index.add(0b1111, "a")
+    index.add(0b1111, "b")
+
+    assert index.remove(0b1111, "a")
+    assert not index.remove(0b1111, "a")
+    assert len(index) == 1
+    assert index.search(0b1111) == [(0, "b")]
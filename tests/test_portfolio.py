@@ -1,10 +1,15 @@
+from copy import deepcopy
 from decimal import ROUND_HALF_UP, Decimal
 
 import pytest
 import streamlit as st
 
 from scripts.portfolio import (
+    PortfolioTree,
+    flush_portfolio_changes,
+    get_aggrid_portfolio_rows,
     make_example_portfolio,
+    normalize_paths,
     normalize_portfolio,
     update_children,
 )
@@ -19,6 +24,7 @@ def init_streamlit_session(monkeypatch):
         "portfolio",
         {"name": "test", "type": "pie", "value": 0, "children": {}},
     )
+    monkeypatch.delitem(st.session_state, "dirty_paths", raising=False)
 
 
 @pytest.fixture
@@ -69,7 +75,10 @@ def test_update_children_merges_correctly():
 
 
 def test_update_children_overwrites_existing():
-    """Check that update_children replaces an existing child's value and strips weight."""
+    """
+    Check that update_children replaces an existing child's value and strips
+    weight.
+    """
     base = {
         "name": "x",
         "type": "pie",
@@ -83,7 +92,10 @@ def test_update_children_overwrites_existing():
 
 
 def test_update_children_accepts_parsed_image_data(base_portfolio):
-    """Ensure update_children correctly converts parsed slice input into portfolio structure."""
+    """
+    Ensure update_children correctly converts parsed slice input into
+    portfolio structure.
+    """
     parsed = {
         "FRB23Q1": {"type": "pie", "value": 1845.07},
         "RB21Q4": {"type": "pie", "value": 886.61},
@@ -99,3 +111,138 @@ def test_make_example_portfolio_sets_expected_data():
     assert st.session_state["active_portfolio_name"] == "example"
     saved = st.session_state["account"]["portfolios"]["example"]
     assert saved == EXAMPLE_PORTFOLIO
+
+
+def test_portfolio_tree_round_trip_is_lossless():
+    """Converting to a PortfolioTree and back must reproduce the dict exactly."""
+    tree = PortfolioTree.from_dict(EXAMPLE_PORTFOLIO)
+    assert len(tree) == 17
+    assert tree.names[0] == "Roshar"
+    assert tree.to_dict() == EXAMPLE_PORTFOLIO
+
+
+def test_portfolio_tree_rounds_computed_values_to_micro_dollars():
+    """Leaves keep their exact input; rolled-up pie values are micro-dollars."""
+    portfolio = {
+        "name": "p",
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "A": {"type": "ticker", "value": Decimal("0.1234567")},
+            "B": {"type": "ticker", "value": Decimal("0.0000005")},
+        },
+    }
+    result = PortfolioTree.from_dict(portfolio).rollup().to_dict()
+    assert result["children"]["A"]["value"] == Decimal("0.1234567")
+    assert result["children"]["B"]["value"] == Decimal("0.0000005")
+    assert result["value"] == Decimal("0.123458")
+
+
+def test_portfolio_tree_rejects_unknown_node_type():
+    """An unknown type names the node's path instead of a bare index error."""
+    portfolio = deepcopy(EXAMPLE_PORTFOLIO)
+    pie = next(c for c in portfolio["children"].values() if c["type"] == "pie")
+    name, child = next(iter(pie["children"].items()))
+    child["type"] = "bond"
+    pie_name = next(k for k, v in portfolio["children"].items() if v is pie)
+    with pytest.raises(ValueError, match=f"'bond' at '{pie_name}/{name}'"):
+        PortfolioTree.from_dict(portfolio)
+
+
+def test_portfolio_tree_levels_follow_parents():
+    """Every node sits one level below its parent, root alone at level 0."""
+    tree = PortfolioTree.from_dict(EXAMPLE_PORTFOLIO)
+    assert list(tree.levels[0]) == [0]
+    assert all(tree.depth[i] == tree.depth[tree.parent[i]] + 1 for i in range(1, 17))
+
+
+def test_normalize_portfolio_nested_rollup():
+    """Pie values roll up from leaves and weights are set at every level."""
+    portfolio = {
+        "name": "root",
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "P": {
+                "type": "pie",
+                "value": 999,
+                "children": {
+                    "X": {"type": "ticker", "value": Decimal("10.25")},
+                    "Y": {"type": "ticker", "value": Decimal("30.75")},
+                },
+            },
+            "Z": {"type": "ticker", "value": 59},
+            "EMPTY": {"type": "pie", "value": 0},
+        },
+    }
+    result = normalize_portfolio(portfolio)
+    assert result is portfolio
+    assert result["value"] == Decimal("100")
+    assert result["children"]["P"]["value"] == Decimal("41")
+    assert result["children"]["P"]["weight"] == Decimal("0.41")
+    assert result["children"]["P"]["children"]["X"]["weight"] == Decimal("0.25")
+    assert result["children"]["EMPTY"]["children"] == {}
+    assert result["children"]["EMPTY"]["weight"] == Decimal("0")
+
+
+def test_normalized_weights_are_exact_decimals():
+    """Weights are Decimal ratios of the values, without float noise."""
+    portfolio = {
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "A": {"type": "ticker", "value": Decimal("1")},
+            "B": {"type": "ticker", "value": Decimal("2")},
+        },
+    }
+    result = normalize_portfolio(portfolio)
+    assert result["children"]["A"]["weight"] == Decimal(1) / Decimal(3)
+    assert result["children"]["B"]["weight"] == Decimal(2) / Decimal(3)
+
+
+def test_leaf_factors_multiply_down_the_path():
+    """Leaf factors are each ticker's share of the whole portfolio."""
+    tree = PortfolioTree.from_dict(EXAMPLE_PORTFOLIO).normalize()
+    factors = tree.leaf_factors()
+    leaves = tree.leaf_indices()
+    assert factors[leaves].sum() == pytest.approx(1.0)
+    tsla = tree.names.index("TSLA")
+    assert factors[tsla] == pytest.approx(950.0 / 3013.26)
+
+
+def test_get_aggrid_portfolio_rows_paths_and_weights():
+    """Rows are emitted in tree order with full paths and sibling weights."""
+    rows = get_aggrid_portfolio_rows(EXAMPLE_PORTFOLIO)
+    assert len(rows) == 16
+    assert rows[0]["path"] == ["Kholinar"]
+    assert rows[1]["path"] == ["Kholinar", "TSLA"]
+    windrunners = next(r for r in rows if r["name"] == "Windrunners")
+    assert windrunners["path"] == ["Urithiru", "Windrunners"]
+    assert windrunners["weight"] == pytest.approx(374.34 / 874.34 * 100)
+
+
+def test_normalize_paths_matches_full_normalize():
+    """Re-normalizing an edited path gives the same result as a full pass."""
+    incremental = normalize_portfolio(deepcopy(EXAMPLE_PORTFOLIO))
+    windrunners = incremental["children"]["Urithiru"]["children"]["Windrunners"]
+    windrunners["children"]["MSFT"]["value"] = Decimal("250.5")
+    windrunners["children"]["NEW"] = {"type": "pie", "value": Decimal("10")}
+
+    full = normalize_portfolio(deepcopy(incremental))
+    normalize_paths(incremental, [("Urithiru", "Windrunners")])
+
+    assert incremental == full
+    assert incremental["children"]["Urithiru"]["value"] == Decimal("934.84")
+
+
+def test_flush_portfolio_changes_only_when_dirty():
+    """Flushing without dirty paths leaves the portfolio untouched."""
+    portfolio = deepcopy(EXAMPLE_PORTFOLIO)
+    flush_portfolio_changes(portfolio)
+    assert portfolio == EXAMPLE_PORTFOLIO
+
+    update_children(portfolio, {"X": {"type": "ticker", "value": 10}})
+    assert st.session_state["dirty_paths"] == {()}
+    flush_portfolio_changes(portfolio)
+    assert "dirty_paths" not in st.session_state
+    assert portfolio["children"]["X"]["weight"] > 0
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from scripts.simulation import simulate_dca_schedule
+
+
+@pytest.fixture
+def portfolio():
+    """Nested pie with target weights that differ from current weights."""
+    return {
+        "name": "main",
+        "type": "pie",
+        "value": 0,
+        "children": {
+            "TECH": {
+                "type": "pie",
+                "value": 0,
+                "target_weight": 50,
+                "children": {
+                    "AAPL": {"type": "ticker", "value": 100, "target_weight": 50},
+                    "MSFT": {"type": "ticker", "value": 100, "target_weight": 50},
+                },
+            },
+            "GOOGL": {"type": "ticker", "value": 200, "target_weight": 50},
+        },
+    }
+
+
+def test_simulation_without_volatility_is_deterministic(portfolio):
+    """With zero volatility and return every path ends at value + deposits."""
+    result = simulate_dca_schedule(
+        portfolio,
+        Decimal("100"),
+        months=6,
+        n_paths=10,
+        annual_return=0.0,
+        annual_volatility=0.0,
+        seed=1,
+    )
+    assert result["ending_values"] == pytest.approx(np.full(10, 1000.0))
+    assert result["ending_summary"]["p50"] == pytest.approx(1000.0)
+    assert result["pie_drift"]["main"]["mean"] == pytest.approx(0.0)
+    assert result["pie_drift"]["TECH"]["mean"] == pytest.approx(0.0)
+
+
+def test_simulation_is_reproducible_across_worker_counts(portfolio):
+    """A seed gives identical results in-process and on a process pool."""
+    kwargs = dict(months=12, n_paths=600, seed=42)
+    inline = simulate_dca_schedule(portfolio, Decimal("50"), workers=1, **kwargs)
+    pooled = simulate_dca_schedule(portfolio, Decimal("50"), workers=2, **kwargs)
+
+    np.testing.assert_array_equal(inline["ending_values"], pooled["ending_values"])
+    assert inline["pie_drift"] == pooled["pie_drift"]
+    assert inline["pie_drift"]["main"]["p95"] > 0
+
+
+@pytest.mark.parametrize("n_paths", [0, -5])
+def test_simulation_rejects_empty_path_count(portfolio, n_paths):
+    with pytest.raises(ValueError, match="n_paths"):
+        simulate_dca_schedule(portfolio, Decimal("100"), n_paths=n_paths)
@@ -0,0 +1,49 @@
+import json
+
+from scripts.slice_stream import SliceStreamParser
+
+RESPONSE = (
+    "```json\n"
+    + json.dumps(
+        {
+            "AAPL": {"type": "ticker", "value": 101.5},
+            'Tech "Growth" {pie}': {"type": "pie", "value": 250},
+            "VTI": {"type": "ticker", "value": 3.25},
+        },
+        indent=2,
+    )
+    + "\n```"
+)
+
+
+def _feed_all(parser, chunks):
+    return [entry for chunk in chunks for entry in parser.feed(chunk)]
+
+
+def test_yields_entries_as_they_close():
+    parser = SliceStreamParser()
+    closing = RESPONSE.index("}") + 1
+
+    assert parser.feed(RESPONSE[: closing - 1]) == []
+    assert parser.feed(RESPONSE[closing - 1 : closing]) == [
+        ("AAPL", {"type": "ticker", "value": 101.5})
+    ]
+
+
+def test_any_chunking_gives_the_full_object():
+    body = RESPONSE[RESPONSE.index("{") : RESPONSE.rindex("}") + 1]
+    expected = list(json.loads(body).items())
+
+    for size in (1, 2, 7, 64, len(RESPONSE)):
+        parser = SliceStreamParser()
+        chunks = [RESPONSE[i : i + size] for i in range(0, len(RESPONSE), size)]
+        assert _feed_all(parser, chunks) == expected
+        assert parser.text == RESPONSE
+
+
+def test_malformed_entry_is_skipped():
+    parser = SliceStreamParser()
+
+    assert parser.feed('{"A": {"value": 1,}, "B": {"value": 2}}') == [
+        ("B", {"value": 2})
+    ]
@@ -0,0 +1,44 @@
+import hashlib
+from io import BytesIO
+
+from PIL import Image
+
+from scripts import uploaded_image
+from scripts.image_preprocess import preprocess_image
+from scripts.uploaded_image import UploadedImage
+
+
+def _png_bytes():
+    buffer = BytesIO()
+    Image.new("RGB", (30, 20), "navy").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_wrap_reads_once_and_passes_wrappers_through(tmp_path):
+    data = _png_bytes()
+    path = tmp_path / "shot.png"
+    path.write_bytes(data)
+
+    upload = UploadedImage.wrap(BytesIO(data))
+
+    assert upload.data == data
+    assert UploadedImage.wrap(upload) is upload
+    assert UploadedImage.wrap(str(path)).data == data
+
+
+def test_sha256_is_chunked_and_matches_hashlib(monkeypatch):
+    monkeypatch.setattr(uploaded_image, "HASH_CHUNK_BYTES", 7)
+    data = _png_bytes()
+
+    assert UploadedImage(data).sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_image_is_decoded_once(mocker):
+    upload = UploadedImage(_png_bytes())
+    decode = mocker.spy(uploaded_image.Image, "open")
+
+    preprocess_image(upload)
+    preprocess_image(upload)
+
+    assert upload.image.size == (30, 20)
+    assert decode.call_count == 1